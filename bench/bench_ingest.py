@@ -0,0 +1,159 @@
+"""/upload CSV ingestion: peak memory, and how soon the first rows can be published.
+
+Usage: python bench/bench_ingest.py [--mbps 50] [rows ...]
+
+Modes:
+  whole     the old path: read the whole upload, decode it, parse it
+  spooled   starlette's multipart parser spools the body (what File(...) does),
+            then iter_upload_rows parses the spooled file in chunks
+  streamed  StreamedUpload parses the body as it arrives (the /upload path)
+
+The multipart body is sent at --mbps MB/s to model the client's upload
+bandwidth. "first rows" is the time from the first body byte until rows are
+ready to publish. Each run happens in a fresh subprocess so ru_maxrss
+reflects only that run.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "producer"))
+
+from ingest import StreamedUpload, iter_upload_rows  # noqa: E402
+from starlette.datastructures import Headers  # noqa: E402
+from starlette.formparsers import MultiPartParser  # noqa: E402
+
+BOUNDARY = "bench-ingest-boundary"
+CHUNK = 64 * 1024
+
+
+class FileUpload:
+    """Minimal stand-in for starlette's UploadFile (async chunked read)."""
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+
+    async def read(self, size=-1):
+        return self._f.read(size)
+
+
+class PacedRequest:
+    """A multipart/form-data request whose body arrives at `mbps` MB/s."""
+
+    def __init__(self, path, mbps):
+        self.path = path
+        self.mbps = mbps
+        self.headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+    async def stream(self):
+        started = time.perf_counter()
+        sent = 0
+        head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"data.csv\"\r\n"
+                f"Content-Type: text/csv\r\n\r\n").encode()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK), b""):
+                chunk = head + chunk
+                head = b""
+                sent += len(chunk)
+                # Sleep until the link would have delivered this much
+                await asyncio.sleep(max(0.0, sent / (self.mbps * 1e6) - (time.perf_counter() - started)))
+                yield chunk
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def write_csv(path, rows):
+    items = ["Widget", "Gadget", "Thingamajig", "Doohickey", "Contraption"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Item Description", "Quantity", "Amount"])
+        for i in range(rows):
+            # Every 100th row carries a quoted newline to exercise straddling records
+            item = "Multi\nline" if i % 100 == 0 else random.choice(items)
+            writer.writerow(["2024-01-01", item, random.randint(1, 100), round(random.uniform(10, 1000), 2)])
+
+
+async def run_whole(path, mbps):
+    content = await FileUpload(path).read()
+    decoded_content = content.decode("utf-8")
+    csv_reader = csv.reader(io.StringIO(decoded_content))
+    next(csv_reader, None)
+    count = 0
+    for row in csv_reader:
+        ",".join(row)
+        count += 1
+    return count, None
+
+
+async def consume(file):
+    """Parse all rows; returns (count, seconds until the first rows were ready)."""
+    started = time.perf_counter()
+    count, first = 0, None
+    async for rows in iter_upload_rows(file):
+        if first is None:
+            first = time.perf_counter() - started
+        for row in rows:
+            ",".join(row)
+            count += 1
+    return count, first
+
+
+async def run_spooled(path, mbps):
+    request = PacedRequest(path, mbps)
+    started = time.perf_counter()
+    form = await MultiPartParser(request.headers, request.stream()).parse()
+    spooled = time.perf_counter() - started
+    count, first = await consume(form["file"])
+    return count, spooled + first
+
+
+async def run_streamed(path, mbps):
+    file = StreamedUpload(PacedRequest(path, mbps))
+    await file.open()
+    return await consume(file)
+
+
+RUNNERS = {"whole": run_whole, "spooled": run_spooled, "streamed": run_streamed}
+
+
+def child(mode, path, mbps):
+    start = time.perf_counter()
+    count, first = asyncio.run(RUNNERS[mode](path, mbps))
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{count} {elapsed:.3f} {-1 if first is None else round(first, 3)} {peak_kb}")
+
+
+def main(sizes, mbps):
+    print(f"{'rows':>10} {'file MB':>8} {'mode':>10} {'peak RSS MB':>12} {'first rows s':>13} {'seconds':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"data_{rows}.csv")
+            write_csv(path, rows)
+            size_mb = os.path.getsize(path) / 1e6
+            for mode in RUNNERS:
+                out = subprocess.check_output(
+                    [sys.executable, __file__, "--child", mode, path, str(mbps)], text=True)
+                count, elapsed, first, peak_kb = out.split()
+                assert int(count) == rows, (mode, count, rows)
+                first = "-" if float(first) < 0 else f"{float(first):.3f}"
+                print(f"{rows:>10} {size_mb:>8.1f} {mode:>10} {int(peak_kb) / 1024:>12.1f} {first:>13} "
+                      f"{float(elapsed):>8.2f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+    else:
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument("rows", type=int, nargs="*", default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--mbps", type=float, default=50, help="upload bandwidth, MB/s")
+        args = parser.parse_args()
+        main(args.rows, args.mbps)
@@ -0,0 +1,104 @@
+"""Report ingest in the scaler: the old unsynchronized dicts vs. MetricsStore.
+
+Usage: python bench/bench_metrics_store.py [threads] [reports_per_thread] [jobs]
+
+Each thread applies what one /report does to the metrics (two counter
+increments and a per-job update) while a reader thread takes snapshots the
+way the scaler loop and /stats do. Reports are spread over `jobs` job
+names, more than the table keeps, so eviction is exercised too. Prints
+reports/s and how many increments were lost.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scaler"))
+
+from metrics_store import MetricsStore  # noqa: E402
+
+
+def legacy_store():
+    metrics = {"total_consumed": 0, "messages_consumed": 0}
+    job_processed_counts = {}
+
+    def record(job_name, processed, messages):
+        # The pre-MetricsStore record_progress body
+        metrics["total_consumed"] += processed
+        metrics["messages_consumed"] += messages
+        if job_name in job_processed_counts:
+            job_processed_counts[job_name] += processed
+        else:
+            job_processed_counts[job_name] = processed
+
+    def snapshot():
+        return dict(metrics), len(job_processed_counts)
+
+    return record, snapshot, lambda: metrics["total_consumed"], lambda: len(job_processed_counts)
+
+
+def sharded_store(max_jobs):
+    metrics = MetricsStore(counters=["total_consumed", "messages_consumed"], gauges={"queue_depth": 0},
+                           max_jobs=max_jobs)
+
+    def record(job_name, processed, messages):
+        metrics.incr("total_consumed", processed)
+        metrics.incr("messages_consumed", messages)
+        metrics.jobs.add(job_name, processed, messages)
+
+    def snapshot():
+        return metrics.snapshot(), len(metrics.jobs)
+
+    return record, snapshot, lambda: metrics["total_consumed"], lambda: len(metrics.jobs)
+
+
+def run(store, threads, per_thread, jobs):
+    record, snapshot, total, table_size = store
+    names = [f"worker-job-{i:06d}" for i in range(jobs)]
+    stop = threading.Event()
+    snapshots = [0]
+
+    def reader():
+        while not stop.is_set():
+            snapshot()
+            snapshots[0] += 1
+            time.sleep(0.001)
+
+    def writer(offset):
+        for i in range(per_thread):
+            record(names[(offset + i) % jobs], 1, 1)
+
+    reader_thread = threading.Thread(target=reader)
+    writers = [threading.Thread(target=writer, args=(t * 7919,)) for t in range(threads)]
+    reader_thread.start()
+    start = time.perf_counter()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader_thread.join()
+    expected = threads * per_thread
+    return {
+        "reports_per_s": round(expected / elapsed),
+        "lost": expected - total(),
+        "job_rows": table_size(),
+        "snapshots": snapshots[0],
+    }
+
+
+def main(threads, per_thread, jobs):
+    # Make thread switches frequent, like a busy uvicorn threadpool
+    sys.setswitchinterval(1e-6)
+    print(f"{threads} threads x {per_thread} reports over {jobs} job names")
+    print(f"{'store':<10} {'reports/s':>10} {'lost':>8} {'job rows':>9} {'snapshots':>10}")
+    for name, store in [("legacy", legacy_store()), ("sharded", sharded_store(max_jobs=1000))]:
+        result = run(store, threads, per_thread, jobs)
+        print(f"{name:<10} {result['reports_per_s']:>10} {result['lost']:>8} {result['job_rows']:>9} "
+              f"{result['snapshots']:>10}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [8, 50000, 5000][len(args):]))
@@ -0,0 +1,140 @@
+"""Broker throughput with a queue split into N shards, against a real RabbitMQ.
+
+Usage:
+    docker run -d --name bench-rabbit -p 5672:5672 rabbitmq:3
+    python bench/bench_partitions.py                        # 1, 2, 4 and 8 shards
+    python bench/bench_partitions.py --partitions 1 4 --messages 500000 --consumers 8
+    python bench/bench_partitions.py --json results.json
+
+For each shard count, --producers processes publish --messages persistent
+messages round-robin over the shards "<queue>.0" .. "<queue>.<n-1>" (the
+producer's QUEUE_PARTITIONS layout) while --consumers processes consume them
+the way workers do: shards assigned round-robin, one channel-wide prefetch,
+multiple acks. Every client is its own process, so the broker, not the GIL,
+is what saturates. Publish rate is measured to the last publish, end-to-end
+rate to the last ack. The shard queues are deleted afterwards.
+"""
+import argparse
+import json
+import multiprocessing
+import time
+
+import pika
+
+QUEUE = "bench_partitions"
+ACK_EVERY = 50  # deliveries acked together with multiple=True
+
+
+def shard_names(partitions):
+    return [f"{QUEUE}.{i}" for i in range(partitions)] if partitions > 1 else [QUEUE]
+
+
+def publish(host, queues, count, size, offset):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    body = b"x" * size
+    properties = pika.BasicProperties(delivery_mode=2)
+    for i in range(count):
+        channel.basic_publish("", queues[(offset + i) % len(queues)], body, properties)
+    connection.close()
+
+
+def consume(host, queues, prefetch, consumed, total):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    channel.basic_qos(prefetch_count=prefetch, global_qos=True)
+    pending = []
+
+    def on_message(ch, method, properties, body):
+        pending.append(method.delivery_tag)
+        if len(pending) >= ACK_EVERY:
+            ch.basic_ack(pending[-1], multiple=True)
+            with consumed.get_lock():
+                consumed.value += len(pending)
+            pending.clear()
+
+    for queue in queues:
+        channel.basic_consume(queue=queue, on_message_callback=on_message)
+    while consumed.value < total:
+        connection.process_data_events(time_limit=0.1)
+        if pending:
+            # Tail of a shard: don't hold the last few deliveries back
+            channel.basic_ack(pending[-1], multiple=True)
+            with consumed.get_lock():
+                consumed.value += len(pending)
+            pending.clear()
+    connection.close()
+
+
+def run(host, partitions, messages, producers, consumers, size, prefetch):
+    queues = shard_names(partitions)
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    for queue in queues:
+        channel.queue_declare(queue=queue, durable=True)
+        channel.queue_purge(queue)
+
+    consumed = multiprocessing.Value("q", 0)
+    # Consumer c takes every shard i with i % consumers == c, or shard c % n when there are more consumers
+    assignments = [
+        [q for i, q in enumerate(queues) if i % consumers == c] or [queues[c % len(queues)]]
+        for c in range(consumers)
+    ]
+    readers = [
+        multiprocessing.Process(target=consume, args=(host, assigned, prefetch, consumed, messages))
+        for assigned in assignments
+    ]
+    per_producer = [messages // producers + (1 if p < messages % producers else 0) for p in range(producers)]
+    writers = [
+        multiprocessing.Process(target=publish, args=(host, queues, count, size, p))
+        for p, count in enumerate(per_producer)
+    ]
+    for reader in readers:
+        reader.start()
+    started = time.perf_counter()
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    published = time.perf_counter() - started
+    for reader in readers:
+        reader.join()
+    drained = time.perf_counter() - started
+
+    for queue in queues:
+        channel.queue_delete(queue)
+    connection.close()
+    return {
+        "partitions": partitions,
+        "messages": messages,
+        "publish_per_s": round(messages / published),
+        "end_to_end_per_s": round(messages / drained),
+        "seconds": round(drained, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--consumers", type=int, default=8)
+    parser.add_argument("--size", type=int, default=64, help="message body bytes (about one CSV row)")
+    parser.add_argument("--prefetch", type=int, default=200)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'SHARDS':>6} {'PUBLISH/S':>10} {'END-TO-END/S':>13} {'SECONDS':>8}")
+    for partitions in args.partitions:
+        result = run(args.host, partitions, args.messages, args.producers, args.consumers, args.size, args.prefetch)
+        results.append(result)
+        print(f"{partitions:>6} {result['publish_per_s']:>10} {result['end_to_end_per_s']:>13} {result['seconds']:>8}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
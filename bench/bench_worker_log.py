@@ -0,0 +1,83 @@
+"""Per-message logging overhead in the worker: old open/append/close per
+event vs. the buffered EventLog writer.
+
+Usage: python bench/bench_worker_log.py [messages]
+
+stdout is redirected to /dev/null for both variants so only the logging
+path itself is timed.
+"""
+import datetime
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worker"))
+
+from eventlog import DEBUG, EventLog  # noqa: E402
+
+
+def legacy_log_event(path, event_type, details):
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "worker_id": socket.gethostname(),
+        "event": event_type,
+        "details": details
+    }
+    log_line = json.dumps(entry)
+    print(log_line)
+    with open(path, "a") as f:
+        f.write(log_line + "\n")
+
+
+def run_legacy(path, messages):
+    start = time.perf_counter()
+    for i in range(messages):
+        details = {"message": "2024-01-01,Widget,1,10.0", "rows": 1, "delivery_tag": i}
+        legacy_log_event(path, "START_PROCESSING", details)
+        legacy_log_event(path, "END_PROCESSING", details)
+    return time.perf_counter() - start
+
+
+def run_buffered(path, messages, **kwargs):
+    log = EventLog(path, socket.gethostname(), **kwargs)
+    start = time.perf_counter()
+    for i in range(messages):
+        details = {"message": "2024-01-01,Widget,1,10.0", "rows": 1, "delivery_tag": i}
+        log.log("START_PROCESSING", details, DEBUG)
+        log.log("END_PROCESSING", details, DEBUG)
+    caller = time.perf_counter() - start
+    log.close()
+    return caller, time.perf_counter() - start, log.stats()
+
+
+def main(messages):
+    real_stdout = sys.stdout
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            legacy = run_legacy(os.path.join(tmp, "legacy.log"), messages)
+            results.append(("open/append/close", legacy, legacy, None))
+            for label, kwargs in [
+                ("EventLog", {}),
+                ("EventLog sample=0.01", {"sample_rate": 0.01}),
+                ("EventLog level=INFO", {"level": "INFO"}),
+            ]:
+                caller, total, stats = run_buffered(os.path.join(tmp, label.replace(" ", "_") + ".log"), messages, **kwargs)
+                results.append((label, caller, total, stats))
+        finally:
+            sys.stdout = real_stdout
+
+    print(f"{messages} messages, 2 events each")
+    print(f"{'variant':>22} {'us/msg (caller)':>16} {'total s':>8} {'write calls':>12} {'dropped':>8}")
+    for label, caller, total, stats in results:
+        calls = stats["write_calls"] if stats else messages * 2
+        dropped = stats["dropped"] if stats else 0
+        print(f"{label:>22} {caller / messages * 1e6:>16.2f} {total:>8.3f} {calls:>12} {dropped:>8}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
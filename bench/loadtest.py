@@ -0,0 +1,326 @@
+"""End-to-end load test: producer, broker and workers on this machine, with per-stage latency.
+
+Usage:
+    python bench/loadtest.py                                      # RabbitMQ in Docker, 100k rows, 4 workers
+    python bench/loadtest.py --rabbitmq localhost --rows 1000000 --workers 8 --batch-rows 50
+    python bench/loadtest.py --out results/after.json --compare results/before.json
+    python bench/loadtest.py --compare results/before.json results/after.json   # compare only, no run
+
+Unless --rabbitmq names a running broker, a rabbitmq:3-management container
+is started (ports 5672 and 15672) and removed afterwards. The producer runs
+under uvicorn and --workers worker processes run worker.py, both unchanged.
+The scaler's /report/bulk endpoint is stood in for by an in-process HTTP
+server that feeds scaler/traces.py's TraceStore, so no Kubernetes is needed
+and the worker count stays fixed. Rows come from data/generate_data.py,
+streamed to /upload; every message is traced (TRACE_SAMPLE_RATE=1).
+
+The result has per-stage latency percentiles (upload -> publish -> broker
+-> worker -> handler -> report), upload and end-to-end throughput, and the
+publisher's confirm latency. It is saved as JSON with a flat `metrics` map;
+--compare prints every metric next to an earlier result's and exits with 1
+if one got worse by more than --tolerance.
+"""
+import argparse
+import datetime
+import http.server
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pika
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "scaler"))
+sys.path.insert(0, os.path.join(ROOT, "producer"))
+sys.path.insert(0, os.path.join(ROOT, "data"))
+
+from generate_data import upload_data  # noqa: E402
+from partitions import PartitionedQueue  # noqa: E402
+from traces import TraceStore  # noqa: E402
+
+CONTAINER = "kube-job-loadtest-rabbitmq"
+QUEUE = "task_queue"
+
+
+class ReportSink:
+    """Stand-in for the scaler's /report/bulk: counts progress and keeps the traces."""
+
+    def __init__(self, trace_samples):
+        self.traces = TraceStore(trace_samples)
+        self.rows = 0
+        self.messages = 0
+        self.last_report_at = None
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                now = time.time()
+                with sink._lock:
+                    for report in payload.get("reports", []):
+                        sink.rows += report["processed"]
+                        sink.messages += report.get("messages", report["processed"])
+                    if payload.get("reports"):
+                        sink.last_report_at = now
+                sink.traces.add(payload.get("traces", []), now)
+                body = json.dumps({"status": "ok"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="report-sink", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, timeout, what):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def start_broker():
+    if shutil.which("docker") is None:
+        sys.exit("docker not found: start RabbitMQ (with the management plugin) and pass --rabbitmq HOST")
+    subprocess.run(["docker", "rm", "-f", CONTAINER], capture_output=True)
+    subprocess.run(
+        ["docker", "run", "-d", "--rm", "--name", CONTAINER, "-p", "5672:5672", "-p", "15672:15672",
+         "rabbitmq:3-management"],
+        check=True, capture_output=True,
+    )
+    print("Started RabbitMQ container, waiting for it...")
+    wait_for(lambda: requests.get("http://127.0.0.1:15672/api/overview", auth=("guest", "guest"), timeout=2).ok,
+             120, "RabbitMQ")
+    return "127.0.0.1"
+
+
+def purge(host, layout):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    for queue in layout.queues:
+        channel.queue_declare(queue=queue, durable=True)
+        channel.queue_purge(queue)
+    connection.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    processes = []
+    host = args.rabbitmq or start_broker()
+    sink = ReportSink(trace_samples=args.rows)
+    try:
+        layout = PartitionedQueue(QUEUE, args.partitions, priority_lane=False)
+        purge(host, layout)
+        env = {
+            **os.environ,
+            "RABBITMQ_HOST": host,
+            "QUEUE_PARTITIONS": str(args.partitions),
+            "PYTHONUNBUFFERED": "1",
+        }
+
+        port = free_port()
+        producer_log = open(os.path.join(workdir, "producer.log"), "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.join(ROOT, "producer"), env={**env, "SPOOL_DIR": os.path.join(workdir, "spool")},
+            stdout=producer_log, stderr=subprocess.STDOUT,
+        ))
+        producer_url = f"http://127.0.0.1:{port}"
+        wait_for(lambda: requests.get(f"{producer_url}/publisher/stats", timeout=2).json()["connected"], 60,
+                 "the producer")
+
+        for i in range(args.workers):
+            log = open(os.path.join(workdir, f"worker-{i}.log"), "w")
+            processes.append(subprocess.Popen(
+                [sys.executable, "worker.py"],
+                cwd=os.path.join(ROOT, "worker"),
+                env={
+                    **env,
+                    "SCALER_URL": f"http://127.0.0.1:{sink.port}/report",
+                    "JOB_NAME": f"loadtest-worker-{i}",
+                    "PROCESSING_TIME": str(args.processing_time),
+                    "WORKER_CONCURRENCY": str(args.concurrency),
+                    "REPORT_INTERVAL": "0.5",
+                    "TRACE_SAMPLE_RATE": "1",
+                    "TRACE_BUFFER": str(args.rows),
+                    "LOG_LEVEL": "INFO",
+                    "LOG_FILE": os.path.join(workdir, f"worker-{i}.events"),
+                    "METRICS_PORT": "0",
+                },
+                stdout=log, stderr=subprocess.STDOUT,
+            ))
+        print(f"Producer on {producer_url}, {args.workers} workers, logs in {workdir}")
+
+        started = time.time()
+        res = upload_data(
+            f"{producer_url}/upload?batch_rows={args.batch_rows}&compress={str(args.compress).lower()}",
+            args.rows, schema=args.schema, seed=1,
+        )
+        res.raise_for_status()
+        uploaded = time.time()
+
+        deadline = time.monotonic() + args.timeout
+        while sink.rows < args.rows and time.monotonic() < deadline:
+            time.sleep(1)
+            print(f"\r{sink.rows}/{args.rows} rows processed", end="", flush=True)
+        print()
+        if sink.rows < args.rows:
+            print(f"Timed out after {args.timeout}s with {sink.rows}/{args.rows} rows processed")
+        finished = sink.last_report_at or time.time()
+        publisher = requests.get(f"{producer_url}/publisher/stats", timeout=2).json()
+    finally:
+        for process in reversed(processes):
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        sink.close()
+        if not args.rabbitmq:
+            subprocess.run(["docker", "rm", "-f", CONTAINER], capture_output=True)
+        if not args.keep_logs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = sink.traces.summary()
+    metrics = {
+        "rows_processed": sink.rows,
+        "upload_rows_per_s": round(args.rows / (uploaded - started), 1),
+        "end_to_end_rows_per_s": round(sink.rows / (finished - started), 1),
+        "end_to_end_messages_per_s": round(sink.messages / (finished - started), 1),
+        "publish_confirm.p50_ms": publisher["latency_ms"]["p50"],
+        "publish_confirm.p99_ms": publisher["latency_ms"]["p99"],
+    }
+    for stage, values in summary["stages"].items():
+        for key in ("p50_ms", "p90_ms", "p99_ms"):
+            if key in values:
+                metrics[f"{stage}.{key}"] = values[key]
+    return {
+        "version": 1,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "keep_logs")},
+        "metrics": metrics,
+        "stages": summary["stages"],
+        "traces": summary["traces"],
+        "publisher": publisher,
+    }
+
+
+def better(name):
+    """+1 if a higher value of this metric is better, -1 if lower is."""
+    return 1 if name.endswith("_per_s") or name == "rows_processed" else -1
+
+
+def compare(old, new, tolerance):
+    """Print both results' metrics side by side; returns the names that regressed."""
+    # Runs with different settings are not comparable metric by metric
+    old_config, new_config = old.get("config", {}), new.get("config", {})
+    for key in sorted((set(old_config) | set(new_config)) - {"timeout", "tolerance"}):
+        if old_config.get(key) != new_config.get(key):
+            print(f"Warning: {key} differs ({old_config.get(key)} before, {new_config.get(key)} after)")
+    regressions = []
+    print(f"{'METRIC':<32} {'BEFORE':>12} {'AFTER':>12} {'CHANGE':>8}")
+    for name in sorted(set(old["metrics"]) | set(new["metrics"])):
+        before, after = old["metrics"].get(name), new["metrics"].get(name)
+        if before is None or after is None:
+            print(f"{name:<32} {str(before):>12} {str(after):>12}")
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if better(name) * change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32} {before:>12} {after:>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def print_result(result):
+    print(f"{'STAGE':<12} {'COUNT':>8} {'P50 MS':>10} {'P90 MS':>10} {'P99 MS':>10} {'MAX MS':>10}")
+    for stage, values in result["stages"].items():
+        if values["count"]:
+            print(f"{stage:<12} {values['count']:>8} {values['p50_ms']:>10} {values['p90_ms']:>10} "
+                  f"{values['p99_ms']:>10} {values['max_ms']:>10}")
+    m = result["metrics"]
+    print(f"Upload: {m['upload_rows_per_s']} rows/s; end to end: {m['end_to_end_rows_per_s']} rows/s, "
+          f"{m['end_to_end_messages_per_s']} messages/s")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rabbitmq", metavar="HOST", help="use this running broker instead of a container")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--schema", default="sales")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4, help="WORKER_CONCURRENCY per worker")
+    parser.add_argument("--processing-time", type=float, default=0.0, help="simulated seconds per row")
+    parser.add_argument("--batch-rows", type=int, default=1)
+    parser.add_argument("--compress", action="store_true")
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--out", help="result file (default results/loadtest-<time>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT",
+                        help="earlier result to compare against; with two files, compare them without running")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--keep-logs", action="store_true")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        sys.exit(1 if compare(load(args.compare[0]), load(args.compare[1]), args.tolerance) else 0)
+
+    result = run(args)
+    print_result(result)
+    out = args.out or os.path.join("results", f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {out}")
+    if args.compare:
+        print()
+        sys.exit(1 if compare(load(args.compare[0]), result, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""Offline autoscaler simulator.
+
+Runs the scaler's decision logic (scaler/policy.py, through the same
+reconcile() call scaler_loop makes) against in-process fakes of the RabbitMQ
+management API and BatchV1Api on a virtual clock, so scaling policies can be
+compared without a cluster.
+
+The fakes model what matters for scaling: a job counts as active as soon as
+it is created (like Job.status.active, which includes pending pods) but only
+starts consuming after --startup seconds; each worker holds up to
+--concurrency messages and spends --processing-time seconds on each, like
+worker.callback's 2s sleep. A deleted worker stops taking messages and
+finishes the ones it holds, like the worker's SIGTERM drain; whatever is not
+done after DRAIN_TIMEOUT seconds is requeued. Workers report activity to the
+scaler's ActivityTracker, so scale-downs remove idle workers first.
+
+With --mode pool the same decisions drive scaler/pool.py's WarmPool over a
+fake Deployment instead: pods start in --startup seconds as standby, poll
+their assignment every second, and only consume while active; the pool keeps
+--spare standby replicas. Cold start is measured from the capacity request
+(job creation, or the scale-up a pool pod was activated for) to that
+worker's first message.
+
+Usage:
+    python bench/simulate_scaler.py                       # all traces, all policies
+    python bench/simulate_scaler.py --trace burst --policy rate
+    python bench/simulate_scaler.py --mode pool --spare 2  # warm worker pool
+    python bench/simulate_scaler.py --json results.json   # machine-readable results
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scaler"))
+
+from policy import Observation, RatePolicy, ThresholdPolicy, reconcile  # noqa: E402
+from pool import WarmPool  # noqa: E402
+from activity import ActivityTracker  # noqa: E402
+
+DT = 0.25  # simulation step, seconds
+ASSIGNMENT_POLL = 1.0  # worker/assignment.py poll interval
+DRAIN_TIMEOUT = 60.0  # worker DRAIN_TIMEOUT
+
+
+# --- arrival traces: functions of (t) -> messages arriving in [t, t + DT) ---
+
+def trace_upload(rows=10000, rate=1000.0):
+    """One data/generate_data.py file published at `rate` msg/s."""
+    duration = rows / rate
+
+    def arrivals(t):
+        if t >= duration:
+            return 0
+        return int(min(rows, (t + DT) * rate)) - int(t * rate)
+    return arrivals, duration
+
+
+def trace_legacy_upload(rows=10000):
+    """The same file through the old 10 msg/s producer throttle."""
+    return trace_upload(rows, rate=10.0)
+
+
+def trace_bursts(size=3000, gap=300.0, count=3):
+    def arrivals(t):
+        for i in range(count):
+            if i * gap <= t < i * gap + DT:
+                return size
+        return 0
+    return arrivals, gap * (count - 1) + DT
+
+
+def trace_diurnal(peak=40.0, period=1200.0):
+    """Half-sine "day" of arrivals peaking at `peak` msg/s."""
+    state = {"carry": 0.0}
+
+    def arrivals(t):
+        if t >= period:
+            return 0
+        state["carry"] += peak * math.sin(math.pi * t / period) * DT
+        n = int(state["carry"])
+        state["carry"] -= n
+        return n
+    return arrivals, period
+
+
+TRACES = {
+    "upload": trace_upload,
+    "legacy-upload": trace_legacy_upload,
+    "burst": trace_bursts,
+    "diurnal": trace_diurnal,
+}
+
+
+# --- fakes ---
+
+class FakeBroker:
+    """Queue state as served by the management API /api/queues/%2F/<queue>."""
+
+    def __init__(self):
+        self.ready = collections.deque()  # arrival times of ready messages
+        self.unacked = 0
+
+    def publish(self, t, n):
+        self.ready.extend([t] * n)
+
+    def get(self):
+        self.unacked += 1
+        return self.ready.popleft()
+
+    def requeue(self, arrived):
+        self.unacked -= 1
+        self.ready.appendleft(arrived)
+
+    def ack(self):
+        self.unacked -= 1
+
+    def queue_stats(self):
+        return {"messages_ready": len(self.ready), "messages_unacknowledged": self.unacked}
+
+
+class FakeJob:
+    def __init__(self, name, created, ready_at, concurrency):
+        self.name = name
+        self.created = created
+        self.ready_at = ready_at
+        self.terminating = None  # deletion requested; draining
+        self.deleted = None
+        self.slots = [None] * concurrency  # (done_at, arrived) per busy slot
+        self.requested = created  # job creation, or the latest pool activation
+        self.first_message = None  # first message since `requested`
+        self.busy_seconds = 0.0
+        self.deletion_cost = 0
+
+    def as_k8s(self):
+        return types.SimpleNamespace(
+            metadata=types.SimpleNamespace(name=self.name, creation_timestamp=self.created,
+                                           deletion_timestamp=self.terminating),
+            status=types.SimpleNamespace(active=1, succeeded=None, failed=None, start_time=None),
+        )
+
+
+class FakeBatchV1Api:
+    """The subset of BatchV1Api the scaler uses, backed by simulated workers."""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.jobs = {}
+        self.calls = collections.Counter()
+
+    def create_namespaced_job(self, namespace, body):
+        self.calls["create"] += 1
+        name = body["metadata"]["name"]
+        now = self.sim.now
+        self.jobs[name] = FakeJob(name, now, now + self.sim.startup, self.sim.concurrency)
+        return self.jobs[name].as_k8s()
+
+    def list_namespaced_job(self, namespace, label_selector=None):
+        self.calls["list"] += 1
+        return types.SimpleNamespace(items=[j.as_k8s() for j in self.jobs.values() if j.terminating is None])
+
+    def delete_namespaced_job(self, name, namespace, body=None):
+        self.calls["delete"] += 1
+        self.sim.kill(self.jobs[name])
+
+
+class FakeDeploymentApi:
+    """AppsV1Api/CoreV1Api calls made by WarmPool, backed by the same workers.
+
+    Scaling down removes pods like a ReplicaSet does: lowest
+    pod-deletion-cost first, then the newest.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.pods = sim.api.jobs
+        self.calls = collections.Counter()
+
+    def patch_namespaced_deployment_scale(self, name, namespace, body):
+        self.calls["scale"] += 1
+        live = [p for p in self.sim.live_jobs() if p.terminating is None]
+        replicas = body["spec"]["replicas"]
+        for _ in range(replicas - len(live)):
+            self.calls["create"] += 1
+            self.sim._job_seq += 1
+            pod = f"worker-pool-{self.sim._job_seq:05d}"
+            now = self.sim.now
+            self.pods[pod] = FakeJob(pod, now, now + self.sim.startup, self.sim.concurrency)
+        for pod in sorted(live, key=lambda p: (p.deletion_cost, -p.created))[:max(0, len(live) - replicas)]:
+            self.sim.kill(pod)
+
+    def patch_namespaced_pod(self, name, namespace, body):
+        self.calls["annotate"] += 1
+        cost = body["metadata"]["annotations"]["controller.kubernetes.io/pod-deletion-cost"]
+        self.pods[name].deletion_cost = int(cost)
+
+    def lookup(self, name):
+        pod = self.pods.get(name)
+        return pod.as_k8s() if pod else None
+
+
+# --- simulation ---
+
+class Simulation:
+    def __init__(self, policy, arrivals, trace_end, max_jobs, startup, processing_time, concurrency,
+                 poll_interval=5.0, tail=600.0, mode="jobs", spare=2, idle_seconds=30.0):
+        self.policy = policy
+        self.arrivals = arrivals
+        self.trace_end = trace_end
+        self.max_jobs = max_jobs
+        self.startup = startup
+        self.processing_time = processing_time
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.tail = tail
+        self.now = 0.0
+        self.broker = FakeBroker()
+        self.api = FakeBatchV1Api(self)
+        self.consumed = 0
+        self.redelivered = 0
+        self.latencies = []
+        self.decision_seconds = []
+        self.peak_jobs = 0
+        self.drained_at = None
+        self.cold_starts = []
+        self._job_seq = 0
+        self._next_poll = 0.0
+        self.activity = ActivityTracker(idle_after=idle_seconds, clock=lambda: self.now)
+        self.pool = None
+        if mode == "pool":
+            self.deployment = FakeDeploymentApi(self)
+            self.pool = WarmPool(self.deployment, self.deployment, "default", "worker-pool", spare=spare,
+                                 max_size=max_jobs + spare, pod_lookup=self.deployment.lookup,
+                                 on_activate=self.on_activate, clock=lambda: self.now)
+
+    def live_jobs(self):
+        return [j for j in self.api.jobs.values() if j.deleted is None]
+
+    def kill(self, job):
+        job.terminating = self.now
+        self.activity.forget(job.name)
+
+    def step_draining(self, job):
+        busy = [slot for slot in job.slots if slot is not None]
+        if busy and self.now - job.terminating < DRAIN_TIMEOUT:
+            return
+        for slot in busy:
+            self.broker.requeue(slot[1])
+            self.redelivered += 1
+        job.deleted = self.now
+
+    def on_activate(self, pod, requested_at):
+        job = self.api.jobs[pod]
+        job.requested = requested_at
+        job.first_message = None
+
+    def step_workers(self):
+        polling = self.pool is not None and self.now >= self._next_poll
+        if polling:
+            self._next_poll += ASSIGNMENT_POLL
+        for job in self.live_jobs():
+            if self.now < job.ready_at and job.terminating is None:
+                continue
+            consuming = job.terminating is None
+            if consuming and self.pool is not None:
+                consuming = self.pool.poll(job.name) if polling else job.name in self.pool.active
+            for i, slot in enumerate(job.slots):
+                if slot is not None and slot[0] <= self.now:
+                    self.broker.ack()
+                    self.consumed += 1
+                    self.latencies.append(slot[0] - slot[1])
+                    self.activity.record(job.name, 1)
+                    job.slots[i] = slot = None
+                if slot is None and consuming and self.broker.ready:
+                    arrived = self.broker.get()
+                    job.slots[i] = (self.now + self.processing_time, arrived)
+                    job.busy_seconds += self.processing_time
+                    if job.first_message is None:
+                        job.first_message = self.now
+                        self.cold_starts.append(self.now - job.requested)
+            if job.terminating is not None:
+                self.step_draining(job)
+
+    def tick(self):
+        # Mirrors scaler_loop: broker stats, active jobs, decision, apply
+        stats = self.broker.queue_stats()
+        jobs = self.api.list_namespaced_job("default", label_selector="app=worker-job").items
+        for job in self.live_jobs():
+            # The reporter's in-flight heartbeat
+            self.activity.record(job.name, 0, sum(1 for slot in job.slots if slot is not None))
+        if self.pool is not None:
+            active = self.pool.target
+            started = self.pool.active_since()
+        else:
+            active = sum(1 for j in jobs if (j.status.active or 0) > 0)
+            started = {j.metadata.name: j.metadata.creation_timestamp for j in jobs}
+        obs = Observation(
+            now=self.now,
+            ready=stats["messages_ready"],
+            unacked=stats["messages_unacknowledged"],
+            active=active,
+            consumed=self.consumed,
+            idle=sum(1 for name, at in started.items() if self.activity.is_idle(name, at)),
+        )
+        start = time.perf_counter()
+        decision, delta = reconcile(self.policy, obs, self.max_jobs)
+        self.decision_seconds.append(time.perf_counter() - start)
+
+        if self.pool is not None:
+            self.pool.resize(active + delta, self.activity.removal_order(started))
+            self.peak_jobs = max(self.peak_jobs, len(self.pool.active))
+            return
+        for _ in range(max(0, delta)):
+            self._job_seq += 1
+            self.api.create_namespaced_job("default", {"metadata": {"name": f"worker-job-{self._job_seq:05d}"}})
+        if delta < 0:
+            # Same choice as delete_jobs(): idle and least busy first
+            for name in self.activity.removal_order(started)[:-delta]:
+                self.api.delete_namespaced_job(name, "default")
+        self.peak_jobs = max(self.peak_jobs, len(self.live_jobs()))
+
+    def run(self):
+        next_tick = 0.0
+        horizon = None
+        while True:
+            self.broker.publish(self.now, self.arrivals(self.now))
+            self.step_workers()
+            if self.now >= next_tick:
+                self.tick()
+                next_tick += self.poll_interval
+            self.now += DT
+
+            idle = not self.broker.ready and self.broker.unacked == 0
+            if self.now >= self.trace_end and idle and self.drained_at is None:
+                self.drained_at = self.now
+                horizon = self.now + self.tail
+            if horizon is not None and (self.now >= horizon or not self.live_jobs()
+                                        or (self.pool is not None and not self.pool.active)):
+                break
+            if self.now > self.trace_end + 24 * 3600:
+                break
+        for job in self.live_jobs():
+            job.deleted = self.now
+        return self.report()
+
+    def report(self):
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 1) if lat else 0
+
+        worker_seconds = sum(j.deleted - j.created for j in self.api.jobs.values())
+        busy = sum(j.busy_seconds for j in self.api.jobs.values())
+        cold = sorted(self.cold_starts)
+        decisions = self.decision_seconds
+        return {
+            "policy": self.policy.name,
+            "mode": "pool" if self.pool is not None else "jobs",
+            "messages": self.consumed,
+            "drain_time_s": round(self.drained_at - self.trace_end, 1) if self.drained_at else None,
+            "latency_p50_s": pct(0.5),
+            "latency_p95_s": pct(0.95),
+            "latency_max_s": pct(1.0),
+            "worker_seconds": round(worker_seconds),
+            "utilization": round(busy / worker_seconds, 3) if worker_seconds else 0,
+            "idle_worker_seconds": round(worker_seconds - busy),
+            "peak_jobs": self.peak_jobs,
+            "jobs_created": self.api.calls["create"] + (self.deployment.calls["create"] if self.pool else 0),
+            "redelivered": self.redelivered,
+            "avg_first_message_s": round(sum(cold) / len(cold), 1) if cold else 0,
+            "p95_first_message_s": round(cold[min(len(cold) - 1, int(0.95 * len(cold)))], 1) if cold else 0,
+            "decision_us_avg": round(sum(decisions) / len(decisions) * 1e6, 1) if decisions else 0,
+            "decision_us_max": round(max(decisions) * 1e6, 1) if decisions else 0,
+        }
+
+
+def make_policy(name, args):
+    if name == "rate":
+        return RatePolicy(
+            args.max_jobs,
+            target_drain=args.target_drain,
+            startup=args.startup,
+            per_worker=args.concurrency / args.processing_time,
+            slots_per_worker=args.concurrency,
+        )
+    return ThresholdPolicy(args.threshold, args.max_jobs, burst=args.burst, idle_ticks=6)
+
+
+COLUMNS = [
+    ("policy", 10), ("mode", 5), ("messages", 9), ("drain_time_s", 13), ("latency_p50_s", 14), ("latency_p95_s", 14),
+    ("worker_seconds", 15), ("utilization", 12), ("peak_jobs", 10), ("jobs_created", 13),
+    ("redelivered", 12), ("avg_first_message_s", 20), ("decision_us_avg", 16),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", choices=sorted(TRACES), action="append")
+    parser.add_argument("--policy", choices=["threshold", "rate"], action="append")
+    parser.add_argument("--max-jobs", type=int, default=100)
+    parser.add_argument("--threshold", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=5, help="threshold policy burst size (BURST_SIZE)")
+    parser.add_argument("--startup", type=float, default=15.0, help="job creation to first consume, seconds")
+    parser.add_argument("--processing-time", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--target-drain", type=float, default=60.0)
+    parser.add_argument("--mode", choices=["jobs", "pool"], action="append", help="execution mode (EXECUTION_MODE)")
+    parser.add_argument("--idle-seconds", type=float, default=30.0, help="WORKER_IDLE_SECONDS")
+    parser.add_argument("--spare", type=int, default=2, help="standby pods kept in pool mode")
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for trace in args.trace or sorted(TRACES):
+        print(f"\n== trace: {trace}")
+        print(" ".join(f"{c:>{w}}" for c, w in COLUMNS))
+        for mode in args.mode or ["jobs"]:
+            for name in args.policy or ["threshold", "rate"]:
+                arrivals, trace_end = TRACES[trace]()
+                sim = Simulation(make_policy(name, args), arrivals, trace_end, args.max_jobs, args.startup,
+                                 args.processing_time, args.concurrency, mode=mode, spare=args.spare,
+                                 idle_seconds=args.idle_seconds)
+                with contextlib.redirect_stdout(io.StringIO()):  # scaler log lines
+                    result = sim.run()
+                result["trace"] = trace
+                results.append(result)
+                print(" ".join(f"{str(result[c]):>{w}}" for c, w in COLUMNS))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@
 
 COMMAND=$1
 VALUE=$2
+# Scaler API for the stats modes (./manage.sh forward exposes it here)
+SCALER_URL=${SCALER_URL:-http://localhost:8080}
 
 # Colors
 GREEN='\033[0;32m'
@@ -14,9 +16,11 @@ RED='\033[0;31m'
 NC='\033[0m' # No Color
 
 usage() {
-    echo "Usage: $0 {summary|watch|logs <component>|all}"
+    echo "Usage: $0 {summary|watch|stats|stats-watch|logs <component>|all}"
     echo "  summary     : Show current status of queue, scaler, and jobs (default)"
     echo "  watch       : Continuously watch the summary view"
+    echo "  stats       : Show the scaler's /stats snapshot (one request, no kubectl)"
+    echo "  stats-watch : Watch /stats, redrawing only when the snapshot changes"
     echo "  logs <comp> : Stream logs for 'scaler', 'producer', or 'worker' (random pod)"
     echo "  all         : Show all related Kubernetes resources"
     exit 1
@@ -90,6 +94,35 @@ show_summary() {
     echo ""
 }
 
+# Renders a /stats JSON body from stdin
+read -r -d '' RENDER_STATS <<'PY'
+import json, sys
+data = json.load(sys.stdin)
+m = data["metrics"]
+print(f"Status:   {m.get('status_msg', '-')}  (snapshot v{data['version']})")
+print(f"Queue:    {m.get('queue_depth', '-')} ready, {m.get('unacked', 0)} unacked")
+print(f"Workers:  {m.get('active_jobs', '-')} / {m.get('max_jobs', '-')} "
+      f"(target {m.get('desired_jobs', '-')}, {m.get('idle_jobs', 0)} idle)")
+print(f"Consumed: {m.get('total_consumed', 0)} rows, {m.get('messages_consumed', 0)} messages, "
+      f"{m.get('duplicates_skipped', 0)} duplicates skipped")
+print(f"Load:     CPU {m.get('cpu_percent', '-')}%  Mem {m.get('memory_percent', '-')}%")
+print()
+print(f"{'BINDING':<14} {'QUEUE':<18} {'READY':>7} {'UNACKED':>8} {'JOBS':>7} {'GRANTED':>8}  STATUS")
+for name, q in m.get("queues", {}).items():
+    jobs = f"{q['active_jobs']}/{q['max_jobs']}"
+    print(f"{name:<14} {q['queue']:<18} {q['ready']:>7} {q['unacked']:>8} {jobs:>7} {q['granted_jobs']:>8}  {q['status']}")
+    if q.get("shards"):
+        print(" " * 15 + "  ".join(f"{shard}={ready}" for shard, ready in q["shards"].items()))
+print()
+print(f"{'JOB':<28} {'BINDING':<14} {'STATUS':<10} {'START':<9} PROCESSED")
+for job in data["jobs"]:
+    print(f"{job['name']:<28} {job.get('binding', '-'):<14} {job['status']:<10} {job['start_time']:<9} {job.get('processed', 0)}")
+PY
+
+render_stats() {
+    python3 -c "$RENDER_STATS"
+}
+
 case "$COMMAND" in
     summary|"")
         show_header
@@ -105,6 +138,33 @@ case "$COMMAND" in
         done
         ;;
 
+    stats|s)
+        show_header
+        curl -sf "$SCALER_URL/stats" | render_stats || echo -e "${RED}  Scaler not reachable at $SCALER_URL${NC}"
+        ;;
+
+    stats-watch|sw)
+        # Conditional GETs: an unchanged snapshot costs the scaler a 304 with no body
+        ETAG=""
+        BODY=$(mktemp)
+        trap 'rm -f "$BODY"' EXIT
+        while true; do
+            HEADERS=$(curl -s -D - -o "$BODY.new" -H "If-None-Match: $ETAG" "$SCALER_URL/stats")
+            CODE=$(echo "$HEADERS" | head -n 1 | awk '{print $2}')
+            if [ "$CODE" == "200" ]; then
+                ETAG=$(echo "$HEADERS" | grep -i '^etag:' | cut -d' ' -f2 | tr -d '\r')
+                mv "$BODY.new" "$BODY"
+                show_header
+                render_stats < "$BODY"
+                echo -e "\n${BLUE}(Press Ctrl+C to exit)${NC}"
+            elif [ "$CODE" != "304" ]; then
+                show_header
+                echo -e "${RED}  Scaler not reachable at $SCALER_URL${NC}"
+            fi
+            sleep 2
+        done
+        ;;
+
     logs|l)
         COMPONENT=$VALUE
         if [ -z "$COMPONENT" ]; then
@@ -1,23 +1,232 @@
-import csv
-import random
-from datetime import datetime, timedelta
-
-def generate_data(filename="data.csv", rows=10000):
-    items = ["Widget", "Gadget", "Thingamajig", "Doohickey", "Contraption"]
-    start_date = datetime(2024, 1, 1)
-
-    with open(filename, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Date", "Item Description", "Quantity", "Amount"])
-
-        for i in range(rows):
-            date = start_date + timedelta(days=random.randint(0, 365))
-            item = random.choice(items)
-            quantity = random.randint(1, 100)
-            amount = round(random.uniform(10.0, 1000.0), 2)
-            writer.writerow([date.strftime("%Y-%m-%d"), item, quantity, amount])
-    
-    print(f"Generated {rows} rows in {filename}")
+"""Test data for the producer: CSV generated in vectorized chunks with NumPy.
+
+Each chunk of rows is built column by column. Every column is rendered as a
+fixed-width byte matrix (values NUL-padded), the columns and separators are
+laid side by side in one uint8 matrix, and dropping the NUL bytes turns it
+into CSV text. There is no Python work per row, so millions of rows take
+seconds.
+
+A schema is a list of (header, kind, options) columns; see SCHEMAS, or pass
+a JSON file with the same layout. --skew draws "choice", "id" and "int"
+columns from a Zipf-like distribution (rank k has weight 1 / k**skew), so a
+few values dominate. --pad adds a random text column for larger rows.
+
+Usage:
+    python data/generate_data.py                          # 10,000 sales rows -> data.csv
+    python data/generate_data.py --rows 10000000 --out big.csv
+    python data/generate_data.py --schema events --skew 1.2 --pad 200
+    python data/generate_data.py --rows 5000000 --upload "http://localhost:8000/uploads?batch_rows=50"
+
+With --upload nothing is written to disk: the CSV is streamed to the
+producer as a chunked multipart request while it is generated.
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import requests
+
+ITEMS = ["Widget", "Gadget", "Thingamajig", "Doohickey", "Contraption"]
+
+SCHEMAS = {
+    # The original data.csv layout
+    "sales": [
+        ("Date", "date", {"start": "2024-01-01", "days": 366}),
+        ("Item Description", "choice", {"values": ITEMS}),
+        ("Quantity", "int", {"low": 1, "high": 100}),
+        ("Amount", "money", {"low": 10, "high": 1000}),
+    ],
+    # Clickstream-like rows with a large key space, for skewed workloads
+    "events": [
+        ("Timestamp", "timestamp", {"start": "2024-01-01", "days": 30}),
+        ("User ID", "id", {"prefix": "user-", "count": 100000}),
+        ("Event", "choice", {"values": ["view", "click", "add_to_cart", "purchase", "refund"]}),
+        ("Value", "money", {"low": 0, "high": 500}),
+    ],
+}
+
+CHUNK_ROWS = 100_000  # rows per generated chunk; about 3-5 MB of CSV for the built-in schemas
+CENTS = np.array([b".%02d" % i for i in range(100)])
+CLOCK = np.array([b" %02d:%02d:%02d" % (s // 3600, s // 60 % 60, s % 60) for s in range(86400)])
+
+
+def zipf_weights(count, skew):
+    """Probabilities for ranks 0..count-1, or None for uniform."""
+    if not skew:
+        return None
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def int_strings(values):
+    # Fixed-width bytes just wide enough for the largest value
+    width = len(str(int(np.abs(values).max()))) + 1 if len(values) else 1
+    return values.astype(f"S{width}")
+
+
+def date_table(options):
+    start = date.fromisoformat(options.get("start", "2024-01-01"))
+    return np.array([(start + timedelta(days=d)).isoformat().encode() for d in range(int(options["days"]))])
+
+
+def make_column(kind, options, skew):
+    """A renderer (rng, n) -> list of pieces, each bytes or an (n,) S array."""
+    if kind == "choice":
+        table = np.array([str(v).encode() for v in options["values"]])
+        p = zipf_weights(len(table), skew)
+        return lambda rng, n: [table[rng.choice(len(table), n, p=p)]]
+    if kind == "int":
+        low, high = int(options["low"]), int(options["high"])
+        p = zipf_weights(high - low + 1, skew)
+        return lambda rng, n: [int_strings(low + rng.choice(high - low + 1, n, p=p))]
+    if kind == "id":
+        prefix = str(options.get("prefix", "")).encode()
+        p = zipf_weights(int(options["count"]), skew)
+        return lambda rng, n: [prefix, int_strings(rng.choice(int(options["count"]), n, p=p))]
+    if kind == "money":
+        low, high = int(round(options["low"] * 100)), int(round(options["high"] * 100))
+
+        def money(rng, n):
+            cents = rng.integers(low, high + 1, n)
+            return [int_strings(cents // 100), CENTS[cents % 100]]
+        return money
+    if kind == "date":
+        table = date_table(options)
+        return lambda rng, n: [table[rng.integers(0, len(table), n)]]
+    if kind == "timestamp":
+        table = date_table(options)
+
+        def timestamp(rng, n):
+            seconds = rng.integers(0, len(table) * 86400, n)
+            return [table[seconds // 86400], CLOCK[seconds % 86400]]
+        return timestamp
+    if kind == "text":
+        width = int(options["bytes"])
+
+        def text(rng, n):
+            # Random lowercase letters, between half and all of `width` long
+            letters = rng.integers(ord("a"), ord("z") + 1, (n, width), dtype=np.uint8)
+            lengths = rng.integers(width // 2, width + 1, n)
+            letters[np.arange(width) >= lengths[:, None]] = 0
+            return [letters]
+        return text
+    raise ValueError(f"Unknown column kind {kind!r}")
+
+
+def as_matrix(piece, n):
+    if isinstance(piece, bytes):
+        return np.frombuffer(piece, np.uint8)[None, :]
+    if piece.dtype == np.uint8:
+        return piece
+    return piece.view(np.uint8).reshape(n, piece.dtype.itemsize)
+
+
+def render_rows(pieces, n):
+    """CSV text for n rows from the rendered columns' pieces, separators included."""
+    matrices = [as_matrix(piece, n) for piece in pieces]
+    out = np.empty((n, sum(m.shape[1] for m in matrices)), np.uint8)
+    col = 0
+    for m in matrices:
+        out[:, col:col + m.shape[1]] = m
+        col += m.shape[1]
+    flat = out.ravel()
+    return flat[flat != 0].tobytes()
+
+
+def load_schema(name):
+    if name in SCHEMAS:
+        return SCHEMAS[name]
+    with open(name) as f:
+        return [tuple(column) for column in json.load(f)]
+
+
+def generate_csv(rows, schema="sales", skew=0.0, pad=0, chunk_rows=CHUNK_ROWS, seed=None):
+    """Yields the CSV as bytes: the header line, then up to `chunk_rows` rows at a time."""
+    columns = list(load_schema(schema) if isinstance(schema, str) else schema)
+    if pad:
+        columns.append(("Note", "text", {"bytes": pad}))
+    renderers = [make_column(kind, options, skew) for _, kind, options in columns]
+    rng = np.random.default_rng(seed)
+
+    yield (",".join(header for header, _, _ in columns) + "\n").encode()
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        pieces = []
+        for i, render in enumerate(renderers):
+            if i:
+                pieces.append(b",")
+            pieces.extend(render(rng, n))
+        pieces.append(b"\n")
+        yield render_rows(pieces, n)
+
+
+def generate_data(filename="data.csv", rows=10000, **options):
+    started = time.perf_counter()
+    size = 0
+    with open(filename, "wb") as f:
+        for chunk in generate_csv(rows, **options):
+            f.write(chunk)
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"Generated {rows} rows ({size / 1e6:.1f} MB) in {filename} in {elapsed:.2f}s")
+
+
+def multipart_stream(chunks, filename, boundary):
+    """A multipart/form-data body with one "file" field, produced as the chunks come."""
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode()
+    yield from chunks
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload_data(url, rows=10000, filename="data.csv", **options):
+    """Stream generated rows to /upload or /uploads; a generator body makes requests send it chunked."""
+    boundary = uuid.uuid4().hex
+    sent = 0
+
+    def counted(chunks):
+        nonlocal sent
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+
+    started = time.perf_counter()
+    res = requests.post(
+        url,
+        data=multipart_stream(counted(generate_csv(rows, **options)), filename, boundary),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Streamed {rows} rows ({sent / 1e6:.1f} MB) to {url} in {elapsed:.2f}s: HTTP {res.status_code}")
+    print(res.text)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--out", default="data.csv", help="output file, or the upload's filename with --upload")
+    parser.add_argument("--schema", default="sales", help=f"{' or '.join(SCHEMAS)}, or a JSON schema file")
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf exponent for choice/id/int columns; 0 is uniform")
+    parser.add_argument("--pad", type=int, default=0, help="add a text column of up to this many bytes per row")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--upload", metavar="URL", help="stream to the producer instead of writing a file")
+    args = parser.parse_args()
+
+    options = dict(schema=args.schema, skew=args.skew, pad=args.pad, chunk_rows=args.chunk_rows, seed=args.seed)
+    if args.upload:
+        res = upload_data(args.upload, args.rows, filename=args.out, **options)
+        sys.exit(0 if res.ok else 1)
+    generate_data(args.out, args.rows, **options)
+
 
 if __name__ == "__main__":
-    generate_data()
+    main()
@@ -28,11 +28,14 @@ case "$COMMAND" in
         kubectl apply -f infra/k8s/producer.yaml
         echo "Applying Scaler..."
         kubectl apply -f infra/k8s/scaler.yaml
+        echo "Applying worker pool (idle unless EXECUTION_MODE=pool)..."
+        kubectl apply -f infra/k8s/worker-pool.yaml
         echo "✅ Done! Services are starting."
         ;;
     
     down)
         echo "🛑 Stopping services..."
+        kubectl delete -f infra/k8s/worker-pool.yaml --ignore-not-found
         kubectl delete -f infra/k8s/scaler.yaml --ignore-not-found
         kubectl delete -f infra/k8s/producer.yaml --ignore-not-found
         kubectl delete -f infra/k8s/rabbitmq.yaml --ignore-not-found
@@ -53,9 +56,10 @@ case "$COMMAND" in
             usage
         fi
         echo "⚖️  Scaling max jobs to $VALUE..."
-        # Update yaml file using sed (compatible with macOS/BSD sed)
-        sed -i '' "s/value: \"[0-9]*\"/value: \"$VALUE\"/g" infra/k8s/scaler.yaml
-        # For Linux users, it would be: sed -i "s/value: \"[0-9]*\"/value: \"$VALUE\"/g" infra/k8s/scaler.yaml
+        # Update yaml file using sed (compatible with macOS/BSD sed). Only the value
+        # right after MAX_JOBS: QUEUE_PARTITIONS must keep matching the producer
+        sed -i '' "/name: MAX_JOBS/,/value:/s/value: \"[0-9]*\"/value: \"$VALUE\"/" infra/k8s/scaler.yaml
+        # For Linux users, it would be: sed -i "/name: MAX_JOBS/,/value:/s/value: \"[0-9]*\"/value: \"$VALUE\"/" infra/k8s/scaler.yaml
         
         echo "Applying change..."
         kubectl apply -f infra/k8s/scaler.yaml
@@ -0,0 +1,52 @@
+import struct
+import zlib
+
+import pika
+
+# Batch envelope shared with worker/envelope.py: the body is a sequence of
+# rows, each a 4-byte big-endian length followed by the UTF-8 row text,
+# optionally deflate-compressed as a whole.
+BATCH_CONTENT_TYPE = "application/x-kube-job-batch"
+DEFLATE = "deflate"
+
+_LENGTH = struct.Struct(">I")
+
+
+def encode_batch(rows, compress=False):
+    """Pack row strings into one persistent message; returns (body, properties)."""
+    parts = []
+    for row in rows:
+        data = row.encode("utf-8")
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+    body = b"".join(parts)
+    if compress:
+        body = zlib.compress(body)
+    properties = pika.BasicProperties(
+        delivery_mode=2,
+        content_type=BATCH_CONTENT_TYPE,
+        content_encoding=DEFLATE if compress else None,
+        headers={"rows": len(rows)},
+    )
+    return body, properties
+
+
+class Batcher:
+    """Accumulates rows until max_rows or max_bytes (of encoded rows, as in the body) is hit."""
+
+    def __init__(self, max_rows, max_bytes):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = []
+        self.size = 0
+
+    def add(self, row):
+        """Add a row; returns True once the batch should be flushed."""
+        self.rows.append(row)
+        # Bytes, not characters: non-ASCII rows are longer once UTF-8 encoded
+        self.size += _LENGTH.size + len(row.encode("utf-8"))
+        return len(self.rows) >= self.max_rows or self.size >= self.max_bytes
+
+    def take(self):
+        rows, self.rows, self.size = self.rows, [], 0
+        return rows
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import requests
+
+SAMPLE_INTERVAL = 1.0  # seconds between management API samples
+ADJUST_INTERVAL = 0.5  # seconds between rate re-evaluations per upload
+DECREASE_FACTOR = 0.5
+LATENCY_ALPHA = 0.2
+
+
+class TokenBucket:
+    """Async token bucket. A rate of None means unlimited."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._tokens = 0.0
+        self._last = time.monotonic()
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            # Allow at most one second worth of burst
+            self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self):
+        """Wait for one token; returns the seconds spent waiting."""
+        waited = 0.0
+        while self.rate:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                break
+            delay = (1 - self._tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+
+class BrokerMonitor:
+    """Shared view of broker load: queue depth sampled from the management
+    API at most once per interval, plus the connection.blocked state reported
+    by the publisher connection. For a partitioned queue the depth is summed
+    over all of its shard queues."""
+
+    def __init__(self, api_url, queues, auth=("guest", "guest"), interval=SAMPLE_INTERVAL):
+        self.url = f"{api_url}/queues/%2F"
+        self.queues = list(queues)
+        self.auth = auth
+        self.interval = interval
+        self.ready = 0
+        self.unacked = 0
+        self.sampled_at = 0.0
+        self.blocked = False
+        self._session = requests.Session()
+        self._lock = asyncio.Lock()
+
+    def on_blocked(self, *args):
+        self.blocked = True
+
+    def on_unblocked(self, *args):
+        self.blocked = False
+
+    def _fetch(self):
+        if len(self.queues) == 1:
+            res = self._session.get(f"{self.url}/{self.queues[0]}", auth=self.auth, timeout=2)
+            res.raise_for_status()
+            found = [res.json()]
+        else:
+            # One call for all shards, only the needed columns
+            res = self._session.get(
+                self.url, params={"columns": "name,messages_ready,messages_unacknowledged"},
+                auth=self.auth, timeout=2,
+            )
+            res.raise_for_status()
+            found = [q for q in res.json() if q.get("name") in self.queues]
+        return (sum(q.get("messages_ready", 0) for q in found),
+                sum(q.get("messages_unacknowledged", 0) for q in found))
+
+    async def sample(self):
+        async with self._lock:
+            if time.monotonic() - self.sampled_at < self.interval:
+                return self.ready, self.unacked
+            try:
+                self.ready, self.unacked = await asyncio.to_thread(self._fetch)
+            except Exception as e:
+                # Keep the last known depth; flow control must not stall on monitoring
+                print(f"Error fetching queue depth: {e}")
+            self.sampled_at = time.monotonic()
+            return self.ready, self.unacked
+
+
+class FlowController:
+    """Adaptive publish pacing for one upload.
+
+    Publishes at max_rate (unlimited when 0) while the backlog of ready
+    messages stays under high_watermark. Above it, or when publisher confirms
+    get slower than latency_target, the rate is cut multiplicatively down to
+    min_rate; it returns to full speed once the backlog drains below
+    low_watermark. A connection.blocked notification pauses publishing.
+    """
+
+    def __init__(self, monitor, max_rate=0, min_rate=10, high_watermark=5000,
+                 low_watermark=1000, latency_target=0.5):
+        self.monitor = monitor
+        self.max_rate = max_rate or None
+        self.min_rate = min_rate
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.latency_target = latency_target
+        self.bucket = TokenBucket(self.max_rate)
+        self.confirm_latency = 0.0
+        self.published = 0
+        self.throttled_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.peak_ready = 0
+        self.rate_changes = 0
+        self._started = time.monotonic()
+        self._next_adjust = 0.0
+        self._window_start = self._started
+        self._window_count = 0
+
+    def record_confirm(self, seconds):
+        self.confirm_latency += LATENCY_ALPHA * (seconds - self.confirm_latency)
+
+    async def wait(self):
+        """Call before each publish."""
+        while self.monitor.blocked:
+            await asyncio.sleep(0.1)
+            self.blocked_seconds += 0.1
+        now = time.monotonic()
+        if now >= self._next_adjust:
+            self._next_adjust = now + ADJUST_INTERVAL
+            await self._adjust(now)
+        self.throttled_seconds += await self.bucket.acquire()
+        self.published += 1
+        self._window_count += 1
+
+    async def _adjust(self, now):
+        ready, _ = await self.monitor.sample()
+        self.peak_ready = max(self.peak_ready, ready)
+
+        observed = self._window_count / max(now - self._window_start, 1e-3)
+        self._window_start, self._window_count = now, 0
+
+        rate = self.bucket.rate
+        overloaded = ready > self.high_watermark or self.confirm_latency > self.latency_target
+        if overloaded:
+            # Unlimited publishing has no rate to cut yet: start from what we achieved
+            current = rate or max(observed, self.min_rate)
+            new_rate = max(self.min_rate, current * DECREASE_FACTOR)
+        elif ready < self.low_watermark:
+            new_rate = self.max_rate
+        else:
+            new_rate = rate
+        if new_rate != rate:
+            self.bucket.set_rate(new_rate)
+            self.rate_changes += 1
+
+    def report(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            "max_rate": self.max_rate or 0,
+            "min_rate": self.min_rate,
+            "high_watermark": self.high_watermark,
+            "low_watermark": self.low_watermark,
+            "latency_target": self.latency_target,
+            "final_rate": round(self.bucket.rate, 2) if self.bucket.rate else 0,
+            "avg_rate": round(self.published / elapsed, 2) if elapsed > 0 else 0,
+            "rate_changes": self.rate_changes,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "peak_ready": self.peak_ready,
+            "confirm_latency_ms": round(self.confirm_latency * 1000, 2),
+        }
@@ -0,0 +1,176 @@
+import csv
+import io
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+CHUNK_SIZE = 64 * 1024
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+class CsvStream:
+    """Incremental CSV parser fed with raw bytes.
+
+    Bytes are buffered only until the last complete record: a record ends at
+    a newline that is outside a quoted field (even number of quote chars since
+    the previous record boundary). Only complete records are decoded and
+    handed to csv.reader, so multi-byte UTF-8 sequences and quoted newlines
+    that straddle chunk boundaries are never split.
+    """
+
+    def __init__(self, max_record_bytes=MAX_RECORD_BYTES):
+        self.max_record_bytes = max_record_bytes
+        self.offset = 0  # bytes consumed up to the last complete record
+        self._buf = bytearray()
+        self._scan = 0
+        self._quotes = 0
+        self._started = False
+
+    def feed(self, data):
+        if not self._started:
+            self._started = True
+            if data.startswith(UTF8_BOM):
+                data = data[len(UTF8_BOM):]
+                self.offset += len(UTF8_BOM)
+        self._buf += data
+
+        # Walk back from the last newline until one sits outside a quoted field
+        buf = self._buf
+        boundary = 0
+        end = len(buf)
+        while True:
+            nl = buf.rfind(b"\n", self._scan, end)
+            if nl < 0:
+                break
+            if (self._quotes + buf.count(b'"', self._scan, nl)) % 2 == 0:
+                boundary = nl + 1
+                break
+            end = buf.rfind(b'"', self._scan, nl)
+            if end < 0:
+                break
+
+        if boundary == 0:
+            self._quotes += buf.count(b'"', self._scan)
+            self._scan = len(buf)
+            if len(buf) > self.max_record_bytes:
+                raise ValueError(f"CSV record exceeds {self.max_record_bytes} bytes (unterminated quote?)")
+            return []
+        self._scan = boundary
+        self._quotes = 0
+        return self._take(boundary)
+
+    def finish(self):
+        if not self._buf:
+            return []
+        return self._take(len(self._buf))
+
+    def _take(self, boundary):
+        text = self._buf[:boundary].decode("utf-8")
+        del self._buf[:boundary]
+        self._scan -= boundary
+        self.offset += boundary
+        return list(csv.reader(io.StringIO(text)))
+
+
+async def iter_upload_rows(file, chunk_size=CHUNK_SIZE, skip_header=True):
+    """Yield lists of parsed rows from an UploadFile (or a StreamedUpload), chunk by chunk."""
+    parser = CsvStream()
+    header_pending = skip_header
+    while True:
+        chunk = await file.read(chunk_size)
+        rows = parser.feed(chunk) if chunk else parser.finish()
+        if header_pending and rows:
+            rows = rows[1:]
+            header_pending = False
+        if rows:
+            yield rows
+        if not chunk:
+            break
+
+
+class StreamedUpload:
+    """The file field of a multipart/form-data request, read as the body arrives.
+
+    An UploadFile stand-in for iter_upload_rows: request.stream() is pushed
+    through python-multipart's parser and read() returns the file part's
+    bytes as soon as they are parsed, instead of after the whole body has
+    been spooled to a temp file. open() reads up to the file part's headers
+    and sets `filename`; fields after the file part are not read.
+    """
+
+    def __init__(self, request, field="file"):
+        self.field = field
+        self.filename = None
+        self._stream = request.stream()
+        self._pending = []
+        self._header = [b"", b""]
+        self._headers = {}
+        self._in_file = False
+        self._file_done = False
+        self._eof = False
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("Expected a multipart/form-data body")
+        self._parser = multipart.MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header(0, data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header(1, data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    async def open(self):
+        """Read until the file part starts; returns False if the body has none."""
+        while self.filename is None and not self._eof:
+            await self._feed()
+        return self.filename is not None
+
+    async def read(self, size=-1):
+        """The next parsed bytes of the file (whatever has arrived, not `size`); b"" at its end."""
+        while not self._pending and not self._file_done and not self._eof:
+            await self._feed()
+        data = b"".join(self._pending)
+        self._pending.clear()
+        return data
+
+    async def _feed(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            self._eof = True
+            return
+        self._parser.write(chunk)
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _append_header(self, i, data):
+        self._header[i] += bytes(data)
+
+    def _on_header_end(self):
+        self._headers[self._header[0].lower()] = self._header[1]
+        self._header = [b"", b""]
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and b"filename" in options and options.get(b"name") == self.field.encode():
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._pending.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
@@ -1,50 +1,201 @@
-from fastapi import FastAPI, UploadFile, File
-import pika
-import csv
-import io
-import time
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, HTTPException, Request, UploadFile, File, Response
 import os
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
 
-app = FastAPI()
+from ingest import StreamedUpload, iter_upload_rows
+from flow import BrokerMonitor
+from partitions import PartitionedQueue
+from publisher import Publisher
+from uploads import UploadManager, UploadPublication
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
+RABBITMQ_API = f"http://{RABBITMQ_HOST}:15672/api"
 QUEUE_NAME = "task_queue"
+# Queues uploads may target (?queue=...); each one should be bound in the scaler config
+QUEUE_NAMES = [q for q in os.getenv("QUEUE_NAMES", QUEUE_NAME).split(",") if q]
+# Each queue can be spread over QUEUE_PARTITIONS shard queues (<queue>.0, <queue>.1, ...)
+# plus a <queue>.priority lane; the scaler bindings must use the same settings
+QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", 1))
+PRIORITY_LANE = os.getenv("PRIORITY_LANE", "false").lower() == "true"
 
-def get_rabbitmq_channel():
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-    channel = connection.channel()
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-    return connection, channel
+# Flow control defaults, overridable per upload via query parameters
+PUBLISH_MAX_RATE = float(os.getenv("PUBLISH_MAX_RATE", 0))  # msg/s, 0 = unlimited
+PUBLISH_MIN_RATE = float(os.getenv("PUBLISH_MIN_RATE", 10))
+QUEUE_HIGH_WATERMARK = int(os.getenv("QUEUE_HIGH_WATERMARK", 5000))
+QUEUE_LOW_WATERMARK = int(os.getenv("QUEUE_LOW_WATERMARK", 1000))
+CONFIRM_LATENCY_TARGET = float(os.getenv("CONFIRM_LATENCY_TARGET", 0.5))  # seconds
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+# Publisher pool
+PUBLISH_CHANNELS = int(os.getenv("PUBLISH_CHANNELS", 4))
+CONFIRM_WINDOW = int(os.getenv("CONFIRM_WINDOW", 512))
+
+# Row batching: 1 row per message keeps the legacy plain-text format
+BATCH_ROWS = int(os.getenv("BATCH_ROWS", 1))
+BATCH_BYTES = int(os.getenv("BATCH_BYTES", 256 * 1024))
+
+# Spooled uploads (POST /uploads): where they are kept and how many publish at once
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/spool")
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+UPLOAD_RETENTION = float(os.getenv("UPLOAD_RETENTION", 86400))  # seconds finished uploads stay listed
+
+# Prometheus metrics, served from /metrics
+PUBLISH_CONFIRM_SECONDS = Histogram(
+    "producer_publish_confirm_seconds", "Time from publish to broker confirm",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ROWS_PUBLISHED = Counter("producer_rows_published", "CSV rows published")
+MESSAGES_PUBLISHED = Counter("producer_messages_published", "Messages published (a batch counts once)")
+PUBLISH_FAILURES = Counter("producer_publish_failures", "Messages the broker did not confirm")
+
+layouts = {queue: PartitionedQueue(queue, QUEUE_PARTITIONS, PRIORITY_LANE) for queue in QUEUE_NAMES}
+broker_monitors = {queue: BrokerMonitor(RABBITMQ_API, layout.queues) for queue, layout in layouts.items()}
+
+def on_blocked(*args):
+    # connection.blocked is broker-wide, not per queue
+    for monitor in broker_monitors.values():
+        monitor.on_blocked()
+
+def on_unblocked(*args):
+    for monitor in broker_monitors.values():
+        monitor.on_unblocked()
+
+publisher = Publisher(
+    RABBITMQ_HOST,
+    [q for layout in layouts.values() for q in layout.queues],
+    pool_size=PUBLISH_CHANNELS,
+    window=CONFIRM_WINDOW,
+    on_blocked=on_blocked,
+    on_unblocked=on_unblocked,
+)
+
+def make_publication(params, turn, upload_id=None, first_row=0, uploaded_at=None):
+    return UploadPublication(
+        publisher, broker_monitors[params["queue"]], layouts[params["queue"]], params, turn,
+        on_confirm=PUBLISH_CONFIRM_SECONDS.observe, upload_id=upload_id, first_row=first_row,
+        uploaded_at=uploaded_at,
+    )
+
+def record_published(rows, messages, failed):
+    ROWS_PUBLISHED.inc(rows)
+    MESSAGES_PUBLISHED.inc(messages)
+    PUBLISH_FAILURES.inc(failed)
+
+uploads = UploadManager(SPOOL_DIR, make_publication, concurrency=UPLOAD_CONCURRENCY, on_progress=record_published,
+                        retention=UPLOAD_RETENTION)
+
+@asynccontextmanager
+async def lifespan(app):
+    await publisher.start()
+    await uploads.start()
+    yield
+    # Unfinished uploads resume from their last checkpoint on the next start
+    await uploads.stop()
+    await publisher.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+def publish_params(
+    max_rate: float = PUBLISH_MAX_RATE,
+    min_rate: float = PUBLISH_MIN_RATE,
+    high_watermark: int = QUEUE_HIGH_WATERMARK,
+    low_watermark: int = QUEUE_LOW_WATERMARK,
+    latency_target: float = CONFIRM_LATENCY_TARGET,
+    batch_rows: int = BATCH_ROWS,
+    batch_bytes: int = BATCH_BYTES,
+    compress: bool = False,
+    queue: str = QUEUE_NAME,
+    partition: str = "round_robin",
+    partition_key: int = 0,
+    priority: bool = False,
+):
+    """Query parameters shared by /upload and /uploads."""
+    return {
+        "max_rate": max_rate,
+        "min_rate": min_rate,
+        "high_watermark": high_watermark,
+        "low_watermark": low_watermark,
+        "latency_target": latency_target,
+        "batch_rows": batch_rows,
+        "batch_bytes": batch_bytes,
+        "compress": compress,
+        "queue": queue,
+        "partition": partition,  # "round_robin", or "hash" on column partition_key
+        "partition_key": partition_key,
+        "priority": priority,
+    }
+
+def check_upload(file, params):
     if not file.filename.endswith(".csv"):
         return {"error": "Only CSV files are allowed"}
+    if params["queue"] not in broker_monitors:
+        return {"error": f"Unknown queue {params['queue']}; expected one of {', '.join(QUEUE_NAMES)}"}
+    if params["partition"] not in ("round_robin", "hash"):
+        return {"error": "partition must be round_robin or hash"}
+    if params["priority"] and not PRIORITY_LANE:
+        return {"error": "No priority lane; set PRIORITY_LANE=true on the producer"}
+    return None
+
+@app.post("/upload")
+async def upload_file(request: Request, params: dict = Depends(publish_params)):
+    # The multipart body is parsed here rather than by File(...), which would
+    # spool all of it before this handler runs: rows are published while the
+    # rest of the upload is still arriving
+    try:
+        file = StreamedUpload(request)
+        found = await file.open()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=422, detail="No file field in the upload")
+    error = check_upload(file, params)
+    if error:
+        return error
+
+    publication = make_publication(params, uploads.turn)
+    # The header is skipped
+    async for rows in iter_upload_rows(file):
+        await publication.publish_rows(rows)
+
+    # Confirms are pipelined; only report once the broker has accepted everything
+    await publication.flush()
+    confirms = publication.confirms
+    record_published(publication.rows, publication.messages, confirms.failed)
+    return {
+        "message": f"Processed {publication.rows} rows and pushed to {params['queue']}",
+        "trace_id": publication.upload_id,
+        "queues": [publication.layout.priority] if publication.priority else publication.layout.shards,
+        "messages": publication.messages,
+        "confirmed": confirms.confirmed,
+        "failed": confirms.failed,
+        "flow_control": publication.flow.report(),
+    }
+
+@app.post("/uploads", status_code=202)
+async def spool_upload(file: UploadFile = File(...), params: dict = Depends(publish_params)):
+    """Spool the file and return at once; poll /uploads/{id} while it is published."""
+    error = check_upload(file, params)
+    if error:
+        return error
+    record = await uploads.accept(file, params)
+    return {"id": record["id"], "state": record["state"], "status_url": f"/uploads/{record['id']}", "trace_id": record["id"]}
+
+@app.get("/uploads")
+def list_uploads():
+    return {"uploads": uploads.statuses()}
+
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: str):
+    status = uploads.status(upload_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown upload")
+    return status
+
+@app.get("/publisher/stats")
+def publisher_stats():
+    return publisher.stats()
 
-    content = await file.read()
-    decoded_content = content.decode("utf-8")
-    csv_reader = csv.reader(io.StringIO(decoded_content))
-    
-    # Skip header
-    next(csv_reader, None)
-
-    connection, channel = get_rabbitmq_channel()
-    
-    count = 0
-    for row in csv_reader:
-        message = ",".join(row)
-        channel.basic_publish(
-            exchange="",
-            routing_key=QUEUE_NAME,
-            body=message,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # make message persistent
-            ))
-        count += 1
-        
-        # Throttling: Halt for 1 sec for each 10 messages
-        if count % 10 == 0:
-            time.sleep(1)
-
-    connection.close()
-    return {"message": f"Processed {count} rows and pushed to {QUEUE_NAME}"}
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
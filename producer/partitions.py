@@ -0,0 +1,27 @@
+import itertools
+import zlib
+
+
+class PartitionedQueue:
+    """A logical queue spread over shard queues, plus an optional priority lane.
+
+    With partitions > 1 the shards are "<name>.0" .. "<name>.<n-1>", each its
+    own queue (and so its own broker process); with 1 the queue keeps its
+    plain name. The priority lane is "<name>.priority". Workers and the
+    scaler derive the same names from the same settings.
+    """
+
+    def __init__(self, name, partitions=1, priority_lane=False):
+        self.name = name
+        self.shards = [f"{name}.{i}" for i in range(partitions)] if partitions > 1 else [name]
+        self.priority = f"{name}.priority" if priority_lane else None
+        self.queues = self.shards + ([self.priority] if self.priority else [])
+        self._turn = itertools.cycle(self.shards)
+
+    def next_shard(self):
+        """Round-robin over the shards, shared by all uploads to this queue."""
+        return next(self._turn)
+
+    def shard_for(self, key):
+        """The shard a partition key always maps to (crc32, so stable across restarts)."""
+        return self.shards[zlib.crc32(key.encode()) % len(self.shards)]
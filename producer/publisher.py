@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import functools
+import time
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+POOL_SIZE = 4
+CONFIRM_WINDOW = 512  # unconfirmed messages allowed across the pool
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+SETUP_TIMEOUT = 10.0
+LATENCY_SAMPLES = 1000
+
+
+class PublishError(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ("routing_key", "body", "properties", "future", "sent_at")
+
+    def __init__(self, routing_key, body, properties, future):
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.future = future
+        self.sent_at = 0.0
+
+
+class _PooledChannel:
+    def __init__(self, channel):
+        self.channel = channel
+        self.next_tag = 1
+        # delivery_tag -> _Pending, in publish order
+        self.unconfirmed = collections.OrderedDict()
+
+
+class Publisher:
+    """Long-lived, confirm-mode publisher running on the asyncio event loop.
+
+    One AsyncioConnection carries a pool of channels in publisher-confirm
+    mode. publish() only waits for a slot in the confirm window, writes the
+    message and returns a future that resolves to the publish->confirm
+    latency once the broker acks it, so many messages (and many uploads) are
+    in flight at once and `multiple` acks settle whole batches. On connection
+    loss the pool reconnects with backoff and republishes every unconfirmed
+    message.
+    """
+
+    def __init__(self, host, queues, pool_size=POOL_SIZE, window=CONFIRM_WINDOW, on_blocked=None, on_unblocked=None):
+        self.parameters = pika.ConnectionParameters(host=host, heartbeat=30)
+        self.queues = queues
+        self.pool_size = pool_size
+        self.window = window
+        self.on_blocked = on_blocked
+        self.on_unblocked = on_unblocked
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.encode_errors = 0
+        self.republished = 0
+        self.reconnects = 0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._loop = None
+        self._slots = None
+        self._ready = None
+        self._connection = None
+        self._channels = []
+        self._next_channel = 0
+        self._closing = False
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.window)
+        self._ready = asyncio.Event()
+        self._loop.create_task(self._reconnect([]))
+
+    async def stop(self, timeout=10):
+        self._closing = True
+        deadline = time.monotonic() + timeout
+        while self.in_flight() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._connection and self._connection.is_open:
+            self._connection.close()
+
+    async def publish(self, body, properties=None, routing_key=None):
+        """Send one message; returns a future resolved when it is confirmed."""
+        await self._slots.acquire()
+        entry = _Pending(routing_key or self.queues[0], body, properties, self._loop.create_future())
+        entry.future.add_done_callback(lambda _: self._slots.release())
+        try:
+            await self._send(entry)
+        except BaseException:
+            entry.future.cancel()
+            raise
+        self.published += 1
+        return entry.future
+
+    def in_flight(self):
+        return sum(len(ch.unconfirmed) for ch in self._channels)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2) if latencies else 0
+
+        return {
+            "connected": bool(self._ready and self._ready.is_set()),
+            "channels": len(self._channels),
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "nacked": self.nacked,
+            "encode_errors": self.encode_errors,
+            "republished": self.republished,
+            "reconnects": self.reconnects,
+            "in_flight": self.in_flight(),
+            "window": self.window,
+            "latency_ms": {
+                "avg": round(self.latency_avg * 1000, 2),
+                "p50": pct(0.5),
+                "p99": pct(0.99),
+                "max": round(self.latency_max * 1000, 2),
+            },
+        }
+
+    async def _send(self, entry):
+        while True:
+            await self._ready.wait()
+            # Round-robin over the pool keeps channels evenly loaded
+            pc = self._channels[self._next_channel % len(self._channels)]
+            self._next_channel += 1
+            try:
+                pc.channel.basic_publish("", entry.routing_key, entry.body, entry.properties)
+            except pika.exceptions.ProtocolSyntaxError as e:
+                # The message itself cannot be encoded (e.g. an unsupported header value);
+                # retrying would never succeed, so it fails like a nacked one
+                self.encode_errors += 1
+                entry.future.set_exception(PublishError(f"Cannot encode message for {entry.routing_key}: {e}"))
+                return
+            except (pika.exceptions.AMQPError, OSError) as e:
+                # The close callback will requeue in-flight messages and reconnect
+                print(f"Publish failed, waiting for reconnect: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            entry.sent_at = time.monotonic()
+            pc.unconfirmed[pc.next_tag] = entry
+            pc.next_tag += 1
+            return
+
+    def _on_confirm(self, pc, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = []
+            for tag in pc.unconfirmed:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag]
+
+        now = time.monotonic()
+        for tag in tags:
+            entry = pc.unconfirmed.pop(tag, None)
+            if entry is None or entry.future.done():
+                continue
+            if acked:
+                latency = now - entry.sent_at
+                self.confirmed += 1
+                self.latency_avg += 0.05 * (latency - self.latency_avg)
+                self.latency_max = max(self.latency_max, latency)
+                self._latencies.append(latency)
+                entry.future.set_result(latency)
+            else:
+                self.nacked += 1
+                entry.future.set_exception(PublishError(f"Broker nacked message on {entry.routing_key}"))
+
+    async def _reconnect(self, retry):
+        delay = RECONNECT_DELAY
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._connect(), SETUP_TIMEOUT)
+                break
+            except Exception as e:
+                if self._connection and self._connection.is_open:
+                    self._connection.close()
+                self._connection = None
+                print(f"Waiting for RabbitMQ... {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        else:
+            for entry in retry:
+                if not entry.future.done():
+                    entry.future.set_exception(PublishError("Publisher closed"))
+            return
+
+        self._ready.set()
+        for entry in retry:
+            if not entry.future.done():
+                await self._send(entry)
+                self.republished += 1
+
+    async def _connect(self):
+        opened = self._loop.create_future()
+
+        def on_open(conn):
+            if opened.done():
+                # Setup already timed out; don't leak the late connection
+                conn.close()
+            else:
+                opened.set_result(conn)
+
+        def on_open_error(conn, exc):
+            if not opened.done():
+                opened.set_exception(exc)
+
+        AsyncioConnection(
+            self.parameters,
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._loop,
+        )
+        conn = self._connection = await opened
+        if self.on_blocked:
+            conn.add_on_connection_blocked_callback(self.on_blocked)
+        if self.on_unblocked:
+            conn.add_on_connection_unblocked_callback(self.on_unblocked)
+
+        channels = []
+        for _ in range(self.pool_size):
+            channels.append(await self._open_channel(conn))
+        self._channels = channels
+        print(f"Publisher connected with {len(channels)} channels")
+
+    async def _open_channel(self, conn):
+        done = self._loop.create_future()
+
+        def resolve(*args):
+            if not done.done():
+                done.set_result(args[0] if args else None)
+
+        conn.channel(on_open_callback=resolve)
+        channel = await done
+        channel.add_on_close_callback(self._on_channel_closed)
+        for queue in self.queues:
+            done = self._loop.create_future()
+            channel.queue_declare(queue=queue, durable=True, callback=resolve)
+            await done
+
+        pc = _PooledChannel(channel)
+        done = self._loop.create_future()
+        channel.confirm_delivery(ack_nack_callback=functools.partial(self._on_confirm, pc), callback=resolve)
+        await done
+        return pc
+
+    def _on_channel_closed(self, channel, reason):
+        # A channel-level error poisons its delivery tags; recycle the whole connection
+        conn = self._connection
+        if not self._closing and conn is not None and conn.is_open:
+            print(f"Channel closed ({reason}), reconnecting")
+            conn.close()
+
+    def _on_connection_closed(self, conn, reason):
+        if conn is not self._connection:
+            return
+        self._connection = None
+        if not self._ready.is_set():
+            # Still setting up: _reconnect times out and retries on its own
+            return
+        self._ready.clear()
+        retry = [entry for pc in self._channels for entry in pc.unconfirmed.values()]
+        self._channels = []
+        if not self._closing:
+            print(f"Publisher connection lost ({reason}), republishing {len(retry)} unconfirmed messages")
+            self.reconnects += 1
+        self._loop.create_task(self._reconnect(retry))
+
+
+class ConfirmTracker:
+    """Collects confirm futures for one upload and counts the outcomes."""
+
+    def __init__(self, on_confirm=None):
+        self.on_confirm = on_confirm
+        self.confirmed = 0
+        self.failed = 0
+        self._pending = set()
+
+    def add(self, future):
+        self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._pending.discard(future)
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+            return
+        self.confirmed += 1
+        if self.on_confirm:
+            self.on_confirm(future.result())
+
+    async def wait(self):
+        if self._pending:
+            await asyncio.wait(list(self._pending))
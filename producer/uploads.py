@@ -0,0 +1,345 @@
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import pika
+
+from envelope import Batcher, encode_batch
+from flow import FlowController
+from ingest import CHUNK_SIZE, CsvStream
+from publisher import ConfirmTracker
+
+SPOOL_READ_BYTES = 256 * 1024  # rows per checkpoint come from one aligned read of this size
+RATE_WINDOW = 30.0  # seconds of checkpoints behind the reported rate and ETA
+
+
+def epoch_ms(t):
+    return int(t * 1000)
+
+
+class UploadPublication:
+    """Publishes one upload's rows: pacing, optional batching and confirms.
+
+    Used both by the synchronous /upload and by spooled uploads. `turn` is a
+    lock shared by all publications; holding it only around the publish call
+    makes concurrent uploads take turns (asyncio.Lock wakes waiters in FIFO
+    order), so a large upload cannot starve a small one. Pacing by each
+    upload's own flow controller happens outside the turn.
+
+    Every message gets message_id "<upload_id>:<row offset of its first
+    row>" and a content_hash header, so workers can recognise a redelivery
+    or a republished row as already processed. `first_row` is the offset
+    of the first row passed in, for an upload resumed part way through.
+    For tracing, messages also carry x-trace-id (the upload id),
+    x-uploaded-at (when the upload was accepted, `uploaded_at`) and
+    x-enqueued-at (when the message was handed to the publisher), both
+    int epoch milliseconds: AMQP tables cannot carry floats.
+
+    `layout` is the target queue's PartitionedQueue. Messages go round-robin
+    over its shards, or with partition="hash" to the shard of the row's
+    `partition_key` column, so rows with the same key stay in order on one
+    shard; batches are then kept per shard. priority=True sends everything
+    to the priority lane.
+    """
+
+    def __init__(self, publisher, monitor, layout, params, turn, on_confirm=None, upload_id=None, first_row=0,
+                 uploaded_at=None):
+        self.publisher = publisher
+        self.upload_id = upload_id or uuid.uuid4().hex[:12]
+        self.first_row = first_row
+        self.uploaded_at = uploaded_at or time.time()
+        self.layout = layout
+        self.partition = params.get("partition", "round_robin")
+        self.partition_key = params.get("partition_key", 0)
+        self.priority = params.get("priority", False)
+        self.compress = params["compress"]
+        self.turn = turn
+        self.flow = FlowController(
+            monitor,
+            max_rate=params["max_rate"],
+            min_rate=params["min_rate"],
+            high_watermark=params["high_watermark"],
+            low_watermark=params["low_watermark"],
+            latency_target=params["latency_target"],
+        )
+        self.batch_rows = params["batch_rows"]
+        self.batch_bytes = params["batch_bytes"]
+        # Target queue (None: the next shard in turn) -> (Batcher, row offset of its first row)
+        self._batches = {}
+        self.confirms = ConfirmTracker(on_confirm=self._on_confirm)
+        self.on_confirm = on_confirm
+        self.rows = 0
+        self.messages = 0
+
+    def _on_confirm(self, latency):
+        if self.on_confirm:
+            self.on_confirm(latency)
+        self.flow.record_confirm(latency)
+
+    def _target(self, row):
+        if self.priority:
+            return self.layout.priority
+        if self.partition == "hash":
+            return self.layout.shard_for(row[self.partition_key] if self.partition_key < len(row) else "")
+        return None
+
+    async def _publish(self, body, properties, row, target):
+        properties.message_id = f"{self.upload_id}:{self.first_row + row}"
+        properties.headers = {**(properties.headers or {}),
+                              "content_hash": hashlib.blake2b(body, digest_size=8).hexdigest(),
+                              "x-trace-id": self.upload_id,
+                              "x-uploaded-at": epoch_ms(self.uploaded_at)}
+        await self.flow.wait()
+        async with self.turn:
+            queue = target or self.layout.next_shard()
+            properties.headers["x-enqueued-at"] = epoch_ms(time.time())
+            self.confirms.add(await self.publisher.publish(body, properties, routing_key=queue))
+        self.messages += 1
+
+    async def publish_rows(self, rows):
+        for row in rows:
+            message = ",".join(row)
+            self.rows += 1
+            target = self._target(row)
+            if self.batch_rows <= 1:
+                await self._publish(message.encode(), pika.BasicProperties(delivery_mode=2), self.rows - 1, target)
+                continue
+            batch = self._batches.get(target)
+            if batch is None:
+                batch = self._batches[target] = (Batcher(self.batch_rows, self.batch_bytes), self.rows - 1)
+            if batch[0].add(message):
+                del self._batches[target]
+                await self._publish(*encode_batch(batch[0].take(), self.compress), batch[1], target)
+
+    async def flush(self):
+        """Publish any partial batches and wait until the broker confirmed everything so far."""
+        batches, self._batches = self._batches, {}
+        for target, (batcher, first) in batches.items():
+            await self._publish(*encode_batch(batcher.take(), self.compress), first, target)
+        await self.confirms.wait()
+
+
+class UploadManager:
+    """Spooled uploads: accepted to disk at once, published in the background.
+
+    Each upload is written to <spool_dir>/<id>.csv with a <id>.json record
+    next to it. Up to `concurrency` uploads publish at a time, the rest wait
+    in arrival order. The record is checkpointed after every spool read
+    whose rows are all confirmed: the byte offset of the last complete CSV
+    record and the rows published so far. Uploads left unfinished by a
+    restart resume from their checkpoint; rows published after it may be
+    published again, with the same message ids: reads are aligned to
+    multiples of SPOOL_READ_BYTES in the file, so a resumed upload groups
+    rows into the same messages. The spooled CSV is removed once the
+    upload is done or has failed, and the record `retention` seconds after
+    that. Spool and record file I/O runs in worker threads, off the event loop.
+    """
+
+    def __init__(self, spool_dir, make_publication, concurrency=4, on_progress=None, retention=86400):
+        self.spool_dir = spool_dir
+        self.retention = retention  # seconds finished records stay listed (and on disk)
+        self.make_publication = make_publication  # (params, turn, upload_id, first_row, uploaded_at) -> UploadPublication
+        self.concurrency = concurrency
+        self.on_progress = on_progress  # (rows, messages, failed) published since the last call
+        self.uploads = {}  # id -> record
+        self._rates = {}  # id -> deque of (monotonic time, rows, offset) checkpoints
+        self._tasks = {}
+        self._slots = None
+        self.turn = None
+
+    async def start(self):
+        # Created here so they belong to the running loop
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.turn = asyncio.Lock()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        pending = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.spool_dir, name)) as f:
+                record = json.load(f)
+            self.uploads[record["id"]] = record
+            if self._expired(record):
+                self._forget(record["id"])
+                continue
+            if record["state"] in ("queued", "publishing"):
+                pending.append(record)
+        for record in sorted(pending, key=lambda r: r["created_at"]):
+            print(f"Resuming upload {record['id']} at byte {record['offset']}")
+            record["state"] = "queued"
+            self._schedule(record)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _path(self, upload_id, ext):
+        return os.path.join(self.spool_dir, f"{upload_id}.{ext}")
+
+    async def _save(self, record):
+        # Serialized here, while no other code can touch the record; written in a thread
+        data = json.dumps(record)
+        await asyncio.to_thread(self._write, record["id"], data)
+
+    def _write(self, upload_id, data):
+        # Write then rename, so a crash never leaves a half-written record
+        tmp = self._path(upload_id, "json.tmp")
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self._path(upload_id, "json"))
+
+    def _remove(self, upload_id, *exts):
+        for ext in exts:
+            try:
+                os.remove(self._path(upload_id, ext))
+            except FileNotFoundError:
+                pass
+
+    def _expired(self, record):
+        finished = record.get("finished_at")
+        return record["state"] in ("done", "failed") and finished and finished < time.time() - self.retention
+
+    def _forget(self, upload_id):
+        self.uploads.pop(upload_id, None)
+        self._remove(upload_id, "csv", "json")
+
+    async def _expire(self):
+        """Drop finished records older than `retention`, from the listing and the spool."""
+        for upload_id in [r["id"] for r in self.uploads.values() if self._expired(r)]:
+            self.uploads.pop(upload_id, None)
+            await asyncio.to_thread(self._remove, upload_id, "csv", "json")
+
+    async def accept(self, file, params):
+        """Spool an UploadFile and queue it; returns the new record."""
+        upload_id = uuid.uuid4().hex[:12]
+        size = 0
+        out = await asyncio.to_thread(open, self._path(upload_id, "csv"), "wb")
+        try:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(out.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            # Client gone or disk full: nothing refers to the partial spool
+            out.close()
+            await asyncio.to_thread(self._remove, upload_id, "csv")
+            raise
+        await asyncio.to_thread(out.close)
+        record = {
+            "id": upload_id,
+            "filename": file.filename,
+            "params": params,
+            "state": "queued",
+            "bytes_total": size,
+            "offset": 0,  # bytes of the spool published and confirmed
+            "rows_published": 0,
+            "messages": 0,
+            "failed": 0,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self.uploads[upload_id] = record
+        await self._save(record)
+        self._schedule(record)
+        return record
+
+    def _schedule(self, record):
+        task = asyncio.ensure_future(self._run(record))
+        self._tasks[record["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(record["id"], None))
+
+    async def _run(self, record):
+        async with self._slots:
+            record["state"] = "publishing"
+            record["started_at"] = record["started_at"] or time.time()
+            await self._save(record)
+            try:
+                await self._drain(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Upload {record['id']} failed: {e}")
+                record["state"] = "failed"
+                record["error"] = str(e)
+            else:
+                record["state"] = "done"
+            # A failed upload is not retried, so its spool is dropped too
+            await asyncio.to_thread(self._remove, record["id"], "csv")
+            record["finished_at"] = time.time()
+            await self._save(record)
+            self._rates.pop(record["id"], None)
+        await self._expire()
+
+    async def _drain(self, record):
+        publication = self.make_publication(
+            record["params"], self.turn, record["id"], record["rows_published"], record["created_at"]
+        )
+        # Publishing starts right after the header, or after the last checkpoint
+        parser = CsvStream()
+        header_pending = record["offset"] == 0
+        base = record["offset"]
+        rows0, messages0, failed0 = record["rows_published"], record["messages"], record["failed"]
+        rates = self._rates.setdefault(record["id"], collections.deque())
+        rates.append((time.monotonic(), record["rows_published"], record["offset"]))
+        with open(self._path(record["id"], "csv"), "rb") as spool:
+            spool.seek(base)
+            while True:
+                chunk = await asyncio.to_thread(spool.read, SPOOL_READ_BYTES - spool.tell() % SPOOL_READ_BYTES)
+                rows = parser.feed(chunk) if chunk else parser.finish()
+                if header_pending and rows:
+                    rows = rows[1:]
+                    header_pending = False
+                await publication.publish_rows(rows)
+                await publication.flush()
+                if self.on_progress:
+                    self.on_progress(
+                        rows0 + publication.rows - record["rows_published"],
+                        messages0 + publication.messages - record["messages"],
+                        failed0 + publication.confirms.failed - record["failed"],
+                    )
+                record["rows_published"] = rows0 + publication.rows
+                record["messages"] = messages0 + publication.messages
+                record["failed"] = failed0 + publication.confirms.failed
+                record["offset"] = base + parser.offset if chunk else record["bytes_total"]
+                await self._save(record)
+                now = time.monotonic()
+                rates.append((now, record["rows_published"], record["offset"]))
+                while len(rates) > 2 and rates[0][0] < now - RATE_WINDOW:
+                    rates.popleft()
+                if not chunk:
+                    break
+        record["flow_control"] = publication.flow.report()
+
+    def status(self, upload_id):
+        record = self.uploads.get(upload_id)
+        if record is None:
+            return None
+        status = {k: v for k, v in record.items() if k != "params"}
+        status["queue"] = record["params"]["queue"]
+        status["priority"] = record["params"].get("priority", False)
+        status["progress"] = round(record["offset"] / record["bytes_total"], 4) if record["bytes_total"] else 1.0
+        rates = self._rates.get(upload_id)
+        rows_per_s = eta = None
+        if rates and len(rates) > 1:
+            (t0, rows0, offset0), (t1, rows1, offset1) = rates[0], rates[-1]
+            if t1 > t0:
+                rows_per_s = round((rows1 - rows0) / (t1 - t0), 2)
+                bytes_per_s = (offset1 - offset0) / (t1 - t0)
+                if bytes_per_s > 0:
+                    eta = round((record["bytes_total"] - offset1) / bytes_per_s, 1)
+        status["rows_per_s"] = rows_per_s
+        status["eta_s"] = eta
+        return status
+
+    def statuses(self):
+        return [self.status(upload_id) for upload_id in self.uploads]
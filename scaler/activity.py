@@ -0,0 +1,66 @@
+import collections
+import threading
+import time
+
+
+class ActivityTracker:
+    """Per-worker last activity and recent throughput, fed by progress reports.
+
+    A worker is idle once it has processed nothing and had nothing in flight
+    for `idle_after` seconds (counted from its start if it never reported).
+    removal_order() ranks workers for scale-down: idle ones first, then the
+    lowest recent throughput, then the longest since their last report, so
+    surplus workers can be removed while others are still draining the queue.
+    """
+
+    def __init__(self, window=60.0, idle_after=30.0, clock=time.time):
+        self.window = window
+        self.idle_after = idle_after
+        self.clock = clock
+        self._last_active = {}  # name -> time of the last report with work in it
+        self._events = collections.defaultdict(collections.deque)  # name -> (time, messages)
+        self._lock = threading.Lock()
+
+    def record(self, name, messages, in_flight=0):
+        if messages <= 0 and in_flight <= 0:
+            return
+        now = self.clock()
+        with self._lock:
+            self._last_active[name] = now
+            if messages > 0:
+                events = self._events[name]
+                events.append((now, messages))
+                self._expire(events, now)
+
+    def _expire(self, events, now):
+        while events and events[0][0] < now - self.window:
+            events.popleft()
+
+    def rate(self, name):
+        """Messages/s over the last `window` seconds."""
+        now = self.clock()
+        with self._lock:
+            events = self._events.get(name)
+            if not events:
+                return 0.0
+            self._expire(events, now)
+            return sum(n for _, n in events) / self.window
+
+    def idle_for(self, name, started):
+        with self._lock:
+            return self.clock() - self._last_active.get(name, started)
+
+    def is_idle(self, name, started):
+        return self.idle_for(name, started) >= self.idle_after
+
+    def removal_order(self, started):
+        """Names from `started` (name -> start time, epoch seconds), best to remove first."""
+        def rank(name):
+            idle_for = self.idle_for(name, started[name])
+            return (idle_for < self.idle_after, self.rate(name), -idle_for)
+        return sorted(started, key=rank)
+
+    def forget(self, name):
+        with self._lock:
+            self._last_active.pop(name, None)
+            self._events.pop(name, None)
@@ -0,0 +1,85 @@
+import json
+import re
+from dataclasses import dataclass, field, fields
+from typing import Dict, List
+
+BINDING_LABEL = "queue-binding"  # on every worker Job and pod; value is the binding name
+SHARDS_ANNOTATION = "kube-job/shards"  # on worker Jobs of a partitioned queue: the shard indexes it consumes
+NAME_PATTERN = re.compile(r"^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$")  # also a valid label value
+
+
+@dataclass
+class Binding:
+    """One queue and the worker profile the scaler runs for it."""
+    name: str
+    queue: str
+    image: str = "worker:latest"
+    max_jobs: int = 3
+    threshold: int = 20  # threshold policy: ready messages that call for another job
+    burst: int = 5  # threshold policy: jobs added per tick above twice the threshold
+    policy: str = "threshold"  # "threshold" or "rate"
+    weight: float = 1.0  # share of the global job budget when queues compete for it
+    env: Dict[str, str] = field(default_factory=dict)  # extra worker env, e.g. WORKER_CONCURRENCY
+    partitions: int = 1  # shard queues <queue>.0 .. <queue>.<n-1>; must match the producer's QUEUE_PARTITIONS
+    priority_lane: bool = False  # also a <queue>.priority queue, consumed by every worker
+    shards_per_worker: int = 0  # shards each job consumes; 0 = all of them
+
+    def splits_shards(self) -> bool:
+        """Whether each job consumes only some of the shards."""
+        return 0 < self.shards_per_worker < self.partitions
+
+    def shards(self) -> List[str]:
+        if self.partitions > 1:
+            return [f"{self.queue}.{i}" for i in range(self.partitions)]
+        return [self.queue]
+
+    def queues(self) -> List[str]:
+        """Every broker queue holding this binding's backlog."""
+        return ([f"{self.queue}.priority"] if self.priority_lane else []) + self.shards()
+
+
+def load_bindings(path, default):
+    """Bindings from the JSON config at `path`, or just `default` when there is none.
+
+    The file looks like {"max_total_jobs": 10, "bindings": [{"name": "...",
+    "queue": "...", ...}]}; fields a binding leaves out are taken from
+    `default`. Returns (bindings, max_total_jobs), the latter None if unset.
+    Raises ValueError for a config the scaler cannot run with.
+    """
+    if not path:
+        return [default], None
+    with open(path) as f:
+        config = json.load(f)
+
+    known = {f.name for f in fields(Binding)}
+    bindings = []
+    for entry in config.get("bindings", []):
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown binding fields: {', '.join(sorted(unknown))}")
+        values = {f.name: getattr(default, f.name) for f in fields(Binding)}
+        values.update(entry)
+        values["env"] = {k: str(v) for k, v in values["env"].items()}
+        bindings.append(Binding(**values))
+
+    if not bindings:
+        raise ValueError(f"{path} defines no bindings")
+    names = [b.name for b in bindings]
+    for name in names:
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Binding name {name!r} must be a lowercase DNS label")
+    if len(set(names)) != len(names):
+        raise ValueError("Binding names must be unique")
+    for b in bindings:
+        # fair_share divides by the weights
+        if b.weight <= 0:
+            raise ValueError(f"Binding {b.name}: weight must be > 0")
+        if b.partitions < 1 or not 0 <= b.shards_per_worker <= b.partitions:
+            raise ValueError(f"Binding {b.name}: need partitions >= 1 and 0 <= shards_per_worker <= partitions")
+        if b.splits_shards() and b.max_jobs * b.shards_per_worker < b.partitions:
+            raise ValueError(f"Binding {b.name}: max_jobs * shards_per_worker must cover all {b.partitions} shards")
+    queues = [q for b in bindings for q in b.queues()]
+    if len(set(queues)) != len(queues):
+        raise ValueError("Each queue can only be bound once")
+    max_total = config.get("max_total_jobs")
+    return bindings, int(max_total) if max_total is not None else None
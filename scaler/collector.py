@@ -0,0 +1,128 @@
+import collections
+import concurrent.futures
+
+import pika
+import requests
+
+
+class BrokerStats:
+    """Ready/unacked counts for a set of queues over connections kept open between ticks.
+
+    All queues come from one management API call (/api/queues for the
+    vhost, only the needed columns) through a keep-alive requests.Session.
+    If that fails, ready counts come from passive queue_declares on an AMQP
+    channel that also stays open between calls (unacked keeps its last
+    value). Either connection is only reopened after an error. fetch()
+    raises if both fail, so the caller can keep its last known values instead
+    of mistaking an outage for empty queues. A queue the broker does not
+    have yet reads as empty.
+    """
+
+    def __init__(self, host, queues, auth=("guest", "guest"), timeout=2):
+        self.url = f"http://{host}:15672/api/queues/%2F"
+        self.queues = list(queues)
+        self.auth = auth
+        self.timeout = timeout
+        self.params = pika.ConnectionParameters(host=host, socket_timeout=timeout, blocked_connection_timeout=timeout)
+        self.unacked = {queue: 0 for queue in self.queues}
+        self.session = requests.Session()
+        self._connection = None
+        self._channel = None
+
+    def fetch(self):
+        """queue -> (ready, unacked)"""
+        try:
+            res = self.session.get(
+                self.url,
+                params={"columns": "name,messages_ready,messages_unacknowledged"},
+                auth=self.auth,
+                timeout=self.timeout,
+            )
+            res.raise_for_status()
+            found = {q["name"]: q for q in res.json() if q.get("name") in self.unacked}
+            stats = {}
+            for queue in self.queues:
+                data = found.get(queue, {})
+                self.unacked[queue] = data.get("messages_unacknowledged", 0)
+                stats[queue] = (data.get("messages_ready", 0), self.unacked[queue])
+            return stats
+        except Exception as e:
+            print(f"Error fetching RabbitMQ stats, trying AMQP: {e}")
+        return {queue: (self._declare_passive(queue), self.unacked[queue]) for queue in self.queues}
+
+    def _declare_passive(self, queue):
+        try:
+            if self._connection is None or not self._connection.is_open:
+                self.close()
+                self._connection = pika.BlockingConnection(self.params)
+            if self._channel is None or not self._channel.is_open:
+                self._channel = self._connection.channel()
+            return self._channel.queue_declare(queue=queue, passive=True).method.message_count
+        except pika.exceptions.ChannelClosedByBroker as e:
+            # 404: not declared yet; the broker closes the channel, the connection stays
+            self._channel = None
+            if e.reply_code == 404:
+                return 0
+            raise
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+
+
+class TickCollector:
+    """Gathers one tick's inputs concurrently under a single deadline.
+
+    `sources` maps a name to a zero-argument callable; collect() runs them
+    all on a small pool and waits at most `deadline` seconds. A source that
+    fails or is still running keeps its last value (`defaults` before the
+    first success) and is reported as stale. A source still running from an
+    earlier tick is not started again; its result is used once it arrives.
+    missing() names the sources that have not succeeded yet, whose value is
+    still the default rather than an observation.
+    """
+
+    def __init__(self, sources, defaults, deadline=2.0):
+        self.sources = sources
+        self.deadline = deadline
+        self.last = dict(defaults)
+        self.collected = set()  # names that succeeded at least once
+        self.stale = collections.Counter()  # name -> ticks that used a stale value
+        self._pending = {}  # name -> future from an earlier tick that missed its deadline
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(sources), thread_name_prefix="collect"
+        )
+
+    def collect(self):
+        """Returns (values, names of the sources whose value is stale)."""
+        futures = {}
+        for name, source in self.sources.items():
+            pending = self._pending.pop(name, None)
+            futures[name] = pending if pending is not None else self._executor.submit(source)
+        concurrent.futures.wait(futures.values(), timeout=self.deadline)
+
+        stale = []
+        for name, future in futures.items():
+            if not future.done():
+                self._pending[name] = future
+                stale.append(name)
+            elif future.exception() is not None:
+                print(f"Error collecting {name}: {future.exception()}")
+                stale.append(name)
+            else:
+                self.last[name] = future.result()
+                self.collected.add(name)
+        self.stale.update(stale)
+        return dict(self.last), stale
+
+    def missing(self, names):
+        """Those of `names` that have never been collected."""
+        return [name for name in names if name not in self.collected]
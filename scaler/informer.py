@@ -0,0 +1,134 @@
+import threading
+import time
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+WATCH_TIMEOUT = 300  # seconds before the server ends a watch and we resume it
+RETRY_DELAY = 2
+
+
+class Informer:
+    """Local cache of Kubernetes objects kept current by list + watch.
+
+    The first sync lists all matching objects and records the list's
+    resourceVersion; after that a watch resumes from the last seen
+    resourceVersion (kept fresh with bookmarks), so the API server only sends
+    changes. A 410 Gone (resourceVersion too old) triggers a full relist.
+    Readers only touch the in-memory store.
+
+    list_func is a namespaced list call such as
+    BatchV1Api.list_namespaced_job; watch_factory returns an object with
+    stream()/stop() like kubernetes.watch.Watch, so a fake stream can be
+    injected. on_delete(obj) is called for every object that disappears,
+    whether seen as a DELETED event or missing from a relist.
+    """
+
+    def __init__(self, list_func, namespace, label_selector, watch_factory=watch.Watch, timeout_seconds=WATCH_TIMEOUT,
+                 on_delete=None):
+        self.list_func = list_func
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.watch_factory = watch_factory
+        self.timeout_seconds = timeout_seconds
+        self.on_delete = on_delete
+        self.resource_version = None
+        self.synced = threading.Event()
+        self.lists = 0
+        self.events = 0
+        self._items = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._watch = None
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._watch:
+            self._watch.stop()
+
+    def items(self):
+        with self._lock:
+            return list(self._items.values())
+
+    def get(self, name):
+        with self._lock:
+            return self._items.get(name)
+
+    def store(self, obj):
+        """Insert an object we just created so readers see it before its watch event."""
+        with self._lock:
+            self._items.setdefault(obj.metadata.name, obj)
+
+    def run(self):
+        while not self._stopped:
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch_once()
+            except ApiException as e:
+                if e.status == 410:
+                    print("Watch expired (410), relisting")
+                    self.resource_version = None
+                else:
+                    print(f"Watch failed: {e}")
+                    time.sleep(RETRY_DELAY)
+            except Exception as e:
+                print(f"Watch failed: {e}")
+                time.sleep(RETRY_DELAY)
+
+    def relist(self):
+        resp = self.list_func(self.namespace, label_selector=self.label_selector)
+        items = {obj.metadata.name: obj for obj in resp.items}
+        with self._lock:
+            gone = [obj for name, obj in self._items.items() if name not in items]
+            self._items = items
+        for obj in gone:
+            self._deleted(obj)
+        self.resource_version = resp.metadata.resource_version
+        self.lists += 1
+        self.synced.set()
+
+    def watch_once(self):
+        """Consume one watch stream until the server closes it."""
+        self._watch = self.watch_factory()
+        stream = self._watch.stream(
+            self.list_func,
+            self.namespace,
+            label_selector=self.label_selector,
+            resource_version=self.resource_version,
+            timeout_seconds=self.timeout_seconds,
+            allow_watch_bookmarks=True,
+        )
+        for event in stream:
+            self.handle(event)
+            if self._stopped:
+                break
+
+    def handle(self, event):
+        kind = event["type"]
+        if kind == "ERROR":
+            raw = event.get("raw_object") or {}
+            raise ApiException(status=raw.get("code"), reason=raw.get("message"))
+
+        obj = event["object"]
+        self.events += 1
+        if kind != "BOOKMARK":
+            with self._lock:
+                if kind == "DELETED":
+                    self._items.pop(obj.metadata.name, None)
+                else:
+                    self._items[obj.metadata.name] = obj
+            if kind == "DELETED":
+                self._deleted(obj)
+        self.resource_version = obj.metadata.resource_version
+
+    def _deleted(self, obj):
+        if self.on_delete:
+            try:
+                self.on_delete(obj)
+            except Exception as e:
+                print(f"on_delete failed for {obj.metadata.name}: {e}")
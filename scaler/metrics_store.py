@@ -0,0 +1,148 @@
+import collections
+import threading
+import time
+import zlib
+
+
+class ShardedCounter:
+    """A counter each thread increments in its own cell.
+
+    Only the owning thread ever writes a cell, so add() needs no lock after
+    a thread's first call; value() sums the cells. Reads can miss an
+    increment that is still in progress but never lose one.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()  # guards _cells registration only
+
+    def add(self, n=1):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0]
+            with self._lock:
+                self._cells.append(cell)
+        cell[0] += n
+
+    def value(self):
+        with self._lock:
+            cells = list(self._cells)
+        return sum(cell[0] for cell in cells)
+
+
+class JobTable:
+    """Per-job processed/messages counts, bounded in size and lifetime.
+
+    Rows live in `shards` LRU maps, each with its own lock, so reports for
+    different jobs rarely contend. A shard holds at most max_jobs / shards
+    rows and evicts its least recently updated one; retire() marks a job
+    whose Job/pod is gone, and expire() drops retired rows after `ttl`.
+    """
+
+    def __init__(self, max_jobs=1000, ttl=600.0, shards=16, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.evicted = 0
+        self._capacity = max(1, max_jobs // shards)
+        self._shards = [collections.OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, name):
+        i = zlib.crc32(name.encode()) % len(self._shards)
+        return self._shards[i], self._locks[i]
+
+    def add(self, name, processed, messages):
+        rows, lock = self._shard(name)
+        with lock:
+            row = rows.get(name)
+            if row is None:
+                row = rows[name] = {"processed": 0, "messages": 0, "retired_at": None}
+                if len(rows) > self._capacity:
+                    rows.popitem(last=False)
+                    self.evicted += 1
+            else:
+                rows.move_to_end(name)
+            row["processed"] += processed
+            row["messages"] += messages
+
+    def processed(self, name):
+        rows, lock = self._shard(name)
+        with lock:
+            row = rows.get(name)
+            return row["processed"] if row else 0
+
+    def retire(self, name):
+        rows, lock = self._shard(name)
+        with lock:
+            if name in rows:
+                rows[name]["retired_at"] = self.clock()
+
+    def expire(self):
+        cutoff = self.clock() - self.ttl
+        for rows, lock in zip(self._shards, self._locks):
+            with lock:
+                for name in [n for n, row in rows.items() if row["retired_at"] is not None and row["retired_at"] < cutoff]:
+                    del rows[name]
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._shards)
+
+
+class MetricsStore:
+    """The scaler's metrics: lock-free counters for report ingest, gauges for the loop.
+
+    Counters (names in `counters`) only go up through incr(); everything
+    else is a gauge set by the scaler loop under one lock. metrics[key]
+    reads either kind, and snapshot() returns a consistent copy of all
+    gauges plus the current counter values, for /stats.
+    """
+
+    def __init__(self, counters, gauges=None, max_jobs=1000, job_ttl=600.0):
+        self._counters = {name: ShardedCounter() for name in counters}
+        self._gauges = dict(gauges or {})
+        self._lock = threading.Lock()
+        self.jobs = JobTable(max_jobs, job_ttl)
+
+    def incr(self, name, n=1):
+        self._counters[name].add(n)
+
+    def __getitem__(self, key):
+        if key in self._counters:
+            return self._counters[key].value()
+        with self._lock:
+            return self._gauges[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._gauges[key] = value
+
+    def update(self, values):
+        with self._lock:
+            self._gauges.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._gauges)
+        values.update({name: counter.value() for name, counter in self._counters.items()})
+        return values
+
+
+class TimeSeries:
+    """Fixed-size ring buffer of per-tick samples for charting recent history."""
+
+    def __init__(self, size=720):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, sample):
+        with self._lock:
+            self._samples.append(sample)
+
+    def since(self, t=0.0):
+        with self._lock:
+            return [s for s in self._samples if s["t"] > t]
+
+    def last(self):
+        with self._lock:
+            return self._samples[-1] if self._samples else None
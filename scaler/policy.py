@@ -0,0 +1,215 @@
+import math
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+MIN_RATE = 0.05  # msg/s; smoothed rates below this are treated as zero
+
+
+@dataclass
+class Observation:
+    """Inputs for one scaling decision, gathered once per tick."""
+    now: float  # monotonic seconds
+    ready: int  # messages waiting in the queue
+    unacked: int  # messages delivered to workers but not acked yet
+    active: int  # worker jobs currently running
+    consumed: int  # cumulative messages reported done by workers
+    idle: int = 0  # active workers that reported no work recently
+
+
+@dataclass
+class Decision:
+    desired: int
+    status: str
+
+
+class ScalingPolicy(ABC):
+    """Turns one Observation per tick into a Decision on the number of jobs."""
+
+    name = "base"
+
+    @abstractmethod
+    def decide(self, obs):
+        """The Decision for this tick's Observation."""
+
+    def describe(self):
+        return {"policy": self.name}
+
+
+class ThresholdPolicy(ScalingPolicy):
+    """The original rules: +1 job above threshold, a burst above twice the
+    threshold, and -1 job per tick after idle_ticks fully idle ticks.
+
+    Once nothing is waiting in the queue, workers that have gone idle are
+    surplus and are all removed at once, even while others are still busy.
+    """
+
+    name = "threshold"
+
+    def __init__(self, threshold, max_jobs, burst=5, idle_ticks=6):
+        self.threshold = threshold
+        self.max_jobs = max_jobs
+        self.burst = burst
+        self.idle_threshold = idle_ticks
+        self.idle_ticks = 0
+
+    def decide(self, obs):
+        total_pending = obs.ready + obs.unacked
+
+        # Scale UP
+        if obs.ready > self.threshold and obs.active < self.max_jobs:
+            count = 1
+            # Burst scaling: If queue is huge (2x threshold), spawn more
+            if obs.ready > self.threshold * 2:
+                count = min(self.burst, self.max_jobs - obs.active)
+            self.idle_ticks = 0
+            return Decision(obs.active + count, f"Scaling Up (+{count})")
+
+        # Scale DOWN: idle workers while the rest finish what is left
+        if obs.ready == 0 and obs.idle > 0:
+            self.idle_ticks = 0
+            return Decision(obs.active - obs.idle, f"Scaling Down (-{obs.idle} idle)")
+
+        if total_pending == 0 and obs.active > 0:
+            self.idle_ticks += 1
+            if self.idle_ticks >= self.idle_threshold:
+                self.idle_ticks = self.idle_threshold - 1  # Keep trying to delete one by one
+                return Decision(obs.active - 1, "Scaling Down")
+            return Decision(obs.active, f"Idle ({self.idle_ticks}/{self.idle_threshold})")
+
+        self.idle_ticks = 0
+        return Decision(obs.active, "Active")
+
+
+class RateEstimator:
+    """EWMA-smoothed arrival and drain rates derived from successive ticks.
+
+    drain = consumed delta / dt (from /report), arrival = backlog delta / dt
+    + drain. Per-worker throughput is only learned while workers are
+    saturated (messages are waiting), otherwise idle workers would drag the
+    estimate down.
+    """
+
+    def __init__(self, alpha=0.3, per_worker=0.5):
+        self.alpha = alpha
+        self.arrival = 0.0
+        self.drain = 0.0
+        self.per_worker = per_worker
+        self._last = None
+
+    def update(self, obs):
+        last, self._last = self._last, obs
+        if last is None:
+            return
+        dt = obs.now - last.now
+        if dt <= 0:
+            return
+        drain = max(0, obs.consumed - last.consumed) / dt
+        backlog_delta = (obs.ready + obs.unacked) - (last.ready + last.unacked)
+        arrival = max(0.0, backlog_delta / dt + drain)
+        self.drain += self.alpha * (drain - self.drain)
+        self.arrival += self.alpha * (arrival - self.arrival)
+        workers = min(obs.active, last.active)
+        if workers > 0 and obs.ready > 0 and last.ready > 0 and drain > 0:
+            self.per_worker += self.alpha * (drain / workers - self.per_worker)
+
+
+class RatePolicy(ScalingPolicy):
+    """Sizes the pool from measured rates instead of fixed thresholds.
+
+    desired = (arrival + backlog / target_drain) / per_worker_throughput,
+    where the backlog also includes what will arrive while new jobs start
+    (startup seconds * arrival rate). Scale-ups apply at once (after
+    up_cooldown); scale-downs need the target to fall below
+    (1 - hysteresis) * current and down_cooldown to have passed since the
+    last change. Enough jobs are always kept to hold the unacked messages
+    (slots_per_worker = prefetch per job), so busy workers are not removed.
+    """
+
+    name = "rate"
+
+    def __init__(self, max_jobs, min_jobs=0, target_drain=60.0, startup=15.0, per_worker=0.5,
+                 slots_per_worker=1, alpha=0.3, hysteresis=0.2, up_cooldown=5.0, down_cooldown=30.0):
+        self.max_jobs = max_jobs
+        self.slots_per_worker = slots_per_worker
+        self.min_jobs = min_jobs
+        self.target_drain = target_drain
+        self.startup = startup
+        self.hysteresis = hysteresis
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.rates = RateEstimator(alpha, per_worker)
+        self.target = 0
+        self._last_change = None
+
+    def target_for(self, obs):
+        per_worker = max(self.rates.per_worker, 1e-3)
+        arrival = self.rates.arrival if self.rates.arrival >= MIN_RATE else 0.0
+        backlog = obs.ready + arrival * self.startup
+        needed = arrival / per_worker + backlog / (per_worker * self.target_drain)
+        needed = max(needed, obs.unacked / self.slots_per_worker)
+        if obs.ready > 0:
+            needed = max(needed, 1)
+        return max(self.min_jobs, min(self.max_jobs, math.ceil(needed)))
+
+    def decide(self, obs):
+        self.rates.update(obs)
+        self.target = self.target_for(obs)
+        since_change = math.inf if self._last_change is None else obs.now - self._last_change
+
+        if self.target > obs.active and since_change >= self.up_cooldown:
+            self._last_change = obs.now
+            return Decision(self.target, f"Scaling Up (+{self.target - obs.active})")
+        if self.target < obs.active * (1 - self.hysteresis):
+            if since_change >= self.down_cooldown:
+                self._last_change = obs.now
+                return Decision(self.target, f"Scaling Down (-{obs.active - self.target})")
+            return Decision(obs.active, f"Cooldown ({int(self.down_cooldown - since_change)}s)")
+        return Decision(obs.active, "Active")
+
+    def describe(self):
+        return {
+            "policy": self.name,
+            "arrival_rate": round(self.rates.arrival, 2),
+            "drain_rate": round(self.rates.drain, 2),
+            "per_worker_rate": round(self.rates.per_worker, 3),
+            "desired_jobs": self.target,
+        }
+
+
+
+def reconcile(policy, obs, max_jobs):
+    """Run one decision; returns it with the job delta to apply (+create / -delete)."""
+    decision = policy.decide(obs)
+    desired = max(0, min(max_jobs, decision.desired))
+    return decision, desired - obs.active
+
+
+def fair_share(demands, capacity, weights=None):
+    """Max-min fair split of `capacity` jobs over `demands` (name -> jobs wanted).
+
+    Each round offers every unsatisfied name its weighted share of what is
+    left; names that need no more than that get their full demand and the
+    rest is offered again to the others. Once everyone left wants more than
+    their share, shares are rounded down and the remaining jobs go to the
+    largest fractions. Returns name -> jobs granted.
+    """
+    weights = weights or {}
+    grants = {name: 0 for name in demands}
+    unmet = {name for name, wanted in demands.items() if wanted > 0}
+    left = capacity
+    while unmet and left > 0:
+        total_weight = sum(weights.get(name, 1.0) for name in unmet)
+        share = {name: left * weights.get(name, 1.0) / total_weight for name in unmet}
+        satisfied = {name for name in unmet if demands[name] - grants[name] <= share[name]}
+        if not satisfied:
+            for name in unmet:
+                grants[name] += int(share[name])
+            left -= sum(int(share[name]) for name in unmet)
+            for name in sorted(unmet, key=lambda n: (int(share[n]) - share[n], n))[:left]:
+                grants[name] += 1
+            break
+        for name in satisfied:
+            left -= demands[name] - grants[name]
+            grants[name] = demands[name]
+        unmet -= satisfied
+    return grants
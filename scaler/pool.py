@@ -0,0 +1,138 @@
+import collections
+import threading
+import time
+
+from kubernetes import client
+
+MEMBER_TIMEOUT = 10  # seconds without an assignment poll before a pod is presumed gone
+DELETION_COST = "controller.kubernetes.io/pod-deletion-cost"
+
+
+class WarmPool:
+    """Capacity from a Deployment of long-lived workers instead of new Jobs.
+
+    Pool workers connect to RabbitMQ at startup but only consume while the
+    scaler has them marked active; they poll /pool/assignment/<pod> and the
+    poll doubles as their liveness signal. resize(target) first activates
+    warm standby pods (no pod creation, just the next poll); a pod that
+    joins while the target is unmet is activated on its first poll. It keeps the
+    Deployment at target + spare replicas so new standby pods are started in
+    the background. Before shrinking the Deployment, standby pods get a low
+    pod-deletion-cost so the ReplicaSet removes them rather than active ones.
+
+    pod_lookup (name -> pod or None, e.g. Informer.get) lets terminating pods
+    drop out before their polls time out; on_activate(pod, requested_at) is
+    called for every activation with the time that unit of capacity was
+    asked for (so waits for a cold replica count as cold start); clock is
+    injectable for simulation.
+    """
+
+    def __init__(self, apps_v1, core_v1, namespace, deployment, spare=2, max_size=100,
+                 pod_lookup=None, on_activate=None, clock=time.time):
+        self.apps_v1 = apps_v1
+        self.core_v1 = core_v1
+        self.namespace = namespace
+        self.deployment = deployment
+        self.spare = spare
+        self.max_size = max_size
+        self.target = 0
+        self.replicas = None
+        self.active = {}  # pod -> activation time (epoch seconds)
+        self.members = {}  # pod -> {"first_seen", "last_seen"}
+        self._requests = collections.deque()  # request times of capacity not yet activated
+        self.pod_lookup = pod_lookup
+        self.on_activate = on_activate
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def poll(self, pod):
+        """Called for every assignment poll; returns whether the pod should consume."""
+        if self._terminating(pod):
+            return False
+        now = self.clock()
+        with self._lock:
+            member = self.members.setdefault(pod, {"first_seen": now})
+            member["last_seen"] = now
+            if pod not in self.active and len(self.active) < self.target:
+                self._activate(pod)
+            return pod in self.active
+
+    def _activate(self, pod):
+        self.active[pod] = now = self.clock()
+        requested_at = self._requests.popleft() if self._requests else now
+        if self.on_activate:
+            self.on_activate(pod, requested_at)
+
+    def _terminating(self, pod):
+        obj = self.pod_lookup(pod) if self.pod_lookup else None
+        return obj is not None and obj.metadata.deletion_timestamp is not None
+
+    def live_members(self):
+        cutoff = self.clock() - MEMBER_TIMEOUT
+        with self._lock:
+            for pod in [p for p, m in self.members.items() if m["last_seen"] < cutoff or self._terminating(p)]:
+                del self.members[pod]
+                self.active.pop(pod, None)
+            return dict(self.members)
+
+    def active_since(self):
+        with self._lock:
+            return dict(self.active)
+
+    def resize(self, target, removal_order=None):
+        """Set the wanted number of consuming workers.
+
+        removal_order lists active pods best-to-deactivate first (e.g. idle
+        ones); by default the most recently activated go first.
+        """
+        members = self.live_members()
+        with self._lock:
+            self.target = max(0, min(self.max_size, target))
+            if len(self.active) > self.target:
+                order = [p for p in removal_order or () if p in self.active]
+                order += sorted((p for p in self.active if p not in order), key=self.active.get, reverse=True)
+                for pod in order[:len(self.active) - self.target]:
+                    del self.active[pod]
+            unmet = self.target - len(self.active)
+            while len(self._requests) > unmet:
+                self._requests.pop()
+            while len(self._requests) < unmet:
+                self._requests.append(self.clock())
+            standby = sorted((p for p in members if p not in self.active), key=lambda p: members[p]["first_seen"])
+            for pod in standby[:unmet]:
+                self._activate(pod)
+            standby = [p for p in members if p not in self.active]
+
+        replicas = min(self.max_size, self.target + self.spare)
+        if replicas != self.replicas:
+            try:
+                if self.replicas is not None and replicas < self.replicas:
+                    self._prefer_deleting(standby)
+                self.apps_v1.patch_namespaced_deployment_scale(
+                    self.deployment, self.namespace, {"spec": {"replicas": replicas}}
+                )
+                print(f"Scaled {self.deployment} to {replicas} replicas ({self.target} active)")
+                self.replicas = replicas
+            except Exception as e:
+                print(f"Failed to scale {self.deployment}: {e}")
+
+    def _prefer_deleting(self, pods):
+        for pod in pods:
+            try:
+                self.core_v1.patch_namespaced_pod(
+                    pod, self.namespace, {"metadata": {"annotations": {DELETION_COST: "-100"}}}
+                )
+            except client.exceptions.ApiException as e:
+                print(f"Failed to annotate {pod}: {e}")
+
+    def rows(self):
+        members = self.live_members()
+        with self._lock:
+            return [
+                {
+                    "name": pod,
+                    "status": "Active" if pod in self.active else "Standby",
+                    "start_time": time.strftime("%H:%M:%S", time.localtime(m["first_seen"])),
+                }
+                for pod, m in members.items()
+            ]
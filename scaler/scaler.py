@@ -1,56 +1,287 @@
-import pika
 import time
 import os
+import collections
+import json
 import uuid
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import psutil
 from kubernetes import client, config
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from urllib3.exceptions import ReadTimeoutError
 import uvicorn
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from activity import ActivityTracker
+from bindings import BINDING_LABEL, SHARDS_ANNOTATION, Binding, load_bindings
+from collector import BrokerStats, TickCollector
+from informer import Informer
+from metrics_store import MetricsStore, ShardedCounter, TimeSeries
+from policy import Decision, Observation, RatePolicy, ThresholdPolicy, fair_share, reconcile
+from pool import WarmPool
+from snapshot import SnapshotStore
+from traces import TraceStore
 
 app = FastAPI()
 
-# Global metrics
-metrics = {
-    "queue_depth": 0,
-    "active_jobs": 0,
-    "total_spawned": 0,
-    "max_jobs": 0,
-    "threshold": 0,
-    "cpu_percent": 0,
-    "memory_percent": 0,
-    "total_consumed": 0
-}
+# Per-job counts kept for at most JOB_TABLE_SIZE jobs, and JOB_STATS_TTL seconds after a job is gone
+JOB_TABLE_SIZE = int(os.getenv("JOB_TABLE_SIZE", 1000))
+JOB_STATS_TTL = float(os.getenv("JOB_STATS_TTL", 600))
+
+# Global metrics: counters are bumped by /report, gauges set by the scaler loop
+metrics = MetricsStore(
+    counters=["total_spawned", "total_consumed", "messages_consumed", "duplicates_skipped"],
+    gauges={
+        "queue_depth": 0,
+        "active_jobs": 0,
+        "max_jobs": 0,
+        "threshold": 0,
+        "cpu_percent": 0,
+        "memory_percent": 0,
+    },
+    max_jobs=JOB_TABLE_SIZE,
+    job_ttl=JOB_STATS_TTL,
+)
 
 # Job history (simple in-memory list)
 job_history = []
-# Map to track processed count per job: {job_name: count}
-job_processed_counts = {}
 MAX_HISTORY = 50
+# /stats as published by the last tick; viewers share it instead of re-serializing
+snapshots = SnapshotStore()
+STREAM_KEEPALIVE = 15  # seconds between SSE comments on an idle stream
+# /logs defaults: newest lines only, and a byte cap unless following
+LOG_TAIL_LINES = int(os.getenv("LOG_TAIL_LINES", 1000))
+LOG_LIMIT_BYTES = int(os.getenv("LOG_LIMIT_BYTES", 2 * 1024 * 1024))
+LOG_CHUNK_BYTES = 16 * 1024
+# A followed log that stays silent this long is ended, so no read blocks a thread forever
+LOG_FOLLOW_IDLE_SECONDS = float(os.getenv("LOG_FOLLOW_IDLE_SECONDS", 300))
+# One sample per tick for the dashboard chart: 720 ticks is an hour at the 5s poll interval
+HISTORY_SAMPLES = int(os.getenv("HISTORY_SAMPLES", 720))
+history = TimeSeries(HISTORY_SAMPLES)
+# Stage timestamps of traced messages (workers sample them with TRACE_SAMPLE_RATE), for /traces
+TRACE_SAMPLES = int(os.getenv("TRACE_SAMPLES", 10000))
+traces = TraceStore(TRACE_SAMPLES)
+
+# Prometheus: histograms here, everything in `metrics` exported by StoreCollector at scrape time
+TICK_SECONDS = Histogram(
+    "scaler_tick_duration_seconds", "Time one scaler loop tick spends working",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+FIRST_MESSAGE_SECONDS = Histogram(
+    "scaler_job_first_message_seconds", "Capacity requested (job created / pool pod activated) to first message",
+    ["mode"], buckets=(0.5, 1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300),
+)
+TRACE_STAGE_SECONDS = Histogram(
+    "scaler_trace_stage_seconds", "Latency of one pipeline stage for traced messages", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+STALE_INPUTS = Counter("scaler_stale_inputs", "Ticks that used a last known value for an input", ["source"])
+TICK_OVERRUNS = Counter("scaler_tick_overruns", "Ticks that took longer than POLL_INTERVAL")
+QUEUE_GAUGES = [
+    ("ready", "Ready messages in the binding's queue"),
+    ("unacked", "Unacked messages in the binding's queue"),
+    ("active_jobs", "Workers running for the binding"),
+    ("desired_jobs", "Workers the binding's policy asked for"),
+    ("granted_jobs", "Workers granted to the binding from the global budget"),
+]
+PROMETHEUS_COUNTERS = {
+    "total_spawned": ("scaler_jobs_spawned", "Worker jobs created"),
+    "total_consumed": ("scaler_rows_consumed", "CSV rows workers reported processed"),
+    "messages_consumed": ("scaler_messages_consumed", "Messages workers reported processed"),
+    "duplicates_skipped": ("scaler_duplicates_skipped", "Redelivered messages workers skipped as already processed"),
+}
+
+class StoreCollector:
+    """Exports the MetricsStore: its counters as counters, numeric gauges as scaler_<name> gauges."""
+
+    def collect(self):
+        for name, value in metrics.snapshot().items():
+            if name in PROMETHEUS_COUNTERS:
+                metric, doc = PROMETHEUS_COUNTERS[name]
+                yield CounterMetricFamily(metric, doc, value=value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield GaugeMetricFamily(f"scaler_{name}", f"Scaler gauge {name}", value=value)
+        yield GaugeMetricFamily("scaler_job_table_rows", "Per-job rows kept in the job table", value=len(metrics.jobs))
+        queues = metrics.snapshot().get("queues", {})
+        for key, doc in QUEUE_GAUGES:
+            family = GaugeMetricFamily(f"scaler_binding_{key}", doc, labels=["binding", "queue"])
+            for name, row in queues.items():
+                family.add_metric([name, row["queue"]], row[key])
+            yield family
+
+REGISTRY.register(StoreCollector())
 
 class ReportRequest(BaseModel):
     job_name: str
-    processed: int
+    processed: int  # CSV rows, not messages: one message may carry a batch of rows
+    messages: Optional[int] = None  # messages those rows came in; defaults to processed
+    timings: Optional[Dict[str, float]] = None  # worker cold-start timestamps (epoch seconds)
+    in_flight: Optional[int] = None  # deliveries the worker is still processing
+    duplicates: Optional[int] = None  # redelivered messages skipped as already processed
+
+class TraceSample(BaseModel):
+    trace_id: str
+    message_id: Optional[str] = None
+    rows: int = 1
+    # Epoch seconds: upload accepted, published, delivered to the worker, handler start and end
+    uploaded_at: Optional[float] = None
+    enqueued_at: Optional[float] = None
+    delivered_at: Optional[float] = None
+    started_at: Optional[float] = None
+    processed_at: Optional[float] = None
+
+class BulkReportRequest(BaseModel):
+    reports: List[ReportRequest]
+    traces: List[TraceSample] = []
+
+# Cold start: capacity requested (job created / pool pod activated) -> worker ready -> first message
+cold_start_pending = {}  # job or pod name -> {"requested_at", "ready_s"}
+cold_starts = collections.deque(maxlen=100)
+cold_start_lock = threading.Lock()
+
+def record_timings(job_name, timings):
+    with cold_start_lock:
+        update_cold_start(job_name, timings)
+
+def update_cold_start(job_name, timings):
+    pending = cold_start_pending.get(job_name)
+    if pending is None:
+        return
+    # Pool workers are connected long before they are activated
+    ready = timings.get("activated_at" if EXECUTION_MODE == "pool" else "ready_at")
+    if ready is not None:
+        pending["ready_s"] = max(0.0, ready - pending["requested_at"])
+    if "first_message_at" not in timings:
+        return
+    del cold_start_pending[job_name]
+    first_message_s = max(0.0, timings["first_message_at"] - pending["requested_at"])
+    FIRST_MESSAGE_SECONDS.labels(EXECUTION_MODE).observe(first_message_s)
+    cold_starts.append({"ready_s": pending["ready_s"], "first_message_s": first_message_s})
+    ready_s = [c["ready_s"] for c in cold_starts if c["ready_s"] is not None]
+    first = sorted(c["first_message_s"] for c in cold_starts)
+    metrics["cold_start"] = {
+        "mode": EXECUTION_MODE,
+        "samples": len(first),
+        "avg_ready_s": round(sum(ready_s) / len(ready_s), 2) if ready_s else None,
+        "avg_first_message_s": round(sum(first) / len(first), 2),
+        "p95_first_message_s": round(first[min(len(first) - 1, int(0.95 * len(first)))], 2),
+    }
+
+def record_progress(job_name, processed, messages=None, timings=None, in_flight=None, duplicates=None):
+    if timings:
+        record_timings(job_name, timings)
+    if duplicates:
+        metrics.incr("duplicates_skipped", duplicates)
+    messages = processed if messages is None else messages
+    metrics.incr("total_consumed", processed)
+    metrics.incr("messages_consumed", messages)
+    metrics.jobs.add(job_name, processed, messages)
+    binding_consumed[binding_of(job_name)].add(messages)
+    activity.record(job_name, messages, in_flight or 0)
+
+def forget_worker(name):
+    # A Job or pool pod is gone: let its per-worker state age out or go now
+    metrics.jobs.retire(name)
+    activity.forget(name)
+    with cold_start_lock:
+        cold_start_pending.pop(name, None)
+    log_pods.pop(name, None)
 
 @app.post("/report")
 def report_progress(req: ReportRequest):
-    metrics["total_consumed"] += req.processed
-    if req.job_name in job_processed_counts:
-        job_processed_counts[req.job_name] += req.processed
-    else:
-        job_processed_counts[req.job_name] = req.processed
+    record_progress(req.job_name, req.processed, req.messages, req.timings, req.in_flight, req.duplicates)
     return {"status": "ok"}
 
+@app.post("/report/bulk")
+def report_progress_bulk(req: BulkReportRequest):
+    # Workers aggregate counts locally and send many job deltas per request
+    for report in req.reports:
+        record_progress(report.job_name, report.processed, report.messages, report.timings, report.in_flight,
+                        report.duplicates)
+    if req.traces:
+        for stage, seconds in traces.add([dict(t) for t in req.traces], time.time()):
+            TRACE_STAGE_SECONDS.labels(stage).observe(seconds)
+    return {"status": "ok", "accepted": len(req.reports)}
+
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 QUEUE_NAME = "task_queue"
 NAMESPACE = os.getenv("NAMESPACE", "default")
 MAX_JOBS = int(os.getenv("MAX_JOBS", 3))
 THRESHOLD = 20
-POLL_INTERVAL = 5
+# Passed through to every worker job
+WORKER_CONCURRENCY = os.getenv("WORKER_CONCURRENCY", "1")
+WORKER_POOL = os.getenv("WORKER_POOL", "thread")
+WORKER_LOG_LEVEL = os.getenv("WORKER_LOG_LEVEL", "DEBUG")
+WORKER_LOG_SAMPLE_RATE = os.getenv("WORKER_LOG_SAMPLE_RATE", "1")
+WORKER_DEDUP_BACKEND = os.getenv("WORKER_DEDUP_BACKEND", "")
+WORKER_DEDUP_URL = os.getenv("WORKER_DEDUP_URL", "redis://redis:6379/0")
+# Decisions run every POLL_INTERVAL seconds, measured from the start of one tick to the next;
+# inputs not collected within COLLECT_DEADLINE keep their last value for that tick
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", 5))
+COLLECT_DEADLINE = float(os.getenv("COLLECT_DEADLINE", 2))
 
-metrics["max_jobs"] = MAX_JOBS
+# Scaling policy: "threshold" (the fixed rules) or "rate" (sized from measured rates)
+SCALING_POLICY = os.getenv("SCALING_POLICY", "threshold")
+TARGET_DRAIN_SECONDS = float(os.getenv("TARGET_DRAIN_SECONDS", 60))
+JOB_STARTUP_SECONDS = float(os.getenv("JOB_STARTUP_SECONDS", 15))
+# Initial guess until measured: messages/s one job handles (2s of work per message)
+WORKER_THROUGHPUT = float(os.getenv("WORKER_THROUGHPUT", 0.5 * int(WORKER_CONCURRENCY)))
+SCALE_HYSTERESIS = float(os.getenv("SCALE_HYSTERESIS", 0.2))
+SCALE_UP_COOLDOWN = float(os.getenv("SCALE_UP_COOLDOWN", 5))
+SCALE_DOWN_COOLDOWN = float(os.getenv("SCALE_DOWN_COOLDOWN", 30))
+# Jobs added per tick by the threshold policy when the queue is over 2x threshold
+BURST_SIZE = int(os.getenv("BURST_SIZE", 5))
+# Job creations in flight at once, and attempts per job when the API server throttles (429)
+JOB_CREATE_CONCURRENCY = int(os.getenv("JOB_CREATE_CONCURRENCY", 20))
+JOB_CREATE_ATTEMPTS = int(os.getenv("JOB_CREATE_ATTEMPTS", 4))
+# A worker that reported no work for this long is removed first, even while others are busy
+WORKER_IDLE_SECONDS = float(os.getenv("WORKER_IDLE_SECONDS", 30))
+# How long a removed worker may spend finishing in-flight messages before it is killed
+WORKER_DRAIN_SECONDS = int(os.getenv("WORKER_DRAIN_SECONDS", 60))
+
+# "jobs": one new Job per worker; "pool": activate warm pods of the worker-pool Deployment
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "jobs")
+POOL_DEPLOYMENT = os.getenv("POOL_DEPLOYMENT", "worker-pool")
+POOL_WARM_SPARE = int(os.getenv("POOL_WARM_SPARE", 2))  # standby pods kept beyond the active ones
+
+# Partitioned queues: shard queues per binding queue (matching the producer's
+# QUEUE_PARTITIONS), an optional priority lane, and the shards each job consumes (0 = all)
+QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", 1))
+PRIORITY_LANE = os.getenv("PRIORITY_LANE", "false").lower() == "true"
+SHARDS_PER_WORKER = int(os.getenv("SHARDS_PER_WORKER", 0))
+
+# Queue -> worker profile bindings from SCALER_CONFIG (JSON); without it, one
+# "default" binding built from the settings above
+SCALER_CONFIG = os.getenv("SCALER_CONFIG")
+bindings, config_max_total = load_bindings(SCALER_CONFIG, Binding(
+    name="default",
+    queue=QUEUE_NAME,
+    image=os.getenv("WORKER_IMAGE", "worker:latest"),
+    max_jobs=MAX_JOBS,
+    threshold=THRESHOLD,
+    burst=BURST_SIZE,
+    policy=SCALING_POLICY,
+    partitions=QUEUE_PARTITIONS,
+    priority_lane=PRIORITY_LANE,
+    shards_per_worker=SHARDS_PER_WORKER,
+))
+BINDINGS = {b.name: b for b in bindings}
+DEFAULT_BINDING = bindings[0].name  # also owns jobs that carry no binding label
+# Workers across all bindings; when the queues want more together it is split max-min fairly
+MAX_TOTAL_JOBS = int(os.getenv("MAX_TOTAL_JOBS", config_max_total or sum(b.max_jobs for b in bindings)))
+if EXECUTION_MODE == "pool" and len(bindings) > 1:
+    raise ValueError("EXECUTION_MODE=pool supports a single binding")
+# Messages reported done per binding, for the rate policy's drain rate
+binding_consumed = {b.name: ShardedCounter() for b in bindings}
+
+activity = ActivityTracker(idle_after=WORKER_IDLE_SECONDS)
+
+metrics["max_jobs"] = MAX_TOTAL_JOBS
 metrics["threshold"] = THRESHOLD
 
 # Initialize K8s client
@@ -59,27 +290,58 @@ try:
 except:
     config.load_kube_config()
 
+# Enough keep-alive connections for concurrent job creation
+k8s_config = client.Configuration.get_default_copy()
+k8s_config.connection_pool_maxsize = max(k8s_config.connection_pool_maxsize, JOB_CREATE_CONCURRENCY)
+client.Configuration.set_default(k8s_config)
+
 batch_v1 = client.BatchV1Api()
 core_v1 = client.CoreV1Api()
+apps_v1 = client.AppsV1Api()
 
-def get_queue_depth():
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        q = channel.queue_declare(queue=QUEUE_NAME, durable=True, passive=True)
-        depth = q.method.message_count
-        connection.close()
-        return depth
-    except Exception as e:
-        print(f"Error checking queue: {e}")
-        return 0
+# Local list+watch caches; the loop and the API endpoints read these instead of listing
+JOB_SELECTOR = "app=worker-job"
+job_informer = Informer(batch_v1.list_namespaced_job, NAMESPACE, JOB_SELECTOR,
+                        on_delete=lambda job: forget_worker(job.metadata.name))
+pod_informer = Informer(core_v1.list_namespaced_pod, NAMESPACE, JOB_SELECTOR,
+                        on_delete=lambda pod: forget_worker(pod.metadata.name))
+
+def on_pool_activate(pod, requested_at):
+    with cold_start_lock:
+        cold_start_pending[pod] = {"requested_at": requested_at, "ready_s": None}
+
+warm_pool = None
+if EXECUTION_MODE == "pool":
+    warm_pool = WarmPool(
+        apps_v1, core_v1, NAMESPACE, POOL_DEPLOYMENT,
+        spare=POOL_WARM_SPARE, max_size=bindings[0].max_jobs + POOL_WARM_SPARE,
+        pod_lookup=pod_informer.get, on_activate=on_pool_activate,
+    )
+
+def binding_of(name):
+    """The binding a worker job (or pool pod) belongs to, from the job's label."""
+    if warm_pool:
+        return DEFAULT_BINDING
+    job = job_informer.get(name)
+    binding = (job.metadata.labels or {}).get(BINDING_LABEL) if job else None
+    return binding if binding in BINDINGS else DEFAULT_BINDING
 
 def get_active_jobs():
-    jobs = batch_v1.list_namespaced_job(NAMESPACE, label_selector="app=worker-job")
-    active_count = 0
+    """Running workers per binding; also refreshes job_history."""
+    global job_history
+    if warm_pool:
+        rows = warm_pool.rows()
+        for row in rows:
+            row["processed"] = metrics.jobs.processed(row["name"])
+            row["binding"] = DEFAULT_BINDING
+        job_history = sorted(rows, key=lambda x: x['start_time'], reverse=True)[:MAX_HISTORY]
+        # Like Job.status.active, this counts capacity that is requested but not consuming yet
+        return {DEFAULT_BINDING: warm_pool.target}
+
+    active_count = {b.name: 0 for b in bindings}
     current_jobs = []
     
-    for job in jobs.items:
+    for job in job_informer.items():
         succeeded = job.status.succeeded or 0
         failed = job.status.failed or 0
         active = job.status.active or 0
@@ -88,39 +350,61 @@ def get_active_jobs():
         if succeeded > 0: status = "Succeeded"
         elif failed > 0: status = "Failed"
         
+        binding = binding_of(job.metadata.name)
         if active > 0:
-            active_count += 1
+            active_count[binding] += 1
             
         start_time = job.status.start_time.strftime("%H:%M:%S") if job.status.start_time else "-"
         
-        processed = job_processed_counts.get(job.metadata.name, 0)
+        processed = metrics.jobs.processed(job.metadata.name)
 
         current_jobs.append({
             "name": job.metadata.name,
+            "binding": binding,
             "status": status,
             "start_time": start_time,
             "processed": processed
         })
 
-    global job_history
     job_history = sorted(current_jobs, key=lambda x: x['start_time'], reverse=True)[:MAX_HISTORY]
     
     return active_count
 
-def create_job():
-    job_name = f"worker-job-{uuid.uuid4().hex[:6]}"
-    
-    # Define the job
+def build_job_template(binding):
+    """A binding's worker Job serialized once; create_job() only fills in the name."""
+    job_name = "worker-job-template"
+    labels = {"app": "worker-job", BINDING_LABEL: binding.name}
+    env = {
+        "RABBITMQ_HOST": RABBITMQ_HOST,
+        "QUEUE_NAME": binding.queue,
+        "SCALER_URL": "http://scaler:8000/report",
+        "JOB_NAME": job_name,
+        "WORKER_CONCURRENCY": WORKER_CONCURRENCY,
+        "WORKER_POOL": WORKER_POOL,
+        "LOG_LEVEL": WORKER_LOG_LEVEL,
+        "LOG_SAMPLE_RATE": WORKER_LOG_SAMPLE_RATE,
+        "DRAIN_TIMEOUT": str(WORKER_DRAIN_SECONDS),
+        "DEDUP_BACKEND": WORKER_DEDUP_BACKEND,
+        "DEDUP_URL": WORKER_DEDUP_URL,
+        "QUEUE_PARTITIONS": str(binding.partitions),
+        "PRIORITY_LANE": str(binding.priority_lane).lower(),
+    }
+    env.update(binding.env)
     job = client.V1Job(
         api_version="batch/v1",
         kind="Job",
-        metadata=client.V1ObjectMeta(name=job_name, labels={"app": "worker-job"}),
+        metadata=client.V1ObjectMeta(name=job_name, labels=labels),
         spec=client.V1JobSpec(
             ttl_seconds_after_finished=60, # Cleanup after 60s
             template=client.V1PodTemplateSpec(
-                metadata=client.V1ObjectMeta(labels={"app": "worker-job"}),
+                metadata=client.V1ObjectMeta(
+                    labels=labels,
+                    annotations={"prometheus.io/scrape": "true", "prometheus.io/port": "9100"},
+                ),
                 spec=client.V1PodSpec(
                     restart_policy="OnFailure",
+                    # Deletion sends SIGTERM; the worker drains in-flight messages before exiting
+                    termination_grace_period_seconds=WORKER_DRAIN_SECONDS + 15,
                     volumes=[
                         client.V1Volume(
                             name="logs-volume",
@@ -133,7 +417,7 @@ def create_job():
                     containers=[
                         client.V1Container(
                             name="worker",
-                            image="worker:latest", 
+                            image=binding.image,
                             image_pull_policy="IfNotPresent",
                             volume_mounts=[
                                 client.V1VolumeMount(
@@ -141,139 +425,509 @@ def create_job():
                                     mount_path="/logs"
                                 )
                             ],
-                            env=[
-                                client.V1EnvVar(name="RABBITMQ_HOST", value=RABBITMQ_HOST),
-                                client.V1EnvVar(name="SCALER_URL", value="http://scaler:8000/report"),
-                                client.V1EnvVar(name="JOB_NAME", value=job_name)
-                            ]
+                            env=[client.V1EnvVar(name=name, value=value) for name, value in env.items()]
                         )
                     ]
                 )
             )
         )
     )
-    
+    return json.dumps(batch_v1.api_client.sanitize_for_serialization(job))
+
+JOB_TEMPLATES = {b.name: build_job_template(b) for b in bindings}
+
+def render_job(binding, job_name, shards=None):
+    body = json.loads(JOB_TEMPLATES[binding])
+    body["metadata"]["name"] = job_name
+    env = body["spec"]["template"]["spec"]["containers"][0]["env"]
+    for var in env:
+        if var["name"] == "JOB_NAME":
+            var["value"] = job_name
+    if shards is not None:
+        value = ",".join(str(i) for i in shards)
+        env.append({"name": "SHARDS", "value": value})
+        body["metadata"].setdefault("annotations", {})[SHARDS_ANNOTATION] = value
+    return body
+
+def job_shards(job):
+    value = (job.metadata.annotations or {}).get(SHARDS_ANNOTATION, "")
+    return [int(i) for i in value.split(",") if i]
+
+def shard_coverage(binding):
+    """Shard index -> live (not yet deleting) jobs of a binding consuming it."""
+    coverage = collections.Counter({i: 0 for i in range(BINDINGS[binding].partitions)})
+    for job in job_informer.items():
+        if job.metadata.deletion_timestamp is None and binding_of(job.metadata.name) == binding:
+            coverage.update(job_shards(job))
+    return coverage
+
+def stranded_jobs(binding, depths):
+    """Jobs needed so every shard with ready messages has a consumer, whatever the policy says."""
+    b = BINDINGS[binding]
+    if warm_pool or not b.splits_shards():
+        return 0
+    coverage = shard_coverage(binding)
+    stranded = [i for i, shard in enumerate(b.shards()) if depths[shard][0] and not coverage[i]]
+    # assign_shards hands out the uncovered shards first
+    return -(-len(stranded) // b.shards_per_worker)
+
+def assign_shards(binding, count):
+    """Shards for `count` new jobs of a binding: each takes the ones fewest live jobs consume.
+
+    None per job when the binding's jobs consume every shard.
+    """
+    b = BINDINGS[binding]
+    if not b.splits_shards():
+        return [None] * count
+    coverage = shard_coverage(binding)
+    assignments = []
+    for _ in range(count):
+        shards = sorted(sorted(coverage), key=lambda i: coverage[i])[:b.shards_per_worker]
+        coverage.update(shards)
+        assignments.append(sorted(shards))
+    return assignments
+
+def retry_after(e, attempt):
     try:
-        batch_v1.create_namespaced_job(body=job, namespace=NAMESPACE)
-        print(f"Created job {job_name}")
-        metrics["total_spawned"] += 1
-    except Exception as e:
-        print(f"Failed to create job: {e}")
+        return min(float((e.headers or {}).get("Retry-After")), 30)
+    except (TypeError, ValueError):
+        return min(0.5 * 2 ** attempt, 30)
+
+def create_job(binding, shards=None):
+    job_name = f"worker-job-{uuid.uuid4().hex[:6]}"
+    body = render_job(binding, job_name, shards)
+    requested_at = time.time()
+    for attempt in range(JOB_CREATE_ATTEMPTS):
+        try:
+            created = batch_v1.create_namespaced_job(body=body, namespace=NAMESPACE)
+        except client.exceptions.ApiException as e:
+            if e.status == 429 and attempt + 1 < JOB_CREATE_ATTEMPTS:
+                delay = retry_after(e, attempt)
+                print(f"Job creation throttled (429), retrying {job_name} in {delay}s")
+                time.sleep(delay)
+                continue
+            print(f"Failed to create job: {e}")
+            return False
+        except Exception as e:
+            print(f"Failed to create job: {e}")
+            return False
+        job_informer.store(created)
+        with cold_start_lock:
+            cold_start_pending[job_name] = {"requested_at": requested_at, "ready_s": None}
+        print(f"Created job {job_name} for {binding}" + (f", shards {shards}" if shards is not None else ""))
+        return True
+    return False
+
+job_api_pool = ThreadPoolExecutor(max_workers=JOB_CREATE_CONCURRENCY, thread_name_prefix="job-api")
 
-def delete_job():
+def create_jobs(binding, count):
+    """Create count jobs for a binding concurrently; returns how many were created."""
+    # Assigned up front: concurrent creations would all see the same coverage
+    created = sum(job_api_pool.map(lambda shards: create_job(binding, shards), assign_shards(binding, count)))
+    metrics.incr("total_spawned", created)
+    if created < count:
+        # Jobs that failed are not in the cache, so the next tick asks for them again
+        print(f"Created {created}/{count} jobs")
+    return created
+
+def job_started_at(binding):
+    """A binding's live (not yet deleting) jobs -> creation time, epoch seconds."""
+    # Jobs already being deleted linger in the cache until the watch reports them gone
+    return {
+        j.metadata.name: j.metadata.creation_timestamp.timestamp()
+        for j in job_informer.items()
+        if j.metadata.deletion_timestamp is None and binding_of(j.metadata.name) == binding
+    }
+
+def count_idle_workers():
+    """Idle workers per binding."""
+    idle = {}
+    for b in bindings:
+        started = warm_pool.active_since() if warm_pool else job_started_at(b.name)
+        idle[b.name] = sum(1 for name, at in started.items() if activity.is_idle(name, at))
+    return idle
+
+def delete_job(name):
     try:
-        # Get list of jobs
-        jobs = batch_v1.list_namespaced_job(NAMESPACE, label_selector="app=worker-job")
-        if jobs.items:
-            # Delete the oldest job
-            job_to_delete = sorted(jobs.items, key=lambda x: x.metadata.creation_timestamp)[0]
-            name = job_to_delete.metadata.name
-            print(f"Scaling down: Deleting idle job {name}")
-            batch_v1.delete_namespaced_job(
-                name, 
-                NAMESPACE, 
-                body=client.V1DeleteOptions(propagation_policy='Background')
-            )
-            # Remove from processed counts to keep history clean? No, keep history.
+        print(f"Scaling down: Deleting job {name}")
+        batch_v1.delete_namespaced_job(
+            name, 
+            NAMESPACE, 
+            body=client.V1DeleteOptions(propagation_policy='Background')
+        )
+        activity.forget(name)
+        return True
     except Exception as e:
-        print(f"Failed to delete job: {e}")
+        print(f"Failed to delete job {name}: {e}")
+        return False
+
+def delete_jobs(binding, count):
+    """Delete count of a binding's jobs, idle and least busy first; returns how many were deleted.
+
+    A job that is the last consumer of one of its shards is kept.
+    """
+    started = job_started_at(binding)
+    victims = activity.removal_order(started)
+    if BINDINGS[binding].splits_shards():
+        coverage = shard_coverage(binding)
+        removable = []
+        for name in victims:
+            if len(removable) == count:
+                break
+            shards = job_shards(job_informer.get(name))
+            if all(coverage[i] > 1 for i in shards):
+                coverage.subtract(shards)
+                removable.append(name)
+        victims = removable
+    victims = victims[:count]
+    if not victims:
+        print(f"Not removing jobs of {binding}: each is the last consumer of a shard")
+        return 0
+    print("Removing " + ", ".join(f"{name} (idle {activity.idle_for(name, started[name]):.0f}s)" for name in victims))
+    return sum(job_api_pool.map(delete_job, victims))
 
 def measure_resources():
-    metrics["cpu_percent"] = psutil.cpu_percent()
-    metrics["memory_percent"] = psutil.virtual_memory().percent
+    return psutil.cpu_percent(), psutil.virtual_memory().percent
 
-import requests
+def count_workers():
+    """binding -> (active, idle); both read the shared informer caches, so they are collected together."""
+    active, idle = get_active_jobs(), count_idle_workers()
+    return {b.name: (active[b.name], idle[b.name]) for b in bindings}
 
-def get_rabbitmq_stats():
-    try:
-        url = f"http://{RABBITMQ_HOST}:15672/api/queues/%2F/{QUEUE_NAME}"
-        res = requests.get(url, auth=("guest", "guest"), timeout=2)
-        if res.status_code == 200:
-            data = res.json()
-            ready = data.get("messages_ready", 0)
-            unacked = data.get("messages_unacknowledged", 0)
-            return ready, unacked
-    except Exception as e:
-        print(f"Error fetching RabbitMQ stats: {e}")
-    return 0, 0
+# One management API call per tick covers every bound queue, shards included
+broker_stats = BrokerStats(RABBITMQ_HOST, [q for b in bindings for q in b.queues()], timeout=COLLECT_DEADLINE)
+
+def binding_backlog(binding, depths):
+    """(ready, unacked) summed over all of a binding's queues."""
+    stats = [depths[q] for q in binding.queues()]
+    return sum(ready for ready, _ in stats), sum(unacked for _, unacked in stats)
+
+def make_policy(binding):
+    concurrency = int(binding.env.get("WORKER_CONCURRENCY", WORKER_CONCURRENCY))
+    if binding.policy == "rate":
+        return RatePolicy(
+            binding.max_jobs,
+            target_drain=TARGET_DRAIN_SECONDS,
+            startup=JOB_STARTUP_SECONDS,
+            # The initial guess scales with the binding's concurrency until measured
+            per_worker=WORKER_THROUGHPUT * concurrency / int(WORKER_CONCURRENCY),
+            slots_per_worker=concurrency,
+            hysteresis=SCALE_HYSTERESIS,
+            up_cooldown=SCALE_UP_COOLDOWN,
+            down_cooldown=SCALE_DOWN_COOLDOWN,
+        )
+    return ThresholdPolicy(binding.threshold, binding.max_jobs, burst=binding.burst, idle_ticks=6)  # 30 seconds (6 * 5s)
 
 def scaler_loop():
     print("Scaler loop started...")
-    idle_ticks = 0
-    IDLE_THRESHOLD = 6 # 30 seconds (6 * 5s)
+    job_informer.synced.wait()
+    if warm_pool:
+        pod_informer.synced.wait()
+    policies = {b.name: make_policy(b) for b in bindings}
+    for b in bindings:
+        print(f"Binding {b.name}: queue {b.queue} ({len(b.queues())} broker queues), {b.policy} policy, up to {b.max_jobs} x {b.image}")
+    print(f"Global budget: {MAX_TOTAL_JOBS} jobs")
+    metrics["policy"] = ",".join(sorted({b.policy for b in bindings}))
+    last_sample = None
+    collector = TickCollector(
+        {"queue": broker_stats.fetch, "workers": count_workers, "resources": measure_resources},
+        defaults={
+            "queue": {q: (0, 0) for b in bindings for q in b.queues()},
+            "workers": {b.name: (0, 0) for b in bindings},
+            "resources": (0, 0),
+        },
+        deadline=COLLECT_DEADLINE,
+    )
+    next_tick = time.monotonic()
     
     while True:
-        # fetch from API for more accurate unacked count
-        ready, unacked = get_rabbitmq_stats()
-        total_pending = ready + unacked
-        
-        active = get_active_jobs()
-        measure_resources()
+        tick_start = time.monotonic()
+        # All inputs at once; a slow one costs at most COLLECT_DEADLINE and keeps its last value
+        inputs, stale = collector.collect()
+        for source in stale:
+            STALE_INPUTS.labels(source).inc()
         
-        # Update metrics
-        metrics["queue_depth"] = ready 
-        metrics["unacked"] = unacked
-        metrics["active_jobs"] = active
+        # Until the queue and worker counts have been read once their values are
+        # only defaults: nothing is decided or scaled on them
+        waiting = collector.missing(["queue", "workers"])
+
+        # Each binding's policy asks for what its queue needs...
+        now = time.monotonic()
+        decisions, demands = {}, {}
+        for b in bindings:
+            # Workers are sized against the backlog across all shards
+            ready, unacked = binding_backlog(b, inputs["queue"])
+            active, idle = inputs["workers"][b.name]
+            if waiting:
+                decision, delta = Decision(active, f"Waiting for first {' and '.join(waiting)} stats"), 0
+            else:
+                decision, delta = reconcile(policies[b.name], Observation(
+                    now=now,
+                    ready=ready,
+                    unacked=unacked,
+                    active=active,
+                    consumed=binding_consumed[b.name].value(),
+                    idle=idle,
+                ), b.max_jobs)
+            decisions[b.name] = decision
+            demands[b.name] = active + delta
+        # ...and the global budget is split between them
+        grants = fair_share(demands, MAX_TOTAL_JOBS, {b.name: b.weight for b in bindings})
         
-        status = "Active"
+        queues = {}
+        for b in bindings:
+            ready, unacked = binding_backlog(b, inputs["queue"])
+            active, idle = inputs["workers"][b.name]
+            decision, delta = decisions[b.name], 0 if waiting else grants[b.name] - active
+            status = decision.status
+            if grants[b.name] < demands[b.name]:
+                status += f" (capped at {grants[b.name]} by the global budget)"
+            print(f"[{b.name}] Queue {b.queue}: {ready} (Unacked: {unacked}), Active: {active} ({idle} idle)")
+            
+            stranded = stranded_jobs(b.name, inputs["queue"])
+            if waiting:
+                # Not even the warm pool is resized on default values
+                print(f"[{b.name}] {status}")
+            elif warm_pool:
+                # Activates standby pods and keeps POOL_WARM_SPARE more replicas running
+                if delta:
+                    print(f"[{b.name}] {status}: pool target {active + delta}")
+                warm_pool.resize(active + delta, activity.removal_order(warm_pool.active_since()))
+
+            # Scale UP
+            elif delta > 0 or stranded:
+                # A shard with messages but no consumer gets one even beyond the grant
+                count = max(delta, stranded)
+                print(f"[{b.name}] {status}: spawning {count} worker jobs...")
+                create_jobs(b.name, count)
+                
+            # Scale DOWN
+            elif delta < 0:
+                print(f"[{b.name}] {status}: removing {-delta} worker jobs...")
+                delete_jobs(b.name, -delta)
+            
+            queues[b.name] = {
+                **policies[b.name].describe(),
+                "queue": b.queue,
+                "partitions": b.partitions,
+                "priority_lane": b.priority_lane,
+                # Per broker queue, to spot a hot shard
+                "shards": {q: inputs["queue"][q][0] for q in b.queues()} if len(b.queues()) > 1 else {},
+                "ready": ready,
+                "unacked": unacked,
+                "active_jobs": active,
+                "idle_jobs": idle,
+                "max_jobs": b.max_jobs,
+                "desired_jobs": demands[b.name],
+                "granted_jobs": grants[b.name],
+                "messages_consumed": binding_consumed[b.name].value(),
+                "status": status,
+            }
         
-        print(f"Queue: {ready} (Unacked: {unacked}), Active: {active}, CPU: {metrics['cpu_percent']}%, Mem: {metrics['memory_percent']}%")
+        # Totals keep the single-queue cards and /stats fields meaningful
+        rows = queues.values()
+        busy = [f"{name}: {q['status']}" for name, q in queues.items() if q["status"] != "Active"]
+        metrics.update({
+            "queue_depth": sum(q["ready"] for q in rows),
+            "unacked": sum(q["unacked"] for q in rows),
+            "active_jobs": sum(q["active_jobs"] for q in rows),
+            "idle_jobs": sum(q["idle_jobs"] for q in rows),
+            "desired_jobs": sum(q["granted_jobs"] for q in rows),
+            "queues": queues,
+            "status_msg": queues[DEFAULT_BINDING]["status"] if len(queues) == 1 else "; ".join(busy) or "Active",
+        })
+        metrics["cpu_percent"], metrics["memory_percent"] = inputs["resources"]
+        metrics["collect_seconds"] = round(time.monotonic() - tick_start, 4)
+        metrics["stale_inputs"] = dict(collector.stale)
+        print(f"Total: {metrics['queue_depth']} ready, {metrics['active_jobs']}/{MAX_TOTAL_JOBS} jobs, CPU: {metrics['cpu_percent']}%, Mem: {metrics['memory_percent']}%")
         
-        # Scale UP
-        if ready > THRESHOLD and active < MAX_JOBS:
-            count = 1
-            # Burst scaling: If queue is huge (2x threshold), spawn more
-            if ready > THRESHOLD * 2:
-                # Spawn up to 5 workers, but don't exceed MAX_JOBS
-                available_slots = MAX_JOBS - active
-                count = min(5, available_slots)
-                print(f"Threshold exceeded (Burst), spawning {count} worker jobs...")
-            else:
-                print("Threshold exceeded, spawning worker job...")
+        metrics.jobs.expire()
+        tick_seconds = time.monotonic() - tick_start
+        TICK_SECONDS.observe(tick_seconds)
+        last_sample = record_sample(last_sample, tick_seconds)
+        snapshots.publish(metrics.snapshot(), job_history)
 
-            for _ in range(count):
-                create_job()
-            
-            idle_ticks = 0 
-            status = f"Scaling Up (+{count})"
-            
-        # Scale DOWN
-        elif total_pending == 0 and active > 0:
-            idle_ticks += 1
-            print(f"System idle (Queue=0, Unacked=0). Idle ticks: {idle_ticks}/{IDLE_THRESHOLD}")
-            status = f"Idle ({idle_ticks}/{IDLE_THRESHOLD})"
-            
-            if idle_ticks >= IDLE_THRESHOLD:
-                delete_job()
-                idle_ticks = IDLE_THRESHOLD - 1 # Keep trying to delete one by one
-                status = "Scaling Down"
-        else:
-            idle_ticks = 0
-            
-        metrics["status_msg"] = status
-        time.sleep(POLL_INTERVAL)
+        # Fixed cadence: the next tick starts POLL_INTERVAL after this one started,
+        # however long this one took; an overrun skips ahead instead of bunching up
+        next_tick += POLL_INTERVAL
+        now = time.monotonic()
+        if now > next_tick:
+            TICK_OVERRUNS.inc()
+            next_tick = now
+        time.sleep(next_tick - now)
 
-@app.get("/stats")
-def get_stats():
-    return {
-        "metrics": metrics,
-        "jobs": job_history
+def record_sample(last, tick_seconds):
+    """Append this tick's sample to the history; the latest one also goes out with /stats."""
+    now = time.time()
+    values = metrics.snapshot()
+    consumed = values["messages_consumed"]
+    rate = (consumed - last["consumed"]) / (now - last["t"]) if last and now > last["t"] else 0.0
+    sample = {
+        "t": round(now, 3),
+        "queue_depth": values["queue_depth"],
+        "unacked": values["unacked"],
+        "active_jobs": values["active_jobs"],
+        "desired_jobs": values.get("desired_jobs", values["active_jobs"]),
+        "consumed_rate": round(rate, 2),
+        "tick_seconds": round(tick_seconds, 4),
     }
+    history.append(sample)
+    metrics["consumed_rate"] = sample["consumed_rate"]
+    metrics["tick_seconds"] = sample["tick_seconds"]
+    metrics["sample"] = sample
+    return {"t": now, "consumed": consumed}
+
+@app.get("/stats")
+def get_stats(request: Request):
+    version, body = snapshots.snapshot()
+    headers = {"ETag": snapshots.etag(version), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/stats/stream")
+async def stream_stats(request: Request):
+    """Server-Sent Events: a full snapshot, then only deltas as ticks change something."""
+    # An id from before a scaler restart parses as None, so the stream starts with a snapshot
+    last = snapshots.parse_event_id(request.headers.get("last-event-id"))
+
+    async def events():
+        version = last
+        while not await request.is_disconnected():
+            deltas = None if version is None else snapshots.deltas_since(version)
+            if deltas is None:
+                # First connect, or too far behind for the kept deltas
+                version, body = snapshots.snapshot()
+                yield f"event: snapshot\nid: {snapshots.event_id(version)}\ndata: {body}\n\n"
+                continue
+            for version, delta in deltas:
+                yield f"event: delta\nid: {snapshots.event_id(version)}\ndata: {delta}\n\n"
+            if not deltas:
+                await snapshots.wait(version, STREAM_KEEPALIVE)
+                if snapshots.version == version:
+                    yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/stats/history")
+def stats_history(since: float = 0):
+    """Per-tick samples newer than `since` (epoch seconds), oldest first."""
+    return {"samples": history.since(since)}
+
+@app.get("/traces")
+def trace_summary(since: float = 0, limit: int = 20):
+    """Per-stage latency percentiles of traced messages reported after `since`, plus the latest samples."""
+    summary = traces.summary(since)
+    summary["recent"] = traces.since(since)[-limit:] if limit > 0 else []
+    return summary
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/pool/assignment/{worker}")
+def pool_assignment(worker: str):
+    if not warm_pool:
+        raise HTTPException(status_code=404, detail="Scaler is not in pool mode")
+    return {"active": warm_pool.poll(worker)}
+
+# job (or pool pod) name -> pod name, checked against the pod cache on every hit
+log_pods = {}
+
+def find_log_pod(job_name):
+    pod_name = log_pods.get(job_name)
+    if pod_name:
+        pod = pod_informer.get(pod_name)
+        if pod is not None and pod.metadata.deletion_timestamp is None:
+            return pod_name
+    # Pool workers report under their pod name
+    pods = [
+        p for p in pod_informer.items()
+        if (p.metadata.labels or {}).get("job-name") == job_name or p.metadata.name == job_name
+    ]
+    if not pods:
+        log_pods.pop(job_name, None)
+        return None
+    pod_name = max(pods, key=lambda p: p.metadata.creation_timestamp).metadata.name
+    log_pods[job_name] = pod_name
+    return pod_name
+
+async def stream_pod_log(request, resp, events=None):
+    """Relay a pod log response chunk by chunk; with `events`, only those JSON event lines.
+
+    Each blocking read runs in the threadpool. Once the client is gone the
+    response is closed instead of followed further.
+    """
+    chunks = resp.stream(LOG_CHUNK_BYTES, decode_content=True)
+    pending = b""
+    finished = False
+    try:
+        while not await request.is_disconnected():
+            try:
+                chunk = await run_in_threadpool(next, chunks, None)
+            except ReadTimeoutError:
+                # Followed log idle for LOG_FOLLOW_IDLE_SECONDS
+                break
+            if chunk is None:
+                finished = True
+                break
+            if not events:
+                yield chunk
+                continue
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            out = [line for line in lines if log_event_type(line) in events]
+            if out:
+                yield b"\n".join(out) + b"\n"
+        if finished and events and pending and log_event_type(pending) in events:
+            yield pending + b"\n"
+    finally:
+        if finished:
+            resp.release_conn()
+        else:
+            # Mid-stream the connection can't be reused; closing it also ends the follow
+            resp.close()
+
+def log_event_type(line):
+    # Worker events are JSON lines (worker/eventlog.py); anything else has no type
+    if not line.startswith(b"{"):
+        return None
+    try:
+        return json.loads(line).get("event")
+    except ValueError:
+        return None
 
 @app.get("/logs/{job_name}")
-def get_logs(job_name: str):
+def get_logs(
+    request: Request,
+    job_name: str,
+    tail_lines: Optional[int] = LOG_TAIL_LINES,
+    since_seconds: Optional[int] = None,
+    limit_bytes: Optional[int] = None,
+    follow: bool = False,
+    event: Optional[str] = None,
+):
     try:
         # Find pod associated with job
-        pods = core_v1.list_namespaced_pod(
-            NAMESPACE, 
-            label_selector=f"job-name={job_name}"
+        pod_name = find_log_pod(job_name)
+        if not pod_name:
+            return PlainTextResponse("No pods found for this job yet.")
+
+        if limit_bytes is None and not follow:
+            limit_bytes = LOG_LIMIT_BYTES
+        resp = core_v1.read_namespaced_pod_log(
+            pod_name,
+            NAMESPACE,
+            follow=follow,
+            tail_lines=tail_lines or None,
+            since_seconds=since_seconds,
+            limit_bytes=limit_bytes,
+            _preload_content=False,
+            # (connect, read): a silent followed log times out instead of holding a thread
+            _request_timeout=(10, LOG_FOLLOW_IDLE_SECONDS) if follow else None,
         )
-        if not pods.items:
-            return "No pods found for this job yet."
-            
-        pod_name = pods.items[0].metadata.name
-        logs = core_v1.read_namespaced_pod_log(pod_name, NAMESPACE)
-        return PlainTextResponse(logs)
+        events = {e for e in event.split(",") if e} if event else None
+        return StreamingResponse(stream_pod_log(request, resp, events), media_type="text/plain; charset=utf-8")
     except Exception as e:
         return PlainTextResponse(f"Error fetching logs: {str(e)}")
 
@@ -309,6 +963,8 @@ def dashboard():
             .status-Running { background: #dbeafe; color: #1d4ed8; }
             .status-Succeeded { background: #dcfce7; color: #15803d; }
             .status-Failed { background: #fee2e2; color: #b91c1c; }
+            .status-Active { background: #dbeafe; color: #1d4ed8; }
+            .status-Standby { background: #f1f5f9; color: #475569; }
             
             .btn { background: var(--primary); color: white; border: none; padding: 6px 12px; border-radius: 6px; cursor: pointer; font-size: 0.8rem; transition: opacity 0.2s; }
             .btn:hover { opacity: 0.9; }
@@ -320,6 +976,9 @@ def dashboard():
             .close-btn { background: none; border: none; font-size: 1.5rem; cursor: pointer; }
             .log-box { flex: 1; background: #1e293b; color: #e2e8f0; font-family: monospace; padding: 15px; border-radius: 8px; overflow: auto; white-space: pre-wrap; font-size: 0.9rem; }
             
+            .chart-card { margin-bottom: 30px; }
+            .chart-card canvas { width: 100%; height: 160px; display: block; }
+
             .system-status { font-size: 0.9rem; color: #64748b; margin-left: auto; }
         </style>
     </head>
@@ -345,26 +1004,57 @@ def dashboard():
                 <div class="card">
                     <div class="card-label">Active Jobs</div>
                     <div class="card-value"><span id="active_jobs">-</span> <span style="font-size:1rem; color:#94a3b8">/ <span id="max_jobs">-</span></span></div>
-                    <div class="card-sub">Running Workers</div>
+                    <div class="card-sub">Running Workers (target <span id="desired_jobs">-</span>)</div>
                 </div>
                 <div class="card">
                     <div class="card-label">Total Consumed</div>
                     <div class="card-value" id="total_consumed">-</div>
-                    <div class="card-sub">Messages Processed</div>
+                    <div class="card-sub">Rows Processed (<span id="duplicates_skipped">0</span> duplicates skipped)</div>
+                </div>
+                <div class="card">
+                    <div class="card-label">Cold Start</div>
+                    <div class="card-value"><span id="cold_start">-</span>s</div>
+                    <div class="card-sub">To First Message (<span id="cold_start_sub">-</span>)</div>
                 </div>
                 <div class="card">
                     <div class="card-label">System Load</div>
                     <div class="card-value"><span id="cpu_val">-</span>%</div>
-                    <div class="card-sub">Mem: <span id="mem_val">-</span>%</div>
+                    <div class="card-sub">Mem: <span id="mem_val">-</span>% &middot; Tick: <span id="tick_val">-</span>s</div>
                 </div>
             </div>
 
+            <!-- Per-queue breakdown -->
+            <div class="table-container" style="margin-bottom: 30px;">
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Binding</th>
+                            <th>Queue</th>
+                            <th>Ready</th>
+                            <th>Unacked</th>
+                            <th>Jobs</th>
+                            <th>Wanted / Granted</th>
+                            <th>Status</th>
+                        </tr>
+                    </thead>
+                    <tbody id="queue_table_body"></tbody>
+                </table>
+            </div>
+
+            <!-- Chart: recent ticks from /stats/history, extended by the stream -->
+            <div class="card chart-card">
+                <div class="card-label">Recent History</div>
+                <canvas id="chart" height="160"></canvas>
+                <div class="card-sub" id="chart_legend">Waiting for samples...</div>
+            </div>
+
             <!-- Table -->
             <div class="table-container">
                 <table>
                     <thead>
                         <tr>
                             <th>Job Name</th>
+                            <th>Binding</th>
                             <th>Status</th>
                             <th>Start Time</th>
                             <th>Processed</th>
@@ -383,6 +1073,7 @@ def dashboard():
             <div class="modal-content">
                 <div class="modal-header">
                     <h2 style="margin:0; font-size:1.2rem;">Job Logs: <span id="modalJobName">...</span></h2>
+                    <input id="logFilter" placeholder="Event filter, e.g. WORKER_START,WORKER_STOP" style="flex:1; margin:0 15px; padding:4px 8px;" onchange="viewLogs(currentLogJob)">
                     <button class="close-btn" onclick="closeModal()">&times;</button>
                 </div>
                 <div class="log-box" id="logContent">Loading...</div>
@@ -390,73 +1081,171 @@ def dashboard():
         </div>
 
         <script>
-            async function refresh() {
-                try {
-                    const res = await fetch('/stats');
-                    const data = await res.json();
-                    const m = data.metrics;
-                    
-                    // Update Cards
-                    document.getElementById('queue_depth').innerText = m.queue_depth;
-                    document.getElementById('unacked').innerText = m.unacked || 0;
-                    document.getElementById('active_jobs').innerText = m.active_jobs;
-                    document.getElementById('max_jobs').innerText = m.max_jobs;
-                    document.getElementById('total_consumed').innerText = m.total_consumed || 0;
-                    document.getElementById('cpu_val').innerText = m.cpu_percent;
-                    document.getElementById('mem_val').innerText = m.memory_percent;
-                    document.getElementById('system_status').innerText = m.status_msg || "Active";
-
-                    // Update Table
-                    const tbody = document.getElementById('job_table_body');
-                    tbody.innerHTML = data.jobs.map(job => `
-                        <tr>
-                            <td>${job.name}</td>
-                            <td><span class="status-badge status-${job.status}">${job.status}</span></td>
-                            <td>${job.start_time}</td>
-                            <td><strong>${job.processed || 0}</strong></td>
-                            <td><button class="btn" onclick="viewLogs('${job.name}')">View Logs</button></td>
-                        </tr>
-                    `).join('');
+            // Latest /stats state, kept current by snapshot and delta events
+            const state = { metrics: {}, jobs: {} };
 
-                } catch(e) { console.error("Fetch error:", e); }
+            function render() {
+                const m = state.metrics;
+
+                // Update Cards
+                document.getElementById('queue_depth').innerText = m.queue_depth ?? '-';
+                document.getElementById('unacked').innerText = m.unacked || 0;
+                document.getElementById('active_jobs').innerText = m.active_jobs ?? '-';
+                document.getElementById('max_jobs').innerText = m.max_jobs ?? '-';
+                document.getElementById('desired_jobs').innerText = m.desired_jobs ?? m.active_jobs;
+                document.getElementById('total_consumed').innerText = m.total_consumed || 0;
+                document.getElementById('duplicates_skipped').innerText = m.duplicates_skipped || 0;
+                const cs = m.cold_start;
+                document.getElementById('cold_start').innerText = cs ? cs.avg_first_message_s : '-';
+                document.getElementById('cold_start_sub').innerText = cs ? `${cs.mode}, p95 ${cs.p95_first_message_s}s, n=${cs.samples}` : 'no samples';
+                document.getElementById('cpu_val').innerText = m.cpu_percent ?? '-';
+                document.getElementById('mem_val').innerText = m.memory_percent ?? '-';
+                document.getElementById('tick_val').innerText = m.tick_seconds ?? '-';
+                document.getElementById('system_status').innerText = m.status_msg || "Active";
+                addSample(m.sample);
+
+                // Update Tables
+                document.getElementById('queue_table_body').innerHTML = Object.entries(m.queues || {}).map(([name, q]) => `
+                    <tr>
+                        <td>${name}</td>
+                        <td>${q.queue}${q.partitions > 1 ? ` (${q.partitions} shards${q.priority_lane ? ' + priority' : ''})` : (q.priority_lane ? ' (+ priority)' : '')}</td>
+                        <td title="${Object.entries(q.shards || {}).map(([s, n]) => `${s}: ${n}`).join('\\n')}">${q.ready}</td>
+                        <td>${q.unacked}</td>
+                        <td>${q.active_jobs} / ${q.max_jobs} (${q.idle_jobs} idle)</td>
+                        <td>${q.desired_jobs} / ${q.granted_jobs}</td>
+                        <td>${q.status}</td>
+                    </tr>
+                `).join('');
+                const jobs = Object.values(state.jobs).sort((a, b) => b.start_time.localeCompare(a.start_time));
+                const tbody = document.getElementById('job_table_body');
+                tbody.innerHTML = jobs.map(job => `
+                    <tr>
+                        <td>${job.name}</td>
+                        <td>${job.binding || '-'}</td>
+                        <td><span class="status-badge status-${job.status}">${job.status}</span></td>
+                        <td>${job.start_time}</td>
+                        <td><strong>${job.processed || 0}</strong></td>
+                        <td><button class="btn" onclick="viewLogs('${job.name}')">View Logs</button></td>
+                    </tr>
+                `).join('');
             }
 
+            // Each series is scaled to its own maximum, shown in the legend
+            const SERIES = [['queue_depth', '#2563eb', 'Queue'], ['consumed_rate', '#16a34a', 'Consumed msg/s'], ['active_jobs', '#f59e0b', 'Active jobs']];
+            const MAX_SAMPLES = 720;
+            let samples = [];
+
+            function addSample(sample) {
+                if (!sample || (samples.length && sample.t <= samples[samples.length - 1].t)) return;
+                samples.push(sample);
+                if (samples.length > MAX_SAMPLES) samples.shift();
+                drawChart();
+            }
+
+            function drawChart() {
+                const canvas = document.getElementById('chart');
+                canvas.width = canvas.clientWidth;
+                const ctx = canvas.getContext('2d');
+                ctx.clearRect(0, 0, canvas.width, canvas.height);
+                if (samples.length < 2) return;
+                const t0 = samples[0].t;
+                const span = samples[samples.length - 1].t - t0 || 1;
+                const legend = SERIES.map(([key, color, label]) => {
+                    const max = Math.max(1, ...samples.map(s => s[key] || 0));
+                    ctx.strokeStyle = color;
+                    ctx.lineWidth = 2;
+                    ctx.beginPath();
+                    samples.forEach((s, i) => {
+                        const x = (s.t - t0) / span * canvas.width;
+                        const y = canvas.height - 4 - (s[key] || 0) / max * (canvas.height - 8);
+                        if (i) ctx.lineTo(x, y); else ctx.moveTo(x, y);
+                    });
+                    ctx.stroke();
+                    return `<span style="color:${color}">${label} (max ${Math.round(max * 10) / 10})</span>`;
+                });
+                const minutes = Math.round(span / 60);
+                document.getElementById('chart_legend').innerHTML = legend.join(' &middot; ') + ` &middot; last ${minutes} min`;
+            }
+
+            fetch('/stats/history').then(res => res.json()).then(data => {
+                // Keep any samples the stream delivered while this was loading
+                const last = data.samples.length ? data.samples[data.samples.length - 1].t : 0;
+                samples = data.samples.concat(samples.filter(s => s.t > last)).slice(-MAX_SAMPLES);
+                drawChart();
+            }).catch(e => console.error("Failed to load history:", e));
+
+            const stream = new EventSource('/stats/stream');
+            stream.addEventListener('snapshot', e => {
+                const data = JSON.parse(e.data);
+                state.metrics = data.metrics;
+                state.jobs = Object.fromEntries(data.jobs.map(job => [job.name, job]));
+                render();
+            });
+            stream.addEventListener('delta', e => {
+                // Only changed cards and job rows are sent
+                const delta = JSON.parse(e.data);
+                Object.assign(state.metrics, delta.metrics);
+                delta.jobs.forEach(job => { state.jobs[job.name] = job; });
+                delta.removed.forEach(name => { delete state.jobs[name]; });
+                render();
+            });
+            stream.onerror = () => console.error("Stats stream interrupted, reconnecting...");
+
+            let currentLogJob = null;
+            let logAbort = null;
+
             async function viewLogs(jobName) {
                 const modal = document.getElementById('logModal');
                 const content = document.getElementById('logContent');
                 document.getElementById('modalJobName').innerText = jobName;
                 modal.style.display = 'flex';
-                content.innerText = 'Fetching logs...';
-                
+                content.textContent = 'Fetching logs...';
+                currentLogJob = jobName;
+                if (logAbort) logAbort.abort();
+                logAbort = new AbortController();
+
+                // Last 500 lines, then follow; chunks are appended as they arrive
+                const params = new URLSearchParams({ tail_lines: 500, follow: true });
+                const filter = document.getElementById('logFilter').value.trim();
+                if (filter) params.set('event', filter);
                 try {
-                    const res = await fetch(`/logs/${jobName}`);
-                    const text = await res.text();
-                    content.innerText = text;
+                    const res = await fetch(`/logs/${jobName}?${params}`, { signal: logAbort.signal });
+                    const reader = res.body.getReader();
+                    const decoder = new TextDecoder();
+                    content.textContent = '';
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        if (done) break;
+                        const atBottom = content.scrollTop + content.clientHeight >= content.scrollHeight - 5;
+                        content.append(decoder.decode(value, { stream: true }));
+                        if (atBottom) content.scrollTop = content.scrollHeight;
+                    }
                 } catch(e) {
-                    content.innerText = "Failed to load logs.";
+                    if (e.name !== 'AbortError') content.append("Failed to load logs.");
                 }
             }
 
             function closeModal() {
                 document.getElementById('logModal').style.display = 'none';
+                if (logAbort) logAbort.abort();
             }
 
             // Close modal on outside click
             window.onclick = function(event) {
                 const modal = document.getElementById('logModal');
                 if (event.target == modal) {
-                    modal.style.display = "none";
+                    closeModal();
                 }
             }
 
-            setInterval(refresh, 2000);
-            refresh();
         </script>
     </body>
     </html>
     """
 
 if __name__ == "__main__":
+    job_informer.start()
+    pod_informer.start()
     t = threading.Thread(target=scaler_loop, daemon=True)
     t.start()
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,102 @@
+import asyncio
+import collections
+import json
+import threading
+import uuid
+
+
+class SnapshotStore:
+    """The /stats payload, serialized once per scaler tick and shared by all viewers.
+
+    publish() is called by the scaler loop. If anything changed it bumps the
+    version, stores the full JSON body (served with an ETag) and a
+    delta holding only the changed metrics, changed job rows and removed job
+    names. Readers never serialize anything: /stats returns the stored body
+    or a 304, and stream subscribers get the stored deltas. Deltas are kept
+    for the last `history` versions; a subscriber further behind gets the
+    full snapshot again. Versions restart at 0 with the process, so ETags
+    and stream event ids ("<epoch>-<version>") carry a per-process epoch:
+    one from an earlier process never matches.
+    """
+
+    def __init__(self, history=64):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.body = json.dumps({"version": 0, "metrics": {}, "jobs": []})
+        self._metrics = {}
+        self._jobs = {}
+        self._deltas = collections.deque(maxlen=history)  # (version, serialized delta)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._changed = None
+
+    def etag(self, version):
+        """The ETag of the body published as `version` (snapshot() returns the pair)."""
+        return f'"{self.event_id(version)}"'
+
+    def event_id(self, version):
+        return f"{self.epoch}-{version}"
+
+    def parse_event_id(self, event_id):
+        """The version in an event id from this process, else None."""
+        epoch, _, version = (event_id or "").partition("-")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def publish(self, metrics, jobs):
+        # Round-trip through JSON so later in-place updates don't leak into the comparison
+        metrics = json.loads(json.dumps(metrics))
+        jobs = json.loads(json.dumps(jobs))
+        rows = {job["name"]: job for job in jobs}
+        changed_metrics = {k: v for k, v in metrics.items() if k not in self._metrics or self._metrics[k] != v}
+        changed_jobs = [job for name, job in rows.items() if self._jobs.get(name) != job]
+        removed_jobs = [name for name in self._jobs if name not in rows]
+        if not changed_metrics and not changed_jobs and not removed_jobs:
+            return self.version
+
+        with self._lock:
+            version = self.version + 1
+            self.body = json.dumps({"version": version, "metrics": metrics, "jobs": jobs})
+            self._deltas.append((version, json.dumps({
+                "version": version, "metrics": changed_metrics, "jobs": changed_jobs, "removed": removed_jobs,
+            })))
+            self._metrics, self._jobs = metrics, rows
+            self.version = version
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._notify)
+        return version
+
+    def snapshot(self):
+        with self._lock:
+            return self.version, self.body
+
+    def deltas_since(self, version):
+        """Serialized deltas after `version`, or None if they are no longer all kept."""
+        with self._lock:
+            if version == self.version:
+                return []
+            if version > self.version:
+                # Not a version of this store: the caller needs a full snapshot
+                return None
+            if not self._deltas or self._deltas[0][0] > version + 1:
+                return None
+            return [(v, delta) for v, delta in self._deltas if v > version]
+
+    def _notify(self):
+        # Wake every waiter, then start a new round
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, version, timeout):
+        """Wait until there is a version newer than `version`, or `timeout` seconds pass."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._changed = asyncio.Event()
+        changed = self._changed
+        if self.version > version:
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
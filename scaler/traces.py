@@ -0,0 +1,86 @@
+import collections
+import threading
+
+# (stage, from timestamp, to timestamp); all epoch seconds, set by different hosts
+STAGES = [
+    ("publish", "uploaded_at", "enqueued_at"),  # upload accepted -> published to the broker
+    ("queue", "enqueued_at", "delivered_at"),  # waiting in the broker
+    ("prefetch", "delivered_at", "started_at"),  # delivered, waiting for a handler slot
+    ("process", "started_at", "processed_at"),  # in the handler
+    ("report", "processed_at", "reported_at"),  # worker -> scaler progress report
+    ("end_to_end", "uploaded_at", "reported_at"),
+]
+
+
+def percentiles(values):
+    """count, avg and p50/p90/p99/max of durations in seconds, reported in milliseconds."""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 2)
+
+    return {
+        "count": len(values),
+        "avg_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": pct(0.5),
+        "p90_ms": pct(0.9),
+        "p99_ms": pct(0.99),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+class TraceStore:
+    """Stage timestamps of traced messages, for per-stage latency percentiles.
+
+    Workers send one sample per traced message (trace_id, message_id, rows
+    and the timestamps in STAGES); add() stamps reported_at and keeps the
+    last `size` samples in a ring buffer. Timestamps come from the
+    producer, worker and scaler clocks, so stages between hosts are only as
+    accurate as their clock sync.
+    """
+
+    def __init__(self, size=10000):
+        self._traces = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.received = 0
+
+    def add(self, samples, reported_at):
+        """Store samples; returns (stage, seconds) for every stage they cover."""
+        durations = []
+        rows = []
+        for sample in samples:
+            row = dict(sample)
+            row["reported_at"] = reported_at
+            rows.append(row)
+            for stage, start, end in STAGES:
+                if row.get(start) is not None and row.get(end) is not None:
+                    durations.append((stage, row[end] - row[start]))
+        with self._lock:
+            self._traces.extend(rows)
+            self.received += len(rows)
+        return durations
+
+    def since(self, t=0.0):
+        with self._lock:
+            return [row for row in self._traces if row["reported_at"] > t]
+
+    def summary(self, since=0.0):
+        """Percentiles per stage and the traced throughput, over samples reported after `since`."""
+        rows = self.since(since)
+        stages = {
+            stage: percentiles([row[end] - row[start] for row in rows
+                                if row.get(start) is not None and row.get(end) is not None])
+            for stage, start, end in STAGES
+        }
+        started = [row.get("uploaded_at") or row.get("enqueued_at") for row in rows]
+        started = [t for t in started if t is not None]
+        span = max(row["reported_at"] for row in rows) - min(started) if started else 0
+        return {
+            "traces": len(rows),
+            "received": self.received,
+            "traced_messages_per_s": round(len(rows) / span, 2) if span > 0 else None,
+            "traced_rows_per_s": round(sum(row.get("rows", 1) for row in rows) / span, 2) if span > 0 else None,
+            "stages": stages,
+        }
@@ -0,0 +1,46 @@
+import threading
+
+import requests
+
+
+class AssignmentPoller:
+    """Follows the scaler's active/standby assignment for a warm pool worker.
+
+    Polls `url` (the scaler's /pool/assignment/<pod>) every `interval`
+    seconds and calls on_change(active) from the polling thread whenever the
+    answer flips. The polls also tell the scaler this pod is alive and warm.
+    A failed poll keeps the current state rather than stopping a busy worker.
+    """
+
+    def __init__(self, url, on_change, interval=1.0, timeout=2):
+        self.url = url
+        self.on_change = on_change
+        self.interval = interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.active = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="assignment", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        try:
+            res = self.session.get(self.url, timeout=self.timeout)
+            res.raise_for_status()
+            active = bool(res.json().get("active"))
+        except Exception as e:
+            print(f"Failed to poll assignment: {e}")
+            return
+        if active != self.active:
+            self.active = active
+            self.on_change(active)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.interval)
@@ -0,0 +1,110 @@
+import collections
+import hashlib
+import threading
+
+
+class MemoryBackend:
+    """Local stand-in for a shared index: a bounded set, oldest entries dropped first."""
+
+    def __init__(self, size=1_000_000):
+        self.size = size
+        self._keys = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._keys
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            if len(self._keys) > self.size:
+                self._keys.popitem(last=False)
+
+
+class RedisBackend:
+    """Index shared by all workers: one Redis key per processed message, expiring after `ttl`."""
+
+    def __init__(self, url, prefix="kube-job:done:", ttl=24 * 3600):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("DEDUP_BACKEND=redis needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def contains(self, key):
+        return bool(self.client.exists(self.prefix + key.hex()))
+
+    def add(self, key):
+        self.client.set(self.prefix + key.hex(), 1, ex=self.ttl)
+
+
+class DedupIndex:
+    """Messages this worker (or, with a shared backend, any worker) already processed.
+
+    A message is identified by its message_id (upload id and row offset,
+    set by the producer) and content_hash header; messages without them
+    are never treated as duplicates. Keys are kept as 16-byte digests in an
+    in-process LRU of `size` entries, checked before the optional backend.
+    A backend error only costs the dedup check, never the message. Only
+    the connection thread uses it (on_message and on_complete), so the LRU
+    needs no lock and works with either handler pool.
+    """
+
+    def __init__(self, backend=None, size=100_000):
+        self.backend = backend
+        self.size = size
+        self.duplicates = 0
+        self.backend_errors = 0
+        self._recent = collections.OrderedDict()
+
+    @staticmethod
+    def key(properties):
+        message_id = getattr(properties, "message_id", None)
+        content_hash = (getattr(properties, "headers", None) or {}).get("content_hash")
+        if not message_id or not content_hash:
+            return None
+        return hashlib.blake2b(f"{message_id}:{content_hash}".encode(), digest_size=16).digest()
+
+    def seen(self, key):
+        if key is None:
+            return False
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return True
+        if self.backend is not None:
+            try:
+                if self.backend.contains(key):
+                    self._remember(key)
+                    return True
+            except Exception as e:
+                self.backend_errors += 1
+                print(f"Dedup backend check failed: {e}")
+        return False
+
+    def add(self, key):
+        if key is None:
+            return
+        self._remember(key)
+        if self.backend is not None:
+            try:
+                self.backend.add(key)
+            except Exception as e:
+                self.backend_errors += 1
+                print(f"Dedup backend update failed: {e}")
+
+    def _remember(self, key):
+        self._recent[key] = None
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.size:
+            self._recent.popitem(last=False)
+
+
+def make_backend(name, url=None, size=1_000_000):
+    if name == "redis":
+        return RedisBackend(url)
+    if name == "memory":
+        return MemoryBackend(size)
+    return None
@@ -0,0 +1,99 @@
+import collections
+import concurrent.futures
+import functools
+import queue
+import threading
+
+
+class ConsumerEngine:
+    """Runs deliveries concurrently on a bounded pool and acks them safely.
+
+    on_message runs on the pika connection thread and submits
+    handler(body, properties, delivery_tag) to a thread or process pool. Each
+    completion is handed back to the connection thread with
+    add_callback_threadsafe; completions are drained in bulk and acked with a
+    single multiple=True ack covering the longest prefix of finished
+    deliveries, so a slow message never has a later one acked "over" it.
+    Failed deliveries are nacked and requeued individually.
+
+    on_complete(result) is called on the connection thread for every
+    successful delivery, before it is acked. skip() acks a delivery that
+    needs no processing (a duplicate) without breaking that order.
+    """
+
+    def __init__(self, connection, channel, handler, concurrency=1, pool="thread", on_complete=None):
+        self.connection = connection
+        self.channel = channel
+        self.handler = handler
+        self.on_complete = on_complete
+        if pool == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=concurrency)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="handler")
+        self.acked = 0
+        self.nacked = 0
+        self.ack_frames = 0
+        self._outstanding = collections.deque()  # delivery tags in delivery order
+        self._finished = {}  # delivery tag -> True if it succeeded, False if nacked
+        self._completed = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._drain_scheduled = False
+
+    def in_flight(self):
+        return len(self._outstanding)
+
+    def on_message(self, ch, method, properties, body):
+        tag = method.delivery_tag
+        self._outstanding.append(tag)
+        future = self.executor.submit(self.handler, body, properties, tag)
+        future.add_done_callback(functools.partial(self._on_done, tag))
+
+    def skip(self, method):
+        """Ack a delivery without running the handler, in order with the others."""
+        self._outstanding.append(method.delivery_tag)
+        self._finished[method.delivery_tag] = True
+        self._drain()
+
+    def _on_done(self, tag, future):
+        # Runs on a pool thread: only hand the result over to the connection thread
+        self._completed.put((tag, future))
+        with self._lock:
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        self.connection.add_callback_threadsafe(self._drain)
+
+    def _drain(self):
+        with self._lock:
+            self._drain_scheduled = False
+
+        while True:
+            try:
+                tag, future = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            error = future.exception()
+            if error is not None:
+                print(f"Delivery {tag} failed, requeueing: {error}")
+                self.channel.basic_nack(delivery_tag=tag, requeue=True)
+                self.nacked += 1
+            elif self.on_complete:
+                self.on_complete(future.result())
+            self._finished[tag] = error is None
+
+        ack_tag = None
+        count = 0
+        while self._outstanding and self._outstanding[0] in self._finished:
+            tag = self._outstanding.popleft()
+            if self._finished.pop(tag):
+                count += 1
+                ack_tag = tag
+        if ack_tag is not None:
+            # Tags below ack_tag are either finished here or were nacked already
+            self.channel.basic_ack(delivery_tag=ack_tag, multiple=True)
+            self.acked += count
+            self.ack_frames += 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self._drain()
@@ -0,0 +1,27 @@
+import struct
+import zlib
+
+# Batch envelope written by producer/envelope.py: the body is a sequence of
+# rows, each a 4-byte big-endian length followed by the UTF-8 row text,
+# optionally deflate-compressed as a whole.
+BATCH_CONTENT_TYPE = "application/x-kube-job-batch"
+DEFLATE = "deflate"
+
+_LENGTH = struct.Struct(">I")
+
+
+def decode_rows(body, properties):
+    """Return the row strings carried by a message (one for legacy messages)."""
+    if properties is None or properties.content_type != BATCH_CONTENT_TYPE:
+        return [body.decode()]
+    if properties.content_encoding == DEFLATE:
+        body = zlib.decompress(body)
+    rows = []
+    view = memoryview(body)
+    pos = 0
+    while pos < len(view):
+        (length,) = _LENGTH.unpack_from(view, pos)
+        pos += _LENGTH.size
+        rows.append(bytes(view[pos:pos + length]).decode("utf-8"))
+        pos += length
+    return rows
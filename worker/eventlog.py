@@ -0,0 +1,150 @@
+import datetime
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+DEBUG = LEVELS["DEBUG"]
+INFO = LEVELS["INFO"]
+
+
+class EventLog:
+    """Structured JSON event log with a background writer thread.
+
+    log() only filters, timestamps and enqueues; the writer thread formats
+    events and writes them in batches to stdout and to this worker's own
+    file, rotating it by size. DEBUG events (per-message START/END) can be
+    sampled with sample_rate or dropped entirely by raising the level.
+    Forked pool processes have no writer thread and write synchronously.
+    """
+
+    def __init__(self, path, worker_id, level="DEBUG", sample_rate=1.0, max_bytes=10 * 1024 * 1024,
+                 backups=3, flush_interval=0.5, batch=512, queue_size=10000):
+        self.path = path
+        self.worker_id = worker_id
+        self.level = LEVELS.get(level.upper(), DEBUG)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch = batch
+        self.events = 0
+        self.filtered = 0
+        self.dropped = 0
+        self.written = 0
+        self.write_calls = 0
+        self.overhead = 0.0  # seconds spent inside log() by callers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pid = os.getpid()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="eventlog", daemon=True)
+        self._thread.start()
+
+    def log(self, event_type, details, level=INFO):
+        start = time.perf_counter()
+        if level < self.level or (level <= DEBUG and self.sample_rate < 1 and random.random() >= self.sample_rate):
+            self.filtered += 1
+            return
+        entry = (datetime.datetime.now(), event_type, details)
+        if os.getpid() != self._pid:
+            self._write([entry])
+        else:
+            try:
+                # A full queue applies backpressure; only a stuck writer drops events
+                self._queue.put(entry, timeout=1)
+            except queue.Full:
+                self.dropped += 1
+        self.events += 1
+        self.overhead += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            "events": self.events,
+            "filtered": self.filtered,
+            "dropped": self.dropped,
+            "written": self.written,
+            "write_calls": self.write_calls,
+            "avg_overhead_us": round(self.overhead / self.events * 1e6, 2) if self.events else 0,
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            entries = []
+            stop = entry is None
+            if not stop:
+                entries.append(entry)
+            while len(entries) < self.batch and not stop:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    entries.append(entry)
+            if entries:
+                self._write(entries)
+            if stop:
+                if self._file:
+                    self._file.close()
+                return
+
+    def _format(self, entry):
+        timestamp, event_type, details = entry
+        return json.dumps({
+            "timestamp": timestamp.isoformat(),
+            "worker_id": self.worker_id,
+            "event": event_type,
+            "details": details
+        })
+
+    def _write(self, entries):
+        block = "\n".join(self._format(e) for e in entries) + "\n"
+        sys.stdout.write(block)
+        sys.stdout.flush()
+        self.written += len(entries)
+        self.write_calls += 1
+        try:
+            if os.getpid() != self._pid:
+                with open(self.path, "a") as f:
+                    f.write(block)
+                return
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(block)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            print(f"Failed to write to log file: {e}")
+            # Reopened on the next write; don't leak the old descriptor
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except Exception:
+                    pass
+            self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
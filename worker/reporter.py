@@ -0,0 +1,128 @@
+import collections
+import threading
+
+import requests
+
+
+class ProgressReporter:
+    """Aggregates processed counts in memory and ships them in bulk.
+
+    Counts are flushed to the scaler's /report/bulk endpoint every
+    `interval` seconds, or as soon as `batch` rows are pending, over one
+    keep-alive session. Failed flushes put the counts back so they are
+    retried with the next one; close() performs a final flush.
+
+    timing() attaches one-off timestamps (startup, first message) to the
+    next flush, which is sent right away.
+
+    If in_flight is set (a callable returning {job_name: deliveries being
+    processed}), every flush also carries those counts, and busy jobs are
+    reported even with nothing finished, so the scaler can tell a worker
+    stuck on a long message from an idle one.
+
+    duplicate() counts redelivered messages that were skipped; they go out
+    with the next flush as `duplicates`.
+
+    trace() queues one traced message's stage timestamps for the next
+    flush's `traces`; at most `max_traces` are held, later ones are dropped
+    and counted in traces_dropped.
+    """
+
+    def __init__(self, url, interval=2.0, batch=100, timeout=2, max_traces=1000):
+        self.url = url
+        self.interval = interval
+        self.batch = batch
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.max_traces = max_traces
+        self.flushes = 0
+        self.failures = 0
+        self.traces_dropped = 0
+        self._pending = collections.Counter()
+        self._messages = collections.Counter()
+        self._duplicates = collections.Counter()
+        self._timings = collections.defaultdict(dict)
+        self._traces = []
+        self.in_flight = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="reporter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def add(self, job_name, processed=1, messages=1):
+        with self._lock:
+            self._pending[job_name] += processed
+            self._messages[job_name] += messages
+            full = sum(self._pending.values()) >= self.batch
+        if full:
+            self._wake.set()
+
+    def duplicate(self, job_name, count=1):
+        with self._lock:
+            self._duplicates[job_name] += count
+
+    def trace(self, sample):
+        with self._lock:
+            if len(self._traces) < self.max_traces:
+                self._traces.append(sample)
+            else:
+                self.traces_dropped += 1
+
+    def timing(self, job_name, name, value):
+        with self._lock:
+            self._timings[job_name][name] = value
+        self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, collections.Counter()
+            messages, self._messages = self._messages, collections.Counter()
+            duplicates, self._duplicates = self._duplicates, collections.Counter()
+            timings, self._timings = self._timings, collections.defaultdict(dict)
+            traces, self._traces = self._traces, []
+        busy = self.in_flight() if self.in_flight else {}
+        names = set(pending) | set(duplicates) | set(timings) | {name for name, n in busy.items() if n}
+        if not names and not traces:
+            return
+        reports = []
+        for name in names:
+            report = {"job_name": name, "processed": pending[name], "messages": messages[name]}
+            if duplicates[name]:
+                report["duplicates"] = duplicates[name]
+            if self.in_flight:
+                report["in_flight"] = busy.get(name, 0)
+            if name in timings:
+                report["timings"] = timings[name]
+            reports.append(report)
+        payload = {"reports": reports}
+        if traces:
+            payload["traces"] = traces
+        try:
+            self.session.post(self.url, json=payload, timeout=self.timeout).raise_for_status()
+            self.flushes += 1
+        except Exception as e:
+            print(f"Failed to report progress: {e}")
+            self.failures += 1
+            with self._lock:
+                self._pending.update(pending)
+                self._messages.update(messages)
+                self._duplicates.update(duplicates)
+                for name, values in timings.items():
+                    self._timings[name] = {**values, **self._timings[name]}
+                self._traces = (traces + self._traces)[:self.max_traces]
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.timeout + 1)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
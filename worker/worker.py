@@ -1,54 +1,161 @@
 import pika
+import random
 import time
 import os
-import json
 import socket
-import datetime
+import signal
 import sys
+import threading
 
-import requests
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from envelope import decode_rows
+from engine import ConsumerEngine
+from assignment import AssignmentPoller
+from dedup import DedupIndex, make_backend
+from reporter import ProgressReporter
+from eventlog import DEBUG, INFO, EventLog
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 SCALER_URL = os.getenv("SCALER_URL", "http://scaler:8000/report")
-QUEUE_NAME = "task_queue"
-LOG_FILE = "/logs/worker.log"
-
-def log_event(event_type, details):
-    entry = {
-        "timestamp": datetime.datetime.now().isoformat(),
-        "worker_id": socket.gethostname(),
-        "event": event_type,
-        "details": details
-    }
-    log_line = json.dumps(entry)
-    print(log_line)
-    try:
-        with open(LOG_FILE, "a") as f:
-            f.write(log_line + "\n")
-    except Exception as e:
-        print(f"Failed to write to log file: {e}")
+SCALER_BULK_URL = os.getenv("SCALER_BULK_URL", f"{SCALER_URL}/bulk")
+JOB_NAME = os.getenv("JOB_NAME", socket.gethostname())
+# Progress is aggregated and flushed every REPORT_INTERVAL seconds or REPORT_BATCH rows
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", 2))
+REPORT_BATCH = int(os.getenv("REPORT_BATCH", 100))
+QUEUE_NAME = os.getenv("QUEUE_NAME", "task_queue")  # set per binding by the scaler
+# A partitioned queue is consumed from its shards <queue>.<i>: the ones listed in
+# SHARDS (set per job by the scaler), or all of them; plus <queue>.priority if enabled
+QUEUE_PARTITIONS = int(os.getenv("QUEUE_PARTITIONS", 1))
+SHARDS = os.getenv("SHARDS", "")
+PRIORITY_LANE = os.getenv("PRIORITY_LANE", "false").lower() == "true"
+# One file per worker, rotated by size; DEBUG covers the per-message START/END events
+LOG_FILE = os.getenv("LOG_FILE", f"/logs/{socket.gethostname()}.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+PROCESSING_TIME = float(os.getenv("PROCESSING_TIME", 2))  # simulated seconds per row
+# Deliveries processed at once; "thread" suits I/O-bound handlers, "process" CPU-bound ones
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 1))
+WORKER_POOL = os.getenv("WORKER_POOL", "thread")
+PREFETCH = int(os.getenv("PREFETCH", WORKER_CONCURRENCY))
+# "job": consume from startup until deleted; "pool": stay connected and consume
+# only while the scaler marks this pod active (see scaler/pool.py)
+WORKER_MODE = os.getenv("WORKER_MODE", "job")
+POOL_ASSIGNMENT_URL = os.getenv(
+    "POOL_ASSIGNMENT_URL", f"{SCALER_URL.rsplit('/report', 1)[0]}/pool/assignment/{JOB_NAME}"
+)
+STARTED_AT = time.time()
+# On SIGTERM, seconds to finish in-flight deliveries before exiting (the rest are redelivered)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 60))
+# Redelivered messages already processed are acked without running again. The
+# in-process LRU can be backed by a shared index: "redis" (DEDUP_URL) or "memory" (local stand-in)
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", 100000))
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "")
+DEDUP_URL = os.getenv("DEDUP_URL", "redis://redis:6379/0")
+# Share of messages carrying an x-trace-id header whose stage timestamps go to the scaler,
+# and how many of those a report may carry
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", 1000))
+# Prometheus metrics are served on this port; 0 disables the endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
 
-def report_progress():
-    try:
-        job_name = os.getenv("JOB_NAME", socket.gethostname())
-        payload = {"job_name": job_name, "processed": 1}
-        requests.post(SCALER_URL, json=payload, timeout=1)
-    except Exception as e:
-        print(f"Failed to report progress: {e}")
-
-def callback(ch, method, properties, body):
-    msg = body.decode()
-    log_event("START_PROCESSING", {"message": msg, "delivery_tag": method.delivery_tag})
+PROCESSING_SECONDS = Histogram(
+    "worker_message_processing_seconds", "Time to process one message, all of its rows",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+MESSAGES_PROCESSED = Counter("worker_messages_processed", "Messages processed and acked")
+ROWS_PROCESSED = Counter("worker_rows_processed", "CSV rows processed")
+IN_FLIGHT = Gauge("worker_in_flight_messages", "Deliveries being processed")
+DUPLICATES = Counter("worker_duplicates_skipped", "Redelivered messages acked without processing")
+
+event_log = EventLog(
+    LOG_FILE,
+    socket.gethostname(),
+    level=LOG_LEVEL,
+    sample_rate=LOG_SAMPLE_RATE,
+    max_bytes=LOG_MAX_BYTES,
+)
+
+def log_event(event_type, details, level=INFO):
+    event_log.log(event_type, details, level)
+
+reporter = ProgressReporter(SCALER_BULK_URL, interval=REPORT_INTERVAL, batch=REPORT_BATCH, max_traces=TRACE_BUFFER)
+dedup = DedupIndex(make_backend(DEDUP_BACKEND, DEDUP_URL), size=DEDUP_CACHE_SIZE)
+
+def report_progress(result):
+    # Called on the connection thread, so the metrics stay in this process with WORKER_POOL=process
+    rows, seconds, key, trace = result
+    dedup.add(key)
+    if trace:
+        reporter.trace(trace)
+    PROCESSING_SECONDS.observe(seconds)
+    MESSAGES_PROCESSED.inc()
+    ROWS_PROCESSED.inc(rows)
+    reporter.add(JOB_NAME, rows)
+
+def process_rows(rows):
+    for row in rows:
+        # Simulating processing time
+        time.sleep(PROCESSING_TIME)
+
+def callback(body, properties, delivery_tag):
+    # Runs on the engine's pool; the engine acks on the connection thread
+    # A message is either a single CSV row or a batch envelope of many rows
+    started = time.perf_counter()
+    started_at = time.time()
+    rows = decode_rows(body, properties)
+    details = {"message": rows[0], "rows": len(rows), "delivery_tag": delivery_tag}
+    log_event("START_PROCESSING", details, DEBUG)
     
-    # Simulating processing time
-    time.sleep(2)
+    process_rows(rows)
     
-    log_event("END_PROCESSING", {"message": msg, "delivery_tag": method.delivery_tag})
-    report_progress()
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+    log_event("END_PROCESSING", details, DEBUG)
+    return len(rows), time.perf_counter() - started, DedupIndex.key(properties), trace_sample(properties, len(rows), started_at)
+
+def trace_sample(properties, rows, started_at):
+    """Stage timestamps of a traced message (one marked x-delivered-at by on_message), else None.
+
+    Header timestamps are int epoch milliseconds; the sample is in epoch seconds.
+    """
+    headers = properties.headers or {}
+
+    def seconds(name):
+        value = headers.get(name)
+        return int(value) / 1000 if value is not None else None
+
+    if "x-delivered-at" not in headers:
+        return None
+    return {
+        "trace_id": headers["x-trace-id"],
+        "message_id": properties.message_id,
+        "rows": rows,
+        "uploaded_at": seconds("x-uploaded-at"),
+        "enqueued_at": seconds("x-enqueued-at"),
+        "delivered_at": seconds("x-delivered-at"),
+        "started_at": started_at,
+        "processed_at": time.time(),
+    }
+
+def consumed_queues():
+    """Queues this worker consumes, the priority lane first."""
+    if QUEUE_PARTITIONS > 1:
+        shards = [int(i) for i in SHARDS.split(",") if i] or range(QUEUE_PARTITIONS)
+        queues = [f"{QUEUE_NAME}.{i}" for i in shards]
+    else:
+        queues = [QUEUE_NAME]
+    return ([f"{QUEUE_NAME}.priority"] if PRIORITY_LANE else []) + queues
+
+def shutdown(signum, frame):
+    # Before connecting there is nothing to drain
+    sys.exit(0)
 
 def main():
     log_event("WORKER_START", {})
+    reporter.start()
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    signal.signal(signal.SIGTERM, shutdown)
     # Add a retry mechanism for startup race conditions
     for i in range(10):
         try:
@@ -58,14 +165,120 @@ def main():
             print(f"Waiting for RabbitMQ... {e}")
             time.sleep(5)
     
+    queues = consumed_queues()
     channel = connection.channel()
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
+    for queue in queues:
+        channel.queue_declare(queue=queue, durable=True)
+    # One prefetch budget for the whole channel, however many queues it consumes
+    channel.basic_qos(prefetch_count=max(PREFETCH, WORKER_CONCURRENCY), global_qos=True)
+    engine = ConsumerEngine(
+        connection,
+        channel,
+        callback,
+        concurrency=WORKER_CONCURRENCY,
+        pool=WORKER_POOL,
+        on_complete=report_progress,
+    )
+    # Lets the scaler tell a worker busy with a long message from an idle one
+    reporter.in_flight = lambda: {JOB_NAME: engine.in_flight()}
+    IN_FLIGHT.set_function(engine.in_flight)
+    # Cold-start timings go to the scaler with the next progress report
+    reporter.timing(JOB_NAME, "started_at", STARTED_AT)
+    reporter.timing(JOB_NAME, "ready_at", time.time())
+    consumer = {"tags": [], "first": True}
+
+    def on_message(ch, method, properties, body):
+        if consumer["first"]:
+            consumer["first"] = False
+            reporter.timing(JOB_NAME, "first_message_at", time.time())
+        if dedup.seen(DedupIndex.key(properties)):
+            # Processed before (e.g. by a worker deleted before its ack): ack, don't redo it
+            dedup.duplicates += 1
+            DUPLICATES.inc()
+            reporter.duplicate(JOB_NAME)
+            log_event("DUPLICATE_SKIPPED", {"message_id": properties.message_id, "redelivered": method.redelivered}, DEBUG)
+            engine.skip(method)
+            return
+        headers = properties.headers or {}
+        if "x-trace-id" in headers and random.random() < TRACE_SAMPLE_RATE:
+            # Travels with the message to the handler, which may be in another process
+            properties.headers = {**headers, "x-delivered-at": int(time.time() * 1000)}
+        engine.on_message(ch, method, properties, body)
+
+    def consume():
+        # The priority lane's consumer outranks the shard consumers, so freed prefetch
+        # slots go to waiting priority messages instead of taking turns with the shards
+        consumer["tags"] = [
+            channel.basic_consume(
+                queue=queue, on_message_callback=on_message,
+                arguments={"x-priority": 10} if queue == f"{QUEUE_NAME}.priority" else None,
+            )
+            for queue in queues
+        ]
+
+    draining = threading.Event()
+    poller = None
 
-    log_event("WORKER_READY", {"queue": QUEUE_NAME})
+    def set_active(active):
+        # Runs on the connection thread
+        if active and not consumer["tags"] and not draining.is_set():
+            consumer["first"] = True
+            consume()
+            reporter.timing(JOB_NAME, "activated_at", time.time())
+            log_event("WORKER_ACTIVATED", {})
+        elif not active and consumer["tags"]:
+            # Prefetched but undelivered messages are requeued by the cancel
+            for tag in consumer["tags"]:
+                channel.basic_cancel(tag)
+            consumer["tags"] = []
+            log_event("WORKER_STANDBY", {"in_flight": engine.in_flight()})
+
+    def begin_drain():
+        # Runs on the connection thread: stop taking deliveries; the loop below
+        # then waits for the in-flight ones to finish and be acked
+        if poller:
+            poller.stop()
+        set_active(False)
+        draining.set()
+        log_event("WORKER_DRAIN", {"in_flight": engine.in_flight()})
+
+    def drain_on_sigterm(signum, frame):
+        connection.add_callback_threadsafe(begin_drain)
+
+    signal.signal(signal.SIGTERM, drain_on_sigterm)
+
+    if WORKER_MODE == "pool":
+        poller = AssignmentPoller(
+            POOL_ASSIGNMENT_URL,
+            lambda active: connection.add_callback_threadsafe(lambda: set_active(active)),
+        )
+        poller.start()
+    else:
+        consume()
+
+    log_event("WORKER_READY", {
+        "queue": QUEUE_NAME, "queues": queues, "concurrency": WORKER_CONCURRENCY, "pool": WORKER_POOL, "mode": WORKER_MODE,
+    })
     print(' [*] Waiting for messages. To exit press CTRL+C')
-    channel.start_consuming()
+    try:
+        if poller:
+            # start_consuming() returns once no consumer is registered, i.e. in standby
+            while not draining.is_set():
+                connection.process_data_events(time_limit=1)
+        else:
+            # Returns when begin_drain() cancels the consumers
+            channel.start_consuming()
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while engine.in_flight() and time.monotonic() < deadline:
+            connection.process_data_events(time_limit=0.5)
+        log_event("WORKER_DRAINED", {"in_flight": engine.in_flight(), "acked": engine.acked, "duplicates": dedup.duplicates})
+        connection.close()
+    finally:
+        if poller:
+            poller.stop()
+        reporter.close()
+        log_event("WORKER_STOP", {"log": event_log.stats()})
+        event_log.close()
 
 if __name__ == "__main__":
     main()